@@ -9,7 +9,27 @@ import sqlite3
 import sys
 from googletrans import Translator
 from itertools import zip_longest
-from PIL import ImageTk
+from collections import OrderedDict, deque, Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import queue
+import heapq
+import itertools
+import time
+import hashlib
+import io
+import mmap
+import struct
+import zlib
+import select
+import ctypes
+import ctypes.util
+import math
+import re
+import functools
+import cProfile
+import pstats
+import urllib.request
+from PIL import ImageTk, features
 
 # --- 유틸리티 함수 및 상수 정의 ---
 def setup_directories():
@@ -20,8 +40,115 @@ DB_FILE = "gallery.db"
 CACHE_DIR = ".cache"
 THUMBNAIL_DIR = os.path.join(CACHE_DIR, "thumbnails")
 CUSTOM_TRANSLATIONS_FILE = "custom_translations.json"
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+THUMBNAIL_IMAGE_CACHE_SIZE = 300
+THUMBNAIL_MAX_SIZE = 512
+THUMBNAIL_SEGMENT_SIZE = 64 * 1024 * 1024
+
+# --- 계측 (지표 창에서 켜고 끈다) ---
+class _NullSpan:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+    def add_bytes(self, n): pass
+
+class _Span:
+    __slots__ = ("metrics", "name", "start", "nbytes")
+    def __init__(self, metrics, name): self.metrics, self.name, self.nbytes = metrics, name, 0
+    def __enter__(self): self.start = time.perf_counter(); return self
+    def __exit__(self, *exc): self.metrics.record(self.name, self.start, self.nbytes); return False
+    def add_bytes(self, n): self.nbytes += n
+
+class Metrics:
+    # 이름별 호출 수, 누적/최대 시간, 2의 거듭제곱 µs 버킷 지연 히스토그램, 처리 바이트를 모은다.
+    # 꺼져 있을 때 timed() 래퍼는 플래그 하나만 확인하고, span() 은 공용 no-op 객체를 돌려준다.
+    # tracing 이 켜져 있으면 각 구간을 Chrome trace("X" 이벤트)로도 남긴다. 프로세스 풀 안의 작업(썸네일 렌더링, 대량 파싱)은 부모에서 본 왕복 시간만 잡힌다.
+    NULL_SPAN = _NullSpan()
+    def __init__(self, trace_limit=200000):
+        self.enabled, self.tracing, self.profiler = False, False, None
+        self.lock, self.origin = threading.Lock(), time.perf_counter()
+        self.stats, self.trace = {}, deque(maxlen=trace_limit)
+    def record(self, name, start, nbytes=0):
+        end = time.perf_counter(); elapsed = end - start
+        with self.lock:
+            stat = self.stats.get(name)
+            if stat is None: stat = self.stats[name] = {"count": 0, "total": 0.0, "max": 0.0, "bytes": 0, "buckets": [0] * 40}
+            stat["count"] += 1; stat["total"] += elapsed; stat["bytes"] += nbytes
+            if elapsed > stat["max"]: stat["max"] = elapsed
+            stat["buckets"][min(39, int(elapsed * 1e6).bit_length())] += 1
+            if self.tracing: self.trace.append((name, start, elapsed, threading.get_ident(), nbytes))
+    def add_bytes(self, name, nbytes):
+        with self.lock:
+            stat = self.stats.get(name)
+            if stat is None: stat = self.stats[name] = {"count": 0, "total": 0.0, "max": 0.0, "bytes": 0, "buckets": [0] * 40}
+            stat["bytes"] += nbytes
+    def span(self, name): return _Span(self, name) if self.enabled else self.NULL_SPAN
+    def timed(self, name):
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled: return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try: return fn(*args, **kwargs)
+                finally: self.record(name, start)
+            return wrapper
+        return decorate
+    def reset(self):
+        with self.lock: self.stats.clear(); self.trace.clear(); self.origin = time.perf_counter()
+    @staticmethod
+    def _percentile(buckets, count, q):
+        # 버킷 상한(µs)으로 근사한 백분위수.
+        target, seen = q * count, 0
+        for i, n in enumerate(buckets):
+            seen += n
+            if seen >= target: return (1 << i) / 1000
+        return float("inf")
+    def snapshot(self):
+        with self.lock: stats = {name: dict(stat, buckets=list(stat["buckets"])) for name, stat in self.stats.items()}
+        rows = [{"name": name, "count": s["count"], "total_ms": s["total"] * 1000, "mean_ms": s["total"] * 1000 / s["count"], "max_ms": s["max"] * 1000,
+                 "p50_ms": self._percentile(s["buckets"], s["count"], 0.5), "p95_ms": self._percentile(s["buckets"], s["count"], 0.95),
+                 "p99_ms": self._percentile(s["buckets"], s["count"], 0.99), "bytes": s["bytes"], "histogram_us": {1 << i: n for i, n in enumerate(s["buckets"]) if n}}
+                for name, s in stats.items()]
+        return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+    def export_json(self, path):
+        with open(path, 'w', encoding='utf-8') as f: json.dump({"exported": time.strftime("%Y-%m-%dT%H:%M:%S"), "metrics": self.snapshot()}, f, indent=2)
+    def export_chrome_trace(self, path):
+        # chrome://tracing 또는 Perfetto 에서 열 수 있는 Trace Event 형식.
+        with self.lock: events = list(self.trace)
+        trace = [{"name": name, "ph": "X", "ts": (start - self.origin) * 1e6, "dur": elapsed * 1e6, "pid": os.getpid(), "tid": tid, **({"args": {"bytes": nbytes}} if nbytes else {})}
+                 for name, start, elapsed, tid, nbytes in events]
+        with open(path, 'w', encoding='utf-8') as f: json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+    def start_profile(self):
+        if self.profiler is None: self.profiler = cProfile.Profile(); self.profiler.enable()
+    def stop_profile(self, path=None):
+        # cProfile 은 켠 스레드(UI 스레드)만 잰다. path 가 있으면 pstats 파일(snakeviz 등으로 열 수 있음)로 저장하고, 누적 시간 상위 30개 요약 문자열을 돌려준다.
+        if self.profiler is None: return ""
+        self.profiler.disable(); profiler, self.profiler = self.profiler, None
+        if path: profiler.dump_stats(path)
+        out = io.StringIO(); pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(30)
+        return out.getvalue()
+
+METRICS = Metrics()
+
+def scan_image_files(root, recursive=True):
+    # os.scandir 의 DirEntry 가 가진 stat 정보를 그대로 사용해 (경로, 크기, mtime, inode) 를 반환한다.
+    entries, stack = [], [root]
+    while stack:
+        try: it = os.scandir(stack.pop())
+        except OSError as e: print(f"Error scanning {e.filename}: {e}"); continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and not entry.name.startswith('.'): stack.append(entry.path)
+                    elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                        st = entry.stat()
+                        entries.append((entry.path, st.st_size, st.st_mtime, st.st_ino or None))
+                except OSError: continue
+    return entries
 
 # --- 공용 메타데이터 파싱 함수 ---
+@METRICS.timed("metadata.parse")
 def parse_image_metadata(image_info):
     parsed_data = {'prompt': '', 'negative_prompt': '', 'others': ''}
     if "parameters" in image_info:
@@ -36,57 +163,808 @@ def parse_image_metadata(image_info):
         try:
             prompt_json = json.loads(image_info.get('prompt', '{}'))
             if not prompt_json: return parsed_data
-            sampler_nodes = [n for n in prompt_json.values() if 'KSampler' in n.get('class_type', '')]
+            graph = ComfyGraph(prompt_json)
+            sampler_nodes = graph.nodes_of('KSampler')
             if not sampler_nodes: return parsed_data
-            final_sampler_node_data = sampler_nodes[-1]
-            parsed_data['prompt'] = trace_comfy_prompt(prompt_json, final_sampler_node_data['inputs']['positive'][0])
-            parsed_data['negative_prompt'] = trace_comfy_prompt(prompt_json, final_sampler_node_data['inputs']['negative'][0])
-            other_info, sampler_inputs = [], final_sampler_node_data['inputs']
+            sampler_inputs = graph.node(sampler_nodes[-1])[1]
+            # positive/negative 는 같은 메모를 공유하므로 둘이 함께 쓰는 인코더/조건 노드는 한 번만 푼다.
+            parsed_data['prompt'] = graph.prompt(sampler_inputs['positive'][0])
+            parsed_data['negative_prompt'] = graph.prompt(sampler_inputs['negative'][0])
+            other_info = []
             other_info.extend([f"Seed: {sampler_inputs.get('seed')}", f"Steps: {sampler_inputs.get('steps')}", f"CFG: {sampler_inputs.get('cfg')}", f"Sampler: {sampler_inputs.get('sampler_name')}", f"Scheduler: {sampler_inputs.get('scheduler')}", f"Denoise: {sampler_inputs.get('denoise')}"])
             if 'model' in sampler_inputs:
-                model_name = trace_comfy_input(prompt_json, sampler_inputs['model'][0], "CheckpointLoaderSimple", "ckpt_name")
+                model_name = graph.find_input(sampler_inputs['model'][0], "CheckpointLoaderSimple", "ckpt_name")
                 if model_name: other_info.append(f"Model: {model_name}")
+            latent = graph.find_node(sampler_inputs['latent_image'][0], "EmptyLatentImage") if isinstance(sampler_inputs.get('latent_image'), list) else None
+            if latent and latent[1].get('width') and latent[1].get('height'): other_info.append(f"Size: {latent[1]['width']}x{latent[1]['height']}")
+            loras = sorted({str(n['inputs']['lora_name']) for n in prompt_json.values() if 'LoraLoader' in n.get('class_type', '') and n.get('inputs', {}).get('lora_name')})
+            if loras: other_info.append(f'Loras: "{", ".join(loras)}"')
             parsed_data['others'] = "\n".join(info for info in other_info if info)
         except (json.JSONDecodeError, TypeError, KeyError): pass
     return parsed_data
 
-def trace_comfy_prompt(prompt_json, start_node_id_str):
-    start_node_id = str(start_node_id_str)
-    if start_node_id not in prompt_json: return ""
-    node_data = prompt_json[start_node_id]; class_type, inputs = node_data.get('class_type', ''), node_data.get('inputs', {})
-    if 'CLIPTextEncode' in class_type: return trace_comfy_prompt(prompt_json, inputs['text'][0]) if isinstance(inputs.get('text'), list) else inputs.get('text', '')
-    elif 'PromptSwitchHub' in class_type:
-        prompts = []
-        for i in range(1, 8):
-            if inputs.get(f'enabled_{i}', False):
-                prompt_input = inputs.get(f'prompt_{i}')
-                if prompt_input:
-                    if isinstance(prompt_input, list): prompts.append(trace_comfy_prompt(prompt_json, prompt_input[0]))
-                    else: prompts.append(str(prompt_input))
-        return ", ".join(p for p in prompts if p)
-    for v in inputs.values():
-        if isinstance(v, list) and v:
-            res = trace_comfy_prompt(prompt_json, v[0]);
-            if res: return res
-    return ""
-
-def trace_comfy_input(prompt_json, start_node_id_str, target_class, target_input_key):
-    start_node_id = str(start_node_id_str)
-    if start_node_id not in prompt_json: return None
-    node_data = prompt_json[start_node_id]; class_type, inputs = node_data.get('class_type', ''), node_data.get('inputs', {})
-    if target_class in class_type: return inputs.get(target_input_key)
-    for v in inputs.values():
-        if isinstance(v, list) and v:
-            res = trace_comfy_input(prompt_json, v[0], target_class, target_input_key);
-            if res: return res
+# --- 생성 파라미터 (패싯 필터용 타입 컬럼) ---
+# A1111 의 "Steps: 28, Sampler: Euler a, ..." 줄과, ComfyUI 파싱 결과(위에서 같은 "키: 값" 형식으로 만든 줄)를 같은 규칙으로 읽는다.
+# 기존 행은 DB 의 other_params/positive_prompt 텍스트만으로 다시 채울 수 있도록 텍스트에서 파싱한다.
+GENERATION_PARAM_RE = re.compile(r'\s*([\w .()/-]+):\s*("(?:\\.|[^\\"])*"|[^,]*)(?:,|$)')
+LORA_TAG_RE = re.compile(r'<lora:([^:>]+)(?::\s*([-+]?\d*\.?\d+))?[^>]*>', re.IGNORECASE)
+GENERATION_PARAM_KEYS = {"model": ("Model",), "sampler": ("Sampler",), "scheduler": ("Scheduler", "Schedule type"), "seed": ("Seed",), "steps": ("Steps",),
+                         "cfg": ("CFG scale", "CFG"), "denoise": ("Denoising strength", "Denoise"), "size": ("Size",)}
+GENERATION_PARAM_COLUMNS = ("model", "sampler", "scheduler", "seed", "steps", "cfg", "width", "height", "denoise")
+
+def _model_name(value):
+    # 경로와 확장자를 떼어 A1111("animagine-xl")과 ComfyUI("sdxl/animagine-xl.safetensors")가 같은 값이 되게 한다.
+    name = value.replace('\\', '/').rsplit('/', 1)[-1]
+    stem, dot, ext = name.rpartition('.')
+    return stem if dot and ext.lower() in ("safetensors", "ckpt", "pt", "pth", "bin") else name
+
+def parse_generation_params(others, prompt=""):
+    raw = {}
+    for line in (others or "").splitlines():
+        for key, value in GENERATION_PARAM_RE.findall(line):
+            value = value.strip()
+            if value.startswith('"') and value.endswith('"'): value = value[1:-1]
+            if value and value != "None": raw.setdefault(key.strip(), value)
+    def first(field): return next((raw[k] for k in GENERATION_PARAM_KEYS[field] if k in raw), None)
+    def number(field, cast):
+        try: return cast(float(first(field))) if first(field) is not None else None
+        except ValueError: return None
+    params = {"model": _model_name(first("model")) if first("model") else None, "sampler": first("sampler"), "scheduler": first("scheduler"),
+              "seed": number("seed", int), "steps": number("steps", int), "cfg": number("cfg", float), "denoise": number("denoise", float), "width": None, "height": None}
+    size = first("size")
+    if size and 'x' in size:
+        try: params["width"], params["height"] = (int(v) for v in size.lower().split('x', 1))
+        except ValueError: pass
+    # LoRA: 프롬프트의 <lora:이름:강도> 태그(강도 포함), A1111 의 "Lora hashes", ComfyUI 의 "Loras".
+    loras = {}
+    for name, weight in LORA_TAG_RE.findall(prompt or ""): loras.setdefault(_model_name(name.strip()), float(weight) if weight else None)
+    for key in ("Lora hashes", "Loras"):
+        for part in raw.get(key, "").split(','):
+            name = _model_name(part.split(':')[0].strip()) if key == "Lora hashes" else _model_name(part.strip())
+            if name: loras.setdefault(name, None)
+    params["loras"] = sorted(loras.items())
+    return params
+
+# --- 헤더 전용 메타데이터 리더 (이미지 디코딩 없이 텍스트 청크만 읽음) ---
+MAX_TEXT_CHUNK_SIZE = 64 * 1024 * 1024
+
+def read_image_metadata(path):
+    with METRICS.span("metadata.read_header") as span, open(path, 'rb') as f:
+        info = read_image_metadata_from(f); span.add_bytes(f.tell())
+    if info is not None: return info
+    with Image.open(path) as img: return dict(img.info)
+
+def read_image_metadata_from(f):
+    head = f.read(12)
+    if head[:8] == b'\x89PNG\r\n\x1a\n': f.seek(8); return _read_png_text_chunks(f)
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP': return _read_webp_chunks(f)
+    if head[:2] == b'\xff\xd8': f.seek(2); return _read_jpeg_segments(f)
     return None
 
+def _inflate(data):
+    return zlib.decompressobj().decompress(data, MAX_TEXT_CHUNK_SIZE)
+
+def _read_png_text_chunks(f):
+    info = {}
+    while True:
+        header = f.read(8)
+        if len(header) < 8: break
+        length, chunk_type = struct.unpack('>I4s', header)
+        if chunk_type in (b'IDAT', b'IEND'): break
+        if chunk_type not in (b'tEXt', b'zTXt', b'iTXt') or length > MAX_TEXT_CHUNK_SIZE: f.seek(length + 4, 1); continue
+        data = f.read(length); f.seek(4, 1)
+        key, _, value = data.partition(b'\0')
+        try:
+            if chunk_type == b'tEXt': text = value.decode('latin-1', 'replace')
+            elif chunk_type == b'zTXt': text = _inflate(value[1:]).decode('latin-1', 'replace')
+            else:
+                compressed, rest = value[0], value[2:]
+                _lang, _, rest = rest.partition(b'\0'); _translated, _, rest = rest.partition(b'\0')
+                text = (_inflate(rest) if compressed else rest).decode('utf-8', 'replace')
+        except zlib.error: continue
+        info[key.decode('latin-1', 'replace')] = text
+    return info
+
+def _read_webp_chunks(f):
+    info = {}
+    while True:
+        header = f.read(8)
+        if len(header) < 8: break
+        fourcc, length = struct.unpack('<4sI', header)
+        if fourcc in (b'EXIF', b'XMP ') and length <= MAX_TEXT_CHUNK_SIZE:
+            data = f.read(length)
+            if fourcc == b'EXIF': info['exif'] = data; info.update(_parse_exif_text(data[6:] if data.startswith(b'Exif\0\0') else data))
+            else: info['xmp'] = data.decode('utf-8', 'replace')
+            f.seek(length & 1, 1)
+        else: f.seek(length + (length & 1), 1)
+    return info
+
+def _read_jpeg_segments(f):
+    info = {}
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF or marker[1] in (0xDA, 0xD9): break
+        if 0xD0 <= marker[1] <= 0xD7 or marker[1] == 0x01: continue
+        length = struct.unpack('>H', f.read(2))[0] - 2
+        if marker[1] not in (0xE1, 0xFE): f.seek(length, 1); continue
+        data = f.read(length)
+        if marker[1] == 0xFE: info['comment'] = data.decode('utf-8', 'replace')
+        elif data.startswith(b'Exif\0\0'): info['exif'] = data[6:]; info.update(_parse_exif_text(data[6:]))
+        elif data.startswith(b'http://ns.adobe.com/xap/1.0/\0'): info['xmp'] = data[29:].decode('utf-8', 'replace')
+    return info
+
+def _decode_user_comment(value):
+    prefix, body = value[:8], value[8:]
+    if prefix.startswith(b'UNICODE'):
+        # 바이트 순서 표시가 없으므로 ASCII 문자의 0 바이트 위치로 UTF-16 엔디언을 추정한다. (A1111 은 BE 로 기록)
+        big_endian = body[0::2].count(0) >= body[1::2].count(0)
+        return body.decode('utf-16-be' if big_endian else 'utf-16-le', 'replace').rstrip('\0')
+    return body.decode('utf-8', 'replace').rstrip('\0')
+
+def _parse_exif_text(data):
+    # IFD0 의 ASCII 태그(ComfyUI 는 Make/Model 등에 'prompt:{...}' 형태로 기록)와 Exif IFD 의 UserComment(A1111 의 parameters)만 읽는다.
+    info = {}
+    if len(data) < 8 or data[:2] not in (b'II', b'MM'): return info
+    order = '<' if data[:2] == b'II' else '>'
+    type_sizes = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+    def read_ifd(offset):
+        entries = {}
+        if offset + 2 > len(data): return entries
+        count = struct.unpack_from(order + 'H', data, offset)[0]
+        for i in range(count):
+            pos = offset + 2 + i * 12
+            if pos + 12 > len(data): break
+            tag, typ, n = struct.unpack_from(order + 'HHI', data, pos)
+            size = type_sizes.get(typ, 1) * n
+            value_pos = pos + 8 if size <= 4 else struct.unpack_from(order + 'I', data, pos + 8)[0]
+            entries[tag] = (typ, data[value_pos:value_pos + size] if typ in (1, 2, 7) else struct.unpack_from(order + 'I', data, pos + 8)[0])
+        return entries
+    ifd0 = read_ifd(struct.unpack_from(order + 'I', data, 4)[0])
+    for tag, (typ, value) in ifd0.items():
+        if typ != 2: continue
+        key, sep, text = value.rstrip(b'\0').decode('utf-8', 'replace').partition(':')
+        if sep and key in ('prompt', 'workflow'): info[key] = text
+    if 0x8769 in ifd0:
+        user_comment = read_ifd(ifd0[0x8769][1]).get(0x9286)
+        if user_comment and user_comment[0] in (1, 7) and len(user_comment[1]) > 8: info['parameters'] = _decode_user_comment(user_comment[1])
+    return info
+
+# --- 프롬프트 토큰 정규화 (유사 이미지 검색용) ---
+PROMPT_WEIGHT_RE = re.compile(r':\s*-?\d+(?:\.\d+)?\s*$')
+
+def normalize_prompt_token(fragment):
+    token = fragment.strip().lower().replace('\\(', '(').replace('\\)', ')')
+    if token.startswith('<') and token.endswith('>'): return ':'.join(token[1:-1].split(':')[:2]).strip()
+    token = PROMPT_WEIGHT_RE.sub('', token.strip('()[]{} ')).strip('()[]{} ')
+    token = ' '.join(token.replace('_', ' ').split())
+    return token if token != 'break' else ''
+
+def tokenize_prompt(prompt):
+    if not prompt: return set()
+    return {t for t in (normalize_prompt_token(f) for f in prompt.replace('\n', ',').split(',')) if t}
+
+# --- MinHash / LSH (근사 중복 프롬프트 묶기용) ---
+# 서명은 64개의 uint32 (256바이트 BLOB), LSH 는 16 밴드 x 4행. 자카드 0.8 인 쌍은 99.9% 이상, 0.5 인 쌍은 약 64% 확률로 버킷을 공유한다.
+MINHASH_PERMUTATIONS, LSH_BANDS = 64, 16
+MINHASH_FORMAT = f'<{MINHASH_PERMUTATIONS}I'
+
+def minhash_signature(tokens):
+    # 순열 대신 독립 해시 함수 64개를 쓴다: SHAKE-128 출력 256바이트를 uint32 64개로 잘라 토큰별로 한 번에 얻고, 위치별 최솟값을 취한다.
+    if not tokens: return None
+    return struct.pack(MINHASH_FORMAT, *map(min, zip(*(struct.unpack(MINHASH_FORMAT, hashlib.shake_128(t.encode('utf-8')).digest(MINHASH_PERMUTATIONS * 4)) for t in tokens))))
+
+def lsh_band_keys(signature):
+    band_size = len(signature) // LSH_BANDS
+    return [(band, int.from_bytes(hashlib.blake2b(signature[band * band_size:(band + 1) * band_size], digest_size=8).digest(), 'little', signed=True)) for band in range(LSH_BANDS)]
+
+def minhash_similarity(a, b):
+    # 같은 위치의 최솟값이 일치하는 비율 = 자카드 유사도 추정치. 일치 여부만 보므로 바이트 순서와 무관하게 memoryview 로 비교한다.
+    return sum(x == y for x, y in zip(memoryview(a).cast('I'), memoryview(b).cast('I'))) / MINHASH_PERMUTATIONS
+
+# --- ComfyUI 그래프 해석 ---
+COMFY_VALUE, COMFY_FIRST, COMFY_JOIN = 0, 1, 2
+
+class ComfyGraph:
+    # 이미지 하나의 prompt 그래프. 재귀 대신 명시적 스택으로 상류를 따라가고, 질의(프롬프트, 클래스+입력 키)마다 노드별 결과를 메모한다.
+    # 그래서 공유 부분 그래프(Combine/Concat, 리루트)는 한 번만 방문하고, 순환은 빈 결과로 끊으며, 깊이도 재귀 한도와 무관하다.
+    # 결과는 예전 재귀 구현과 같다: 일반 노드는 링크 입력을 선언 순서대로 보고 처음으로 값이 나오는 쪽을 택한다.
+    def __init__(self, prompt_json):
+        self.graph, self.memos = prompt_json, {}
+    def node(self, node_id):
+        # (class_type, inputs) 또는 없는 노드면 None.
+        node = self.graph.get(node_id)
+        return (node.get('class_type', ''), node.get('inputs') or {}) if isinstance(node, dict) else None
+    def nodes_of(self, fragment):
+        # class_type 에 fragment 가 들어간 노드 id 를 prompt 에 나온 순서대로.
+        return [node_id for node_id, node in self.graph.items() if type(node) is dict and fragment in node.get('class_type', '')]
+    def _resolve(self, key, start, plan, default):
+        # plan(node_id) -> (COMFY_VALUE, 값) 바로 결정 | (COMFY_FIRST, 입력값들) 링크를 차례로 따라가 처음 나온 값 | (COMFY_JOIN, 항목들) 모두 ", " 로 잇기.
+        # FIRST 사슬에서 값이 나오면 스택 위의 모든 노드가 같은 값을 갖는다. 스택에 올린 노드는 메모에 default 를 미리 넣어 두므로
+        # 순환으로 다시 만나면 빈 결과가 되고, 끝까지 값이 없던 노드는 그대로 default 로 남는다.
+        # JOIN(PromptSwitchHub)만 항목별로 _resolve 를 다시 부르므로 재귀 깊이는 허브가 중첩된 수로 제한된다.
+        memo = self.memos.get(key)
+        if memo is None: memo = self.memos[key] = {}
+        start = str(start)
+        value = memo.get(start, memo)
+        if value is not memo: return value
+        kind, value = plan(start, key)
+        if kind == COMFY_VALUE: memo[start] = value; return value
+        memo[start] = default
+        if kind == COMFY_JOIN: value = memo[start] = self._join(key, value, plan, default); return value
+        stack, path = [iter(value)], [start]
+        while stack:
+            for item in stack[-1]:
+                if type(item) is not list or not item: continue
+                item = item[0] if type(item[0]) is str else str(item[0])
+                value = memo.get(item, memo)
+                if value is memo:
+                    kind, value = plan(item, key)
+                    if kind == COMFY_VALUE: memo[item] = value
+                    elif kind == COMFY_FIRST: memo[item] = default; stack.append(iter(value)); path.append(item); break
+                    else: memo[item] = default; value = memo[item] = self._join(key, value, plan, default)
+                if value:
+                    for node_id in path: memo[node_id] = value
+                    return value
+            else: stack.pop(); path.pop()
+        return default
+    def _join(self, key, items, plan, default):
+        return ", ".join(p for p in (self._resolve(key, item[0], plan, default) if isinstance(item, list) else str(item) for item in items) if p)
+    def prompt(self, start):
+        return self._resolve("prompt", start, self._plan_prompt, "")
+    def find_input(self, start, target_class, target_input_key):
+        # start 에서 상류로 가며 처음 만나는 target_class 노드의 입력값 (값이 비어 있으면 다른 경로를 계속 찾는다).
+        return self._resolve((target_class, target_input_key), start, self._plan_input, None)
+    def find_node(self, start, target_class):
+        # start 에서 상류로 가며 처음 만나는 target_class 노드의 (class_type, inputs). 여러 입력을 한 번의 탐색으로 읽을 때 쓴다.
+        node_id = self._resolve((target_class, None), start, self._plan_input, None)
+        return self.node(node_id) if node_id is not None else None
+    def _plan_prompt(self, node_id, key):
+        node = self.graph.get(node_id)
+        if type(node) is not dict: return COMFY_VALUE, ""
+        class_type, inputs = node.get('class_type', ''), node.get('inputs') or {}
+        if 'CLIPTextEncode' in class_type:
+            text = inputs.get('text', '')
+            return (COMFY_FIRST, (text,)) if isinstance(text, list) else (COMFY_VALUE, text)
+        if 'PromptSwitchHub' in class_type:
+            return COMFY_JOIN, [inputs[f'prompt_{i}'] for i in range(1, 8) if inputs.get(f'enabled_{i}', False) and inputs.get(f'prompt_{i}')]
+        return COMFY_FIRST, inputs.values()
+    def _plan_input(self, node_id, key):
+        # key: (target_class, 입력 키). 입력 키가 None 이면 노드 id 자체가 결과.
+        node = self.graph.get(node_id)
+        if type(node) is not dict: return COMFY_VALUE, None
+        class_type, inputs = node.get('class_type', ''), node.get('inputs') or {}
+        if key[0] in class_type: return COMFY_VALUE, inputs.get(key[1]) if key[1] is not None else node_id
+        return COMFY_FIRST, inputs.values()
+
+def build_fts_query(term):
+    # 따옴표로 묶인 구문은 구문 검색, 나머지 단어는 접두어 검색으로 변환한다. (예: '"blue eyes" smil' -> '"blue eyes" AND "smil"*')
+    clauses = []
+    for i, chunk in enumerate(term.split('"')):
+        if i % 2 == 1:
+            if chunk.strip(): clauses.append(f'"{chunk.strip()}"')
+        else:
+            clauses.extend(f'"{word}"*' for word in chunk.split() if word.strip('*'))
+    return " AND ".join(c.replace('*"*', '"*') for c in clauses)
+
+# --- 메타데이터 인덱싱 (프로세스 풀에서 실행) ---
+EMPTY_PARSED_DATA = {'prompt': '', 'negative_prompt': '', 'others': ''}
+
+# 파싱 결과 캐시: 배치 생성 이미지는 시드만 다르고 ComfyUI prompt JSON 이 같다. 시드 숫자를 자리표시자(@seed0@, @seed1@ ...)로 바꾼
+# 텍스트의 해시를 키로 파싱 결과(자리표시자가 남은 템플릿)를 저장해 두고, 같은 키가 다시 나오면 json.loads 와 그래프 해석 없이 시드만 되돌려 넣는다.
+# A1111 parameters 는 문자열 분할만 하므로 해시를 구하는 쪽이 더 비싸다. 캐시하지 않는다.
+COMFY_SEED_RE = re.compile(r'(seed"\s*:\s*)(-?\d+)(?=\s*[,}])')
+SEED_PLACEHOLDER_RE = re.compile(r'@seed(\d+)@')
+
+def normalize_metadata_text(image_info):
+    # -> (키, 시드 목록, 자리표시자로 바꾼 image_info). 캐시하지 않는 메타데이터면 (None, None, image_info).
+    text, seeds = image_info.get('prompt'), []
+    if "parameters" in image_info or not isinstance(text, str) or '@seed' in text: return None, None, image_info
+    def placeholder(m): seeds.append(m.group(2)); return f'{m.group(1)}"@seed{len(seeds) - 1}@"'
+    normalized = COMFY_SEED_RE.sub(placeholder, text)
+    # SHA-256 은 CPU 가속(SHA-NI)이 있어 수 KB 텍스트에서 blake2b 보다 빠르다. 앞 16바이트만 키로 쓴다.
+    return hashlib.sha256(normalized.encode('utf-8', 'surrogatepass')).digest()[:16], seeds, {'prompt': normalized}
+
+def restore_seeds(template, seeds):
+    if not seeds: return dict(template)
+    return {k: SEED_PLACEHOLDER_RE.sub(lambda m: seeds[int(m.group(1))], v) if isinstance(v, str) and '@seed' in v else v for k, v in template.items()}
+
+class ParseCache:
+    # 메모리 LRU 앞단 + SQLite parse_cache 테이블. 프로세스 풀 워커에서도 쓰이므로 DB 는 읽기 전용 연결로만 읽고,
+    # 새로 파싱한 템플릿은 take_new_entries() 로 넘겨 DB 쓰기 스레드(update_image_cache_many)가 저장한다.
+    def __init__(self, db_file=None, capacity=4096):
+        self.db_file, self.capacity, self.entries, self.new_entries = db_file, capacity, OrderedDict(), {}
+        self.conn, self.lock = None, threading.Lock()
+    def _lookup_db(self, key):
+        if not self.db_file or not os.path.exists(self.db_file): return None
+        try:
+            if self.conn is None: self.conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True, timeout=10, check_same_thread=False)
+            row = self.conn.execute("SELECT prompt, negative_prompt, others FROM parse_cache WHERE key=?", (key,)).fetchone()
+        except sqlite3.Error: return None
+        return {'prompt': row[0], 'negative_prompt': row[1], 'others': row[2]} if row else None
+    def parse(self, image_info):
+        # -> (parse_image_metadata 와 같은 결과, 캐시 키 또는 None)
+        key, seeds, normalized = normalize_metadata_text(image_info)
+        if key is None: return parse_image_metadata(image_info), None
+        with self.lock:
+            template = self.entries.get(key)
+            if template is not None: self.entries.move_to_end(key)
+            else: template = self._lookup_db(key)
+        if template is None:
+            template = parse_image_metadata(normalized)
+            with self.lock: self.new_entries[key] = template
+        with self.lock:
+            self.entries[key] = template
+            if len(self.entries) > self.capacity: self.entries.popitem(last=False)
+        return restore_seeds(template, seeds), key
+    def take_new_entries(self):
+        with self.lock: entries, self.new_entries = self.new_entries, {}
+        return entries
+
+_parse_caches = {}
+
+def get_parse_cache(db_file):
+    # 프로세스마다 DB 파일별로 하나 (워커 프로세스는 재사용되므로 청크가 바뀌어도 LRU 가 유지된다).
+    # fork 로 물려받은 부모의 캐시(열린 SQLite 연결 포함)는 쓰지 않도록 pid 도 키에 넣는다.
+    key = (os.getpid(), db_file)
+    cache = _parse_caches.get(key)
+    if cache is None: cache = _parse_caches[key] = ParseCache(db_file)
+    return cache
+
+def extract_metadata(jobs, db_file=None):
+    # -> (처리한 작업 수, [(경로, 파싱 결과, mtime, 캐시 키)], 이번에 새로 파싱한 템플릿 {키: 템플릿}, 파싱 실패 수)
+    # 파싱에 실패한 파일도 빈 결과로 기록해 다음 실행 때 다시 시도하지 않지만, 실패 수는 따로 세어 돌려준다.
+    results, cache, failed = [], get_parse_cache(db_file), 0
+    for path, timestamp in jobs:
+        try: mtime = os.path.getmtime(path)
+        except OSError: continue
+        if timestamp and mtime <= timestamp: continue
+        try: parsed_data, key = cache.parse(read_image_metadata(path))
+        except Exception: parsed_data, key = EMPTY_PARSED_DATA, None; failed += 1
+        results.append((path, parsed_data, mtime, key))
+    return len(jobs), results, cache.take_new_entries(), failed
+
+class MetadataIndexer:
+    # 파싱은 프로세스 풀에서, DB 쓰기는 호출한 스레드에서 commit_size 행 단위 트랜잭션으로 처리한다.
+    # 커밋된 행은 timestamp 가 갱신되므로 취소 후 다시 run() 하면 남은 파일부터 이어서 처리된다. 마지막 run() 의 파싱 실패 수는 failed 에 남는다.
+    def __init__(self, db, workers=None, chunk_size=64, commit_size=2000, on_progress=None):
+        self.db, self.chunk_size, self.commit_size, self.on_progress = db, chunk_size, commit_size, on_progress
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.results = queue.Queue(maxsize=self.workers * 4)
+        self.cancelled, self.failed = threading.Event(), 0
+    def cancel(self):
+        self.cancelled.set()
+    def run(self, paths=None, root_id=None):
+        jobs, self.failed = self.db.get_stale_metadata_rows(paths, root_id), 0
+        if len(jobs) <= self.chunk_size:
+            # 폴더 감시로 들어오는 소량의 파일은 프로세스 풀을 띄우지 않고 바로 처리한다.
+            _, rows, templates, self.failed = extract_metadata(jobs, self.db.db_file)
+            if rows: self.db.update_image_cache_many(rows, templates)
+            if self.on_progress: self.on_progress(len(jobs), len(jobs))
+            return len(rows)
+        chunks = [jobs[i:i + self.chunk_size] for i in range(0, len(jobs), self.chunk_size)]
+        threading.Thread(target=self._produce, args=(chunks,), daemon=True).start()
+        done, written, pending_rows, pending_templates, finished = 0, 0, [], {}, False
+        try:
+            while True:
+                item = self.results.get()
+                if item is None: finished = True; break
+                count, rows, templates, failed = item
+                done += count; self.failed += failed; pending_rows.extend(rows); pending_templates.update(templates)
+                if len(pending_rows) >= self.commit_size:
+                    self.db.update_image_cache_many(pending_rows, pending_templates); written += len(pending_rows); pending_rows, pending_templates = [], {}
+                if self.on_progress: self.on_progress(done, len(jobs))
+            if pending_rows: self.db.update_image_cache_many(pending_rows, pending_templates); written += len(pending_rows)
+        finally:
+            # DB 쓰기가 예외로 끝나면 생산 스레드가 가득 찬 큐에서 영원히 막히지 않도록 취소하고 끝 표시(None)까지 비운다.
+            if not finished:
+                self.cancelled.set()
+                while self.results.get() is not None: pass
+        return written
+    def _produce(self, chunks):
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                pending = set()
+                for chunk in chunks:
+                    if self.cancelled.is_set(): break
+                    while len(pending) >= self.workers * 2:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished: self.results.put(future.result())
+                    pending.add(executor.submit(extract_metadata, chunk, self.db.db_file))
+                if self.cancelled.is_set(): executor.shutdown(wait=True, cancel_futures=True)
+                for future in pending:
+                    if not future.cancelled(): self.results.put(future.result())
+        except Exception as e: print(f"Metadata indexing failed: {e}")
+        finally: self.results.put(None)
+
+# --- 폴더 감시 ---
+class InotifyBackend:
+    IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x2, 0x8, 0x40, 0x80, 0x100, 0x200
+    IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR = 0x4000, 0x8000, 0x40000000
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    def __init__(self, root, recursive=True):
+        self.root, self.recursive, self.watches = root, recursive, {}
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0: raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.add_tree(root)
+    def add_tree(self, root):
+        files, stack = [], [root]
+        while stack:
+            directory = stack.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.WATCH_MASK)
+            if wd < 0: continue
+            self.watches[wd] = directory
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.recursive and not entry.name.startswith('.'): stack.append(entry.path)
+                        elif entry.name.lower().endswith(IMAGE_EXTENSIONS): files.append(entry.path)
+            except OSError: continue
+        return files
+    def read_events(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]: return []
+        try: data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError: return []
+        events, offset = [], 0
+        while offset + 16 <= len(data):
+            wd, mask, _cookie, length = struct.unpack_from('iIII', data, offset)
+            name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b'\0')); offset += 16 + length
+            if mask & self.IN_Q_OVERFLOW: events.append(('rescan', self.root)); continue
+            if mask & self.IN_IGNORED: self.watches.pop(wd, None); continue
+            directory = self.watches.get(wd)
+            if directory is None or not name: continue
+            path = os.path.join(directory, name)
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO) and self.recursive and not name.startswith('.'): events.extend(('changed', f) for f in self.add_tree(path))
+                elif mask & (self.IN_DELETE | self.IN_MOVED_FROM): events.append(('rescan', path))
+            elif name.lower().endswith(IMAGE_EXTENSIONS):
+                events.append(('removed' if mask & (self.IN_DELETE | self.IN_MOVED_FROM) else 'changed', path))
+        return events
+    def close(self):
+        os.close(self.fd)
+
+class PollingBackend:
+    def __init__(self, root, recursive=True, interval=2.0):
+        self.root, self.recursive, self.interval = root, recursive, interval
+        self.snapshot = self.take_snapshot()
+    def take_snapshot(self):
+        return {path: (size, mtime) for path, size, mtime, _ in scan_image_files(self.root, self.recursive)}
+    def read_events(self, timeout):
+        time.sleep(max(timeout, self.interval))
+        snapshot, previous = self.take_snapshot(), self.snapshot
+        self.snapshot = snapshot
+        events = [('changed', p) for p, sig in snapshot.items() if previous.get(p) != sig]
+        return events + [('removed', p) for p in previous if p not in snapshot]
+    def close(self):
+        pass
+
+class FolderWatcher:
+    # 이벤트를 경로별로 모아 두었다가 settle_seconds 동안 조용하고 (크기, mtime) 이 두 번 연속 같을 때 완성된 파일로 보고 넘긴다.
+    # 생성 중인 파일이 여러 번 수정 이벤트를 내도 콜백은 한 번만 호출된다.
+    # 삭제는 대기 중인 파일이 정리될 때까지(최대 5초) 붙잡아 두어, 이름 변경이 삭제+추가 한 묶음으로 전달되게 한다.
+    def __init__(self, root, on_changes, recursive=True, settle_seconds=0.75, use_polling=False):
+        self.root, self.on_changes, self.settle_seconds = root, on_changes, settle_seconds
+        self.backend = None
+        if not use_polling and sys.platform.startswith('linux'):
+            try: self.backend = InotifyBackend(root, recursive)
+            except (OSError, AttributeError) as e: print(f"inotify unavailable, falling back to polling: {e}")
+        if self.backend is None: self.backend = PollingBackend(root, recursive)
+        self.stopped = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+    def stop(self):
+        self.stopped.set()
+    def _run(self):
+        pending, removed, rescan = {}, {}, False
+        try:
+            while not self.stopped.is_set():
+                now = time.monotonic()
+                for kind, path in self.backend.read_events(0.25):
+                    if kind == 'rescan': rescan = True
+                    elif kind == 'removed': removed.setdefault(path, now); pending.pop(path, None)
+                    else: pending[path] = (now, None); removed.pop(path, None)
+                ready = []
+                for path, (last_event, signature) in list(pending.items()):
+                    if now - last_event < self.settle_seconds: continue
+                    try: st = os.stat(path)
+                    except OSError: del pending[path]; continue
+                    current = (st.st_size, st.st_mtime)
+                    if current == signature and st.st_size > 0: ready.append(path); del pending[path]
+                    else: pending[path] = (now, current)
+                flush_removed = removed and (not pending or now - min(removed.values()) > 5.0)
+                if (ready or flush_removed or rescan) and not self.stopped.is_set():
+                    self.on_changes(ready, sorted(removed) if flush_removed else [], rescan)
+                    if flush_removed: removed = {}
+                    rescan = False
+        finally: self.backend.close()
+
+# --- 썸네일 생성 (프로세스 풀에서 실행) ---
+def render_thumbnail(fp, max_size=THUMBNAIL_MAX_SIZE, fmt="WEBP"):
+    # 썸네일 바이트와 함께, 이미 축소된 이미지에서 구한 dHash 를 돌려준다.
+    with Image.open(fp) as img:
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        if fmt == "JPEG": img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA"): img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+        buffer = io.BytesIO()
+        img.save(buffer, fmt, quality=80)
+        return buffer.getvalue(), visual_hash(img)
+
+# --- 지각 해시 (시각적으로 유사한 이미지 검색용) ---
+def visual_hash(img, hash_size=8):
+    # dHash: (hash_size+1) x hash_size 흑백으로 줄인 뒤 가로로 이웃한 픽셀의 밝기 증감을 비트로 쓴다. 재저장/업스케일/약한 img2img 에도 거의 바뀌지 않는다.
+    pixels = list(img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[row * (hash_size + 1) + col] < pixels[row * (hash_size + 1) + col + 1])
+    return value
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    # 해밍 거리 BK-트리. 노드는 [해시, 항목 목록, {거리: 자식}] 이고, 반경 r 검색은 거리가 d-r..d+r 인 자식만 내려간다.
+    def __init__(self):
+        self.root = None
+    def add(self, value, item):
+        if self.root is None: self.root = [value, [item], {}]; return
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0: node[1].append(item); return
+            child = node[2].get(distance)
+            if child is None: node[2][distance] = [value, [item], {}]; return
+            node = child
+    def search(self, value, radius):
+        results, stack = [], [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= radius: results.extend((distance, node[0], item) for item in node[1])
+            stack.extend(child for d, child in node[2].items() if distance - radius <= d <= distance + radius)
+        return results
+
+class VisualHashIndex:
+    # 경로 -> dHash 사전과 BK-트리. 트리에서 항목을 지우는 대신, 해시가 바뀌었거나 사라진 경로는 검색 결과를 사전과 대조해 걸러낸다.
+    def __init__(self, rows=()):
+        self.tree, self.hashes, self.lock = BKTree(), {}, threading.Lock()
+        for path, value in rows: self.add(path, value)
+    def add(self, path, value):
+        with self.lock:
+            if self.hashes.get(path) == value: return
+            self.hashes[path] = value; self.tree.add(value, path)
+    def discard(self, path):
+        with self.lock: self.hashes.pop(path, None)
+    def move(self, old_path, new_path):
+        value = self.hashes.get(old_path)
+        self.discard(old_path)
+        if value is not None: self.add(new_path, value)
+    def search(self, value, radius):
+        with self.lock: matches = [(d, path) for d, node_value, path in self.tree.search(value, radius) if self.hashes.get(path) == node_value]
+        return sorted(matches)
+
+class ThumbnailStore:
+    # 썸네일은 (경로 해시, mtime, 크기) 키로 저장되고, 디스크 사용량이 budget 을 넘으면 last_access 가 오래된 것부터 지운다.
+    # packed=True 이면 작은 파일 대신 THUMBNAIL_SEGMENT_SIZE 단위의 세그먼트 파일에 이어 붙이고 mmap 으로 읽는다.
+    # 이때 budget 은 세그먼트 파일 크기의 합(지워진 항목이 남긴 빈 공간 포함)에 적용되고, 빈 공간은 compact_segments 가 회수한다.
+    def __init__(self, db, root=THUMBNAIL_DIR, budget_mb=1024, fmt="WEBP", packed=False, max_size=THUMBNAIL_MAX_SIZE):
+        self.db, self.root, self.packed, self.max_size = db, root, packed, max_size
+        self.fmt = fmt if fmt != "WEBP" or features.check("webp") else "JPEG"
+        self.budget = budget_mb * 1024 * 1024
+        self.pending_touches, self.segments = {}, {}
+        os.makedirs(self.root, exist_ok=True)
+        self.remove_legacy_thumbnails()
+        self.total_bytes = self.db.get_thumbnail_cache_size()
+        self.segment_bytes = sum(self.segment_sizes().values())
+        self.write_segment = self.db.get_last_thumbnail_segment() or 1
+    def remove_legacy_thumbnails(self):
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS): os.remove(entry.path)
+    @staticmethod
+    def path_hash(fp): return hashlib.sha1(os.path.normcase(os.path.abspath(fp)).encode('utf-8')).hexdigest()[:24]
+    def key_for(self, fp):
+        return f"{self.path_hash(fp)}-{os.stat(fp).st_mtime_ns:x}-{self.max_size}"
+    def relocate(self, moves):
+        # 루트 이동(relocate_root) 뒤: 키의 경로 해시 부분만 새 경로로 바꾼다. mtime 이 그대로인 썸네일은 다시 만들지 않는다.
+        self.flush_touches()
+        rows = []
+        for old_path, new_path in moves:
+            new_hash = self.path_hash(new_path)
+            for key, _, segment in self.db.get_thumbnail_entries_for_source(old_path):
+                new_key = f"{new_hash}-{key.split('-', 1)[1]}"
+                if not segment:
+                    try: os.makedirs(os.path.dirname(self.file_path_for(new_key)), exist_ok=True); os.replace(self.file_path_for(key), self.file_path_for(new_key))
+                    except OSError: continue
+                rows.append((new_key, new_path, key))
+        self.db.rekey_thumbnail_entries(rows)
+        return len(rows)
+    def file_path_for(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.{self.fmt.lower()}")
+    def segment_path(self, segment):
+        return os.path.join(self.root, f"segment_{segment:04d}.bin")
+    def segment_sizes(self):
+        return {int(name[8:-4]): os.path.getsize(os.path.join(self.root, name)) for name in os.listdir(self.root) if name.startswith("segment_") and name.endswith(".bin")}
+    @METRICS.timed("thumbnail.cache_read")
+    def get(self, fp):
+        try: key = self.key_for(fp)
+        except OSError: return None
+        entry = self.db.get_thumbnail_entry(key)
+        if not entry: return None
+        segment, offset, length = entry
+        try:
+            if segment: data = self.read_segment(segment, offset, length)
+            else:
+                with open(self.file_path_for(key), 'rb') as f: data = f.read()
+        except (OSError, ValueError): self.db.delete_thumbnail_entries([key]); return None
+        self.pending_touches[key] = time.time()
+        if len(self.pending_touches) >= 256: self.flush_touches()
+        if METRICS.enabled: METRICS.add_bytes("thumbnail.cache_read", len(data))
+        return data
+    def peek(self, fp):
+        # 백그라운드 스레드용 읽기: 접근 시간을 갱신하지 않고, 공유 mmap 대신 파일을 직접 연다.
+        try: key = self.key_for(fp)
+        except OSError: return None
+        entry = self.db.get_thumbnail_entry(key)
+        if not entry: return None
+        segment, offset, length = entry
+        try:
+            with open(self.segment_path(segment) if segment else self.file_path_for(key), 'rb') as f: f.seek(offset or 0); return f.read(length)
+        except OSError: return None
+    @METRICS.timed("thumbnail.cache_write")
+    def put(self, fp, data):
+        try: key = self.key_for(fp)
+        except OSError: return
+        if METRICS.enabled: METRICS.add_bytes("thumbnail.cache_write", len(data))
+        segment, offset = None, None
+        if self.packed:
+            if os.path.exists(self.segment_path(self.write_segment)) and os.path.getsize(self.segment_path(self.write_segment)) + len(data) > THUMBNAIL_SEGMENT_SIZE:
+                self.write_segment += 1
+            with open(self.segment_path(self.write_segment), 'ab') as f: segment, offset = self.write_segment, f.tell(); f.write(data)
+            self.segment_bytes += len(data)
+        else:
+            os.makedirs(os.path.dirname(self.file_path_for(key)), exist_ok=True)
+            with open(self.file_path_for(key), 'wb') as f: f.write(data)
+        for stale_key, stale_size, stale_segment in self.db.get_thumbnail_entries_for_source(fp, exclude_key=key): self.remove_entry(stale_key, stale_size, stale_segment)
+        self.total_bytes += len(data) - self.db.add_thumbnail_entry(key, fp, len(data), time.time(), segment, offset)
+        if (self.segment_bytes if self.packed else self.total_bytes) > self.budget: self.evict()
+    def read_segment(self, segment, offset, length):
+        mm = self.segments.get(segment)
+        if mm is None or offset + length > len(mm):
+            if mm is not None: mm.close()
+            with open(self.segment_path(segment), 'rb') as f: mm = self.segments[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mm[offset:offset + length]
+    def flush_touches(self):
+        if self.pending_touches: self.db.touch_thumbnail_entries([(t, k) for k, t in self.pending_touches.items()])
+        self.pending_touches.clear()
+    def evict(self):
+        self.flush_touches()
+        target = self.budget * 0.9
+        while self.total_bytes > target:
+            rows = self.db.get_least_recent_thumbnails(500)
+            if not rows: break
+            for key, size, segment in rows:
+                if self.total_bytes <= target: break
+                self.remove_entry(key, size, segment)
+        if self.packed: self.compact_segments()
+    def remove_entry(self, key, size, segment):
+        if not segment:
+            try: os.remove(self.file_path_for(key))
+            except OSError: pass
+        self.pending_touches.pop(key, None)
+        self.db.delete_thumbnail_entries([key])
+        self.total_bytes -= size
+    def compact_segments(self):
+        # 살아있는 데이터가 절반 이하로 줄어든 세그먼트와, 그래도 디스크 사용량이 목표를 넘으면 살아있는 비율이 낮은 세그먼트부터
+        # 남은 항목을 새 쓰기 세그먼트로 옮긴 뒤 삭제한다. 지금의 쓰기 세그먼트도 대상이 될 수 있으므로 옮기기 전에 새 세그먼트로 바꾼다.
+        usage, sizes = dict(self.db.get_thumbnail_segment_usage()), self.segment_sizes()
+        disk, target, plan = sum(sizes.values()), self.budget * 0.9, []
+        for segment in sorted(sizes, key=lambda s: usage.get(s, 0) / sizes[s] if sizes[s] else 0.0):
+            live = usage.get(segment, 0)
+            if live > sizes[segment] / 2 and disk <= target: break
+            plan.append(segment); disk -= sizes[segment] - live
+        if plan: self.write_segment = max(sizes) + 1
+        for segment in plan:
+            moved = [(key, self.read_segment(segment, offset, length)) for key, offset, length in self.db.get_thumbnail_segment_entries(segment)]
+            if segment in self.segments: self.segments.pop(segment).close()
+            with open(self.segment_path(self.write_segment), 'ab') as f:
+                for key, data in moved: self.db.move_thumbnail_entry(key, self.write_segment, f.tell()); f.write(data)
+            os.remove(self.segment_path(segment))
+        self.segment_bytes = sum(self.segment_sizes().values())
+    def close(self):
+        self.flush_touches()
+        for mm in self.segments.values(): mm.close()
+        self.segments.clear()
+
+class ThumbnailPipeline:
+    # 요청은 (우선순위, 순번) 힙에 쌓이고, 동시에 max_in_flight 개까지만 프로세스 풀에 제출된다.
+    # schedule() 은 현재 화면 기준으로 대기열을 통째로 교체하므로, 스크롤로 벗어난 셀의 요청은 버려진다.
+    def __init__(self, on_ready, render_args=(), workers=None):
+        self.on_ready, self.render_args = on_ready, render_args
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_in_flight = self.workers * 2
+        self.executor, self.stopped = None, False
+        self.cond = threading.Condition()
+        self.heap, self.wanted, self.in_flight = [], {}, set()
+        self.seq = itertools.count()
+        self.completed, self.completion_times = 0, deque(maxlen=200)
+        threading.Thread(target=self._dispatch_loop, daemon=True).start()
+    def schedule(self, priorities):
+        with self.cond:
+            self.wanted = {p: pr for p, pr in priorities.items() if p not in self.in_flight}
+            self.heap = [(pr, next(self.seq), p) for p, pr in self.wanted.items()]
+            heapq.heapify(self.heap)
+            self.cond.notify()
+    def stats(self):
+        with self.cond:
+            now, times = time.monotonic(), [t for t in self.completion_times if time.monotonic() - t <= 5.0]
+            throughput = len(times) / max(0.5, now - times[0]) if len(times) > 1 else 0.0
+            return {'queued': len(self.wanted), 'in_flight': len(self.in_flight), 'completed': self.completed, 'throughput': throughput}
+    def is_busy(self):
+        with self.cond: return bool(self.wanted or self.in_flight)
+    def shutdown(self):
+        with self.cond: self.stopped = True; self.wanted.clear(); self.heap.clear(); self.cond.notify()
+        if self.executor: self.executor.shutdown(wait=False, cancel_futures=True)
+    def _dispatch_loop(self):
+        while True:
+            with self.cond:
+                while not self.stopped and (not self.heap or len(self.in_flight) >= self.max_in_flight): self.cond.wait()
+                if self.stopped: return
+                priority, _, path = heapq.heappop(self.heap)
+                if self.wanted.get(path) != priority: continue
+                del self.wanted[path]; self.in_flight.add(path)
+                if self.executor is None: self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            try: future = self.executor.submit(render_thumbnail, path, *self.render_args)
+            except RuntimeError: return
+            future.add_done_callback(lambda f, p=path, started=time.perf_counter(): self._on_done(p, f, started))
+    def _on_done(self, path, future, started):
+        if METRICS.enabled: METRICS.record("thumbnail.render_roundtrip", started)
+        try: result = future.result()
+        except Exception as e: print(f"Error creating thumbnail for {path}: {e}"); result = None
+        with self.cond:
+            self.in_flight.discard(path); self.completed += 1; self.completion_times.append(time.monotonic())
+            self.cond.notify()
+        if not self.stopped: self.on_ready(path, result)
+
 class DatabaseManager:
+    # 스레드마다 하나의 연결을 열어 재사용한다. WAL 모드이므로 백그라운드 인덱서의 쓰기가 UI 스레드의 읽기를 막지 않는다.
+    PATH_REFERENCES = [("images", "path"), ("image_tags", "image_path"), ("album_images", "image_path"), ("image_tokens", "image_path"), ("lsh_buckets", "image_path"), ("image_loras", "image_path")]
+    PRAGMAS = ("PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL", "PRAGMA cache_size=-65536", "PRAGMA mmap_size=268435456", "PRAGMA temp_store=MEMORY")
     def __init__(self, db_file):
         self.db_file = db_file
+        self._local, self._connections, self._connections_lock = threading.local(), {}, threading.Lock()
+        self.listeners = []
         self.setup_tables()
     def _get_connection(self):
-        return sqlite3.connect(self.db_file, timeout=10)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=10, check_same_thread=False, cached_statements=256)
+            for pragma in self.PRAGMAS: conn.execute(pragma)
+            conn.create_function("path_basename", 1, lambda p: os.path.basename(p) if p else "", deterministic=True)
+            self._local.conn = conn
+            with self._connections_lock:
+                for thread in [t for t in self._connections if not t.is_alive()]: self._connections.pop(thread).close()
+                self._connections[threading.current_thread()] = conn
+        return conn
+    def add_listener(self, callback):
+        # callback(event, *args) 는 쓰기가 커밋된 직후, 쓰기를 한 스레드에서 호출된다. (LibraryModel 동기화용)
+        self.listeners.append(callback)
+    def _notify(self, event, *args):
+        for callback in self.listeners: callback(event, *args)
+    def close(self):
+        # 호출한 스레드와 이미 끝난 스레드의 연결만 닫는다. 아직 돌고 있는 작업 스레드(인덱서, 근사 중복 계산 등)의 연결을 여기서 닫으면
+        # 그 스레드가 종료 도중 sqlite3.ProgrammingError 를 내므로, 작업 스레드는 끝날 때 release_connection() 으로 자기 연결을 닫는다.
+        current = threading.current_thread()
+        with self._connections_lock:
+            for thread in [t for t in self._connections if t is current or not t.is_alive()]: self._connections.pop(thread).close()
+        self._local.conn = None
+    def release_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None: return
+        self._local.conn = None
+        with self._connections_lock: self._connections.pop(threading.current_thread(), None)
+        conn.close()
+    @METRICS.timed("db.execute")
     def _execute(self, query, params=(), fetch=None):
         with self._get_connection() as conn:
             cursor = conn.cursor()
@@ -94,37 +972,576 @@ class DatabaseManager:
             if fetch == 'one': return cursor.fetchone()
             if fetch == 'all': return cursor.fetchall()
             conn.commit()
+    @METRICS.timed("db.executemany")
     def _executemany(self, query, params):
         with self._get_connection() as conn:
             conn.cursor().executemany(query, params)
             conn.commit()
     def setup_tables(self):
-        self._execute('''CREATE TABLE IF NOT EXISTS images (path TEXT PRIMARY KEY, positive_prompt TEXT, negative_prompt TEXT, other_params TEXT, is_favorite INTEGER DEFAULT 0, timestamp REAL)''')
+        self._execute('''CREATE TABLE IF NOT EXISTS images (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, positive_prompt TEXT, negative_prompt TEXT, other_params TEXT, is_favorite INTEGER DEFAULT 0, timestamp REAL)''')
+        self._migrate_images_rowid()
         self._execute('''CREATE TABLE IF NOT EXISTS albums (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL, position INTEGER)''')
         self._execute('''CREATE TABLE IF NOT EXISTS album_images (album_id INTEGER, image_path TEXT, FOREIGN KEY (album_id) REFERENCES albums (id) ON DELETE CASCADE, FOREIGN KEY (image_path) REFERENCES images (path) ON DELETE CASCADE, PRIMARY KEY (album_id, image_path))''')
         self._execute('''CREATE TABLE IF NOT EXISTS tags (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL)''')
         self._execute('''CREATE TABLE IF NOT EXISTS image_tags (image_path TEXT, tag_id INTEGER, FOREIGN KEY (image_path) REFERENCES images (path) ON DELETE CASCADE, FOREIGN KEY (tag_id) REFERENCES tags (id) ON DELETE CASCADE, PRIMARY KEY (image_path, tag_id))''')
-    def sync_files(self, file_paths):
-        db_paths = set(row[0] for row in self._execute("SELECT path FROM images", fetch='all'))
-        fs_paths = set(file_paths)
-        to_add, to_remove = fs_paths - db_paths, db_paths - fs_paths
-        if to_add: self._executemany("INSERT OR IGNORE INTO images (path) VALUES (?)", [(p,) for p in to_add])
-        if to_remove: self._executemany("DELETE FROM images WHERE path=?", [(p,) for p in to_remove])
-    def get_all_image_paths(self): return [row[0] for row in self._execute("SELECT path FROM images ORDER BY timestamp DESC NULLS LAST", fetch='all')]
-    def update_image_cache(self, path, parsed_data, timestamp): self._execute("UPDATE images SET positive_prompt=?, negative_prompt=?, other_params=?, timestamp=? WHERE path=?", (parsed_data['prompt'], parsed_data['negative_prompt'], parsed_data['others'], timestamp, path))
+        self._add_missing_columns("images", {"size": "INTEGER", "mtime": "REAL", "inode": "INTEGER"})
+        self._execute("DROP INDEX IF EXISTS idx_images_mtime")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_images_mtime_path ON images (mtime, path)")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_images_timestamp ON images (timestamp)")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_images_favorite ON images (is_favorite)")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_image_tags_tag ON image_tags (tag_id)")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_album_images_path ON album_images (image_path)")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_images_inode ON images (inode)")
+        self.setup_token_index()
+        self.setup_near_duplicate_index()
+        self.setup_generation_params()
+        self.setup_roots()
+        # 파싱 결과 캐시 (ParseCache). images.parse_key 는 그 이미지를 만든 템플릿을 가리킨다 (같은 워크플로의 이미지끼리 같은 키).
+        self._execute("CREATE TABLE IF NOT EXISTS parse_cache (key BLOB PRIMARY KEY, prompt TEXT, negative_prompt TEXT, others TEXT) WITHOUT ROWID")
+        self._add_missing_columns("images", {"parse_key": "BLOB"})
+        self._execute("CREATE INDEX IF NOT EXISTS idx_images_parse_key ON images (parse_key)")
+        self._add_missing_columns("images", {"phash": "INTEGER"})
+        self._execute('''CREATE TABLE IF NOT EXISTS thumbnails (key TEXT PRIMARY KEY, source_path TEXT, bytes INTEGER, last_access REAL, segment INTEGER, offset INTEGER)''')
+        self._execute("CREATE INDEX IF NOT EXISTS idx_thumbnails_last_access ON thumbnails (last_access)")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_thumbnails_source ON thumbnails (source_path)")
+        self.setup_search_index()
+        self.setup_custom_translations()
+        # 번역 결과 캐시. 사용자 사전(custom_translations)과는 별개이며, 사용자 사전이 항상 우선한다.
+        self._execute("CREATE TABLE IF NOT EXISTS translation_cache (source TEXT NOT NULL, dest TEXT NOT NULL, translated TEXT NOT NULL, backend TEXT, created REAL, PRIMARY KEY (source, dest)) WITHOUT ROWID")
+    def _migrate_images_rowid(self):
+        # images_fts 는 images 의 rowid 로 이어진다. 예전 images 는 path TEXT PRIMARY KEY 인 rowid 테이블이라 VACUUM 이 rowid 를 다시 매길 수 있었으므로,
+        # rowid 를 그대로 id (INTEGER PRIMARY KEY, VACUUM 에도 유지) 로 옮긴 테이블로 바꾼다. 인덱스와 트리거는 이어지는 setup 단계가 다시 만든다.
+        columns = self._execute("PRAGMA table_info(images)", fetch='all')
+        if any(name == "id" for _, name, *_ in columns): return
+        names = ", ".join(name for _, name, *_ in columns)
+        definitions = ", ".join(f"{name} {column_type}" + (f" DEFAULT {default}" if default is not None else "") for _, name, column_type, _, default, _ in columns if name != "path")
+        with self._get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # 다른 테이블에 걸려 있으면서 images 를 참조하는 트리거는 테이블을 바꾸는 동안 깨지므로 지웠다가 다시 만든다 (images 자신의 트리거는 DROP TABLE 로 지워진다).
+            for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='trigger' AND tbl_name <> 'images' AND sql LIKE '%images%'").fetchall(): conn.execute(f"DROP TRIGGER {name}")
+            conn.execute(f"CREATE TABLE images_new (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, {definitions})")
+            conn.execute(f"INSERT INTO images_new (id, {names}) SELECT rowid, {names} FROM images")
+            conn.execute("DROP TABLE images"); conn.execute("ALTER TABLE images_new RENAME TO images")
+    def setup_custom_translations(self):
+        # 사용자 번역 사전. 부분 문자열 검색은 trigram FTS5(외부 콘텐츠 테이블, 트리거로 동기화)를 쓰고, 3글자 미만 검색어나 trigram 이 없는 SQLite 에서는 LIKE 로 찾는다.
+        is_new = not self._execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='custom_translations'", fetch='one')
+        self._execute("CREATE TABLE IF NOT EXISTS custom_translations (id INTEGER PRIMARY KEY, source TEXT UNIQUE NOT NULL, translated TEXT NOT NULL)")
+        if is_new: self._executemany("INSERT OR IGNORE INTO custom_translations (source, translated) VALUES (?, ?)", [("1girl", "소녀 1명"), ("masterpiece", "걸작"), ("best quality", "최고 품질")])
+        fts_is_new = not self._execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='custom_translations_fts'", fetch='one')
+        try: self._execute("CREATE VIRTUAL TABLE IF NOT EXISTS custom_translations_fts USING fts5(source, translated, content='custom_translations', content_rowid='id', tokenize='trigram')")
+        except sqlite3.OperationalError as e:
+            print(f"Trigram index unavailable, dictionary search falls back to LIKE: {e}"); self.translation_fts = False; return
+        self.translation_fts = True
+        self._create_custom_translation_triggers()
+        if fts_is_new: self._execute("INSERT INTO custom_translations_fts (custom_translations_fts) VALUES ('rebuild')")
+    def _create_custom_translation_triggers(self):
+        self._execute('''CREATE TRIGGER IF NOT EXISTS custom_translations_ai AFTER INSERT ON custom_translations BEGIN
+            INSERT INTO custom_translations_fts (rowid, source, translated) VALUES (new.id, new.source, new.translated); END''')
+        self._execute('''CREATE TRIGGER IF NOT EXISTS custom_translations_ad AFTER DELETE ON custom_translations BEGIN
+            INSERT INTO custom_translations_fts (custom_translations_fts, rowid, source, translated) VALUES ('delete', old.id, old.source, old.translated); END''')
+        self._execute('''CREATE TRIGGER IF NOT EXISTS custom_translations_au AFTER UPDATE ON custom_translations BEGIN
+            INSERT INTO custom_translations_fts (custom_translations_fts, rowid, source, translated) VALUES ('delete', old.id, old.source, old.translated);
+            INSERT INTO custom_translations_fts (rowid, source, translated) VALUES (new.id, new.source, new.translated); END''')
+    def import_custom_translations(self, entries):
+        # 대량 가져오기: 행마다 FTS 트리거를 돌리지 않고, 같은 트랜잭션 끝에서 색인을 한 번 다시 만든다.
+        rows = [(str(k), str(v)) for k, v in entries.items() if k]
+        with self._get_connection() as conn:
+            if self.translation_fts:
+                for trigger in ("custom_translations_ai", "custom_translations_ad", "custom_translations_au"): conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            conn.executemany("INSERT INTO custom_translations (source, translated) VALUES (?, ?) ON CONFLICT (source) DO UPDATE SET translated=excluded.translated", rows)
+            if self.translation_fts: conn.execute("INSERT INTO custom_translations_fts (custom_translations_fts) VALUES ('rebuild')")
+        if self.translation_fts: self._create_custom_translation_triggers()
+        return len(rows)
+    def update_custom_translations(self, upserts=None, deletes=()):
+        with self._get_connection() as conn:
+            conn.executemany("DELETE FROM custom_translations WHERE source=?", [(k,) for k in deletes])
+            conn.executemany("INSERT INTO custom_translations (source, translated) VALUES (?, ?) ON CONFLICT (source) DO UPDATE SET translated=excluded.translated", list((upserts or {}).items()))
+    def get_custom_translations(self, sources):
+        sources, found = list(sources), {}
+        for i in range(0, len(sources), 500):
+            chunk = sources[i:i + 500]
+            found.update(self._execute(f"SELECT source, translated FROM custom_translations WHERE source IN ({','.join('?' for _ in chunk)})", tuple(chunk), fetch='all'))
+        return found
+    def count_custom_translations(self): return self._execute("SELECT COUNT(*) FROM custom_translations", fetch='one')[0]
+    def search_custom_translations(self, term, limit=200):
+        # 반환: (일치하는 전체 항목 수, 원문 순으로 최대 limit 개의 (원문, 번역))
+        if self.translation_fts and len(term) >= 3:
+            where, params = "id IN (SELECT rowid FROM custom_translations_fts WHERE custom_translations_fts MATCH ?)", ('"' + term.replace('"', '""') + '"',)
+        else:
+            pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where, params = "(source LIKE ? ESCAPE '\\' OR translated LIKE ? ESCAPE '\\')", (pattern, pattern)
+        total = self._execute(f"SELECT COUNT(*) FROM custom_translations WHERE {where}", params, fetch='one')[0]
+        return total, self._execute(f"SELECT source, translated FROM custom_translations WHERE {where} ORDER BY source LIMIT ?", params + (limit,), fetch='all')
+    def setup_token_index(self):
+        # 이미지 -> 정규화된 프롬프트 토큰의 역색인. df(문서 빈도)는 IDF 가중치 계산에 쓰이며, 행마다 트리거를 돌리지 않도록 배치 단위로 증감분을 합산해 반영한다.
+        self._add_missing_columns("images", {"tokens_indexed": "INTEGER DEFAULT 0"})
+        self._execute("CREATE TABLE IF NOT EXISTS prompt_tokens (id INTEGER PRIMARY KEY, token TEXT UNIQUE NOT NULL, df INTEGER NOT NULL DEFAULT 0)")
+        self._execute("CREATE TABLE IF NOT EXISTS image_tokens (token_id INTEGER NOT NULL, image_path TEXT NOT NULL, PRIMARY KEY (token_id, image_path)) WITHOUT ROWID")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_image_tokens_path ON image_tokens (image_path)")
+        self._execute("CREATE TRIGGER IF NOT EXISTS images_tokens_ad AFTER DELETE ON images BEGIN UPDATE prompt_tokens SET df = df - 1 WHERE id IN (SELECT token_id FROM image_tokens WHERE image_path = old.path); DELETE FROM image_tokens WHERE image_path = old.path; END")
+    def _index_prompt_tokens(self, conn, rows):
+        # 기존 색인과의 차이만 쓴다: 사라진 토큰은 지우고 새 토큰만 넣으며, df 는 토큰별 증감분을 한 번에 갱신한다.
+        token_rows = [(path, tokenize_prompt(prompt)) for path, prompt in rows]
+        all_tokens = list(set().union(*(tokens for _, tokens in token_rows)))
+        conn.executemany("INSERT OR IGNORE INTO prompt_tokens (token) VALUES (?)", [(t,) for t in all_tokens])
+        token_ids = {}
+        for i in range(0, len(all_tokens), 500):
+            chunk = all_tokens[i:i + 500]
+            token_ids.update((token, tid) for tid, token in conn.execute(f"SELECT id, token FROM prompt_tokens WHERE token IN ({','.join('?' for _ in chunk)})", chunk))
+        added, removed, df_delta = [], [], Counter()
+        for path, tokens in token_rows:
+            old_ids = {tid for tid, in conn.execute("SELECT token_id FROM image_tokens WHERE image_path=?", (path,))}
+            new_ids = {token_ids[t] for t in tokens}
+            added.extend((tid, path) for tid in new_ids - old_ids); removed.extend((tid, path) for tid in old_ids - new_ids)
+            df_delta.update(new_ids - old_ids); df_delta.subtract(old_ids - new_ids)
+        conn.executemany("DELETE FROM image_tokens WHERE token_id=? AND image_path=?", removed)
+        conn.executemany("INSERT OR IGNORE INTO image_tokens (token_id, image_path) VALUES (?, ?)", added)
+        conn.executemany("UPDATE prompt_tokens SET df = df + ? WHERE id = ?", [(delta, tid) for tid, delta in df_delta.items() if delta])
+        signatures = [(minhash_signature(tokens), path) for path, tokens in token_rows]
+        conn.executemany("UPDATE images SET tokens_indexed=1, minhash=? WHERE path=?", signatures)
+        conn.executemany("DELETE FROM lsh_buckets WHERE image_path=?", [(path,) for _, path in signatures])
+        conn.executemany("INSERT OR IGNORE INTO lsh_buckets (band, bucket, image_path) VALUES (?, ?, ?)", [(band, bucket, path) for sig, path in signatures if sig for band, bucket in lsh_band_keys(sig)])
+    def setup_generation_params(self):
+        # 생성 파라미터 타입 컬럼과 LoRA 목록. params_indexed=0 인 행은 index_missing_generation_params 가 기존 텍스트에서 채운다.
+        self._add_missing_columns("images", {"model": "TEXT", "sampler": "TEXT", "scheduler": "TEXT", "seed": "INTEGER", "steps": "INTEGER", "cfg": "REAL",
+                                             "width": "INTEGER", "height": "INTEGER", "denoise": "REAL", "params_indexed": "INTEGER DEFAULT 0"})
+        self._execute("CREATE TABLE IF NOT EXISTS image_loras (lora TEXT NOT NULL, image_path TEXT NOT NULL, weight REAL, PRIMARY KEY (lora, image_path)) WITHOUT ROWID")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_image_loras_path ON image_loras (image_path)")
+        self._execute("CREATE TRIGGER IF NOT EXISTS images_loras_ad AFTER DELETE ON images BEGIN DELETE FROM image_loras WHERE image_path = old.path; END")
+        # (model, sampler, cfg) 는 "모델 X 의 Euler a, CFG 5~7" 을 한 번의 범위 탐색으로, 나머지는 각 패싯 단독 필터와 GROUP BY 개수 집계를 인덱스만으로 처리한다.
+        self._execute("CREATE INDEX IF NOT EXISTS idx_images_model_sampler_cfg ON images (model, sampler, cfg)")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_images_sampler_cfg ON images (sampler, cfg)")
+        for column in ("scheduler", "steps", "cfg", "seed"): self._execute(f"CREATE INDEX IF NOT EXISTS idx_images_{column} ON images ({column})")
+    def _index_generation_params(self, conn, rows):
+        # rows: [(경로, other_params, positive_prompt)]
+        parsed = [(path, parse_generation_params(others, prompt)) for path, others, prompt in rows]
+        conn.executemany(f"UPDATE images SET {', '.join(c + '=?' for c in GENERATION_PARAM_COLUMNS)}, params_indexed=1 WHERE path=?",
+                         [tuple(p[c] for c in GENERATION_PARAM_COLUMNS) + (path,) for path, p in parsed])
+        conn.executemany("DELETE FROM image_loras WHERE image_path=?", [(path,) for path, _ in parsed])
+        conn.executemany("INSERT OR IGNORE INTO image_loras (lora, image_path, weight) VALUES (?, ?, ?)", [(name, path, weight) for path, p in parsed for name, weight in p["loras"]])
+    def index_missing_generation_params(self, batch_size=2000):
+        total = 0
+        while True:
+            rows = self._execute("SELECT path, other_params, positive_prompt FROM images WHERE params_indexed=0 AND timestamp IS NOT NULL LIMIT ?", (batch_size,), fetch='all')
+            if not rows: return total
+            with self._get_connection() as conn: self._index_generation_params(conn, rows)
+            total += len(rows)
+    def setup_near_duplicate_index(self):
+        # MinHash 서명은 토큰 색인과 같은 트랜잭션에서 계산되므로, 서명 컬럼이 새로 생긴 DB 는 토큰 색인을 다시 돌려 채운다.
+        if not any(row[1] == "minhash" for row in self._execute("PRAGMA table_info(images)", fetch='all')):
+            self._execute("ALTER TABLE images ADD COLUMN minhash BLOB"); self._execute("UPDATE images SET tokens_indexed=0")
+        self._execute("CREATE TABLE IF NOT EXISTS lsh_buckets (band INTEGER NOT NULL, bucket INTEGER NOT NULL, image_path TEXT NOT NULL, PRIMARY KEY (band, bucket, image_path)) WITHOUT ROWID")
+        self._execute("CREATE INDEX IF NOT EXISTS idx_lsh_buckets_path ON lsh_buckets (image_path)")
+        self._execute("CREATE TRIGGER IF NOT EXISTS images_lsh_ad AFTER DELETE ON images BEGIN DELETE FROM lsh_buckets WHERE image_path = old.path; END")
+    def find_near_duplicates(self, source_path, threshold=0.8):
+        # LSH 버킷을 하나라도 공유하는 후보만 서명으로 검증한다.
+        row = self._execute("SELECT minhash FROM images WHERE path=?", (source_path,), fetch='one')
+        if not row or not row[0]: return []
+        hidden = self.get_unmounted_root_ids()
+        candidates = self._execute(f"""SELECT b.image_path, i.minhash FROM lsh_buckets a JOIN lsh_buckets b ON b.band = a.band AND b.bucket = a.bucket JOIN images i ON i.path = b.image_path
+            WHERE a.image_path=? AND b.image_path <> ? {'AND ' + self._mounted_condition(hidden) if hidden else ''} GROUP BY b.image_path""", (source_path, source_path, *hidden), fetch='all')
+        matches = [(path, minhash_similarity(row[0], sig)) for path, sig in candidates if sig]
+        return sorted((m for m in matches if m[1] >= threshold), key=lambda m: m[1], reverse=True)
+    def get_near_duplicate_groups(self, threshold=0.8, gallery_filter=None):
+        # gallery_filter 를 주면 갤러리와 같은 조건(_compile_filter)을 통과한 이미지만 묶는다. 그룹 안은 최신순, 그룹은 (크기, 가장 최근 이미지) 순.
+        # 서명은 한 번의 쿼리로 모두 읽는다. 두 개 이상이 모인 버킷 안의 후보 쌍 중 임계값을 넘는 것을 union-find 로 묶으므로,
+        # 결과가 버킷 안의 순서(어느 이미지가 처음에 오는지)에 좌우되지 않는다. 이미 같은 그룹인 쌍과 다른 밴드에서 본 쌍은 다시 비교하지 않는다.
+        parent, compared = {}, set()
+        def find(p):
+            root = p
+            while parent.get(root, root) != root: root = parent[root]
+            while p != root: parent[p], p = root, parent.get(p, p)
+            return root
+        compiled = self._compile_filter(gallery_filter or GalleryFilter())
+        if compiled is None: return []
+        source, where, params = compiled
+        rows = self._execute(f"SELECT i.path, i.minhash, i.mtime FROM {source} WHERE {' AND '.join(where + ['i.minhash IS NOT NULL'])}", tuple(params), fetch='all')
+        signatures, order = {path: sig for path, sig, _ in rows}, {path: (mtime or 0, path) for path, _, mtime in rows}
+        rows = self._execute("""SELECT b.band, b.bucket, b.image_path FROM lsh_buckets b JOIN (SELECT band, bucket FROM lsh_buckets GROUP BY band, bucket HAVING COUNT(*) > 1) d
+            ON d.band = b.band AND d.bucket = b.bucket ORDER BY b.band, b.bucket""", fetch='all')
+        for _, bucket_rows in itertools.groupby(rows, key=lambda r: (r[0], r[1])):
+            members = [r[2] for r in bucket_rows if r[2] in signatures]
+            for i, a in enumerate(members):
+                for b in members[i + 1:]:
+                    root_a, root_b = find(a), find(b)
+                    if root_a == root_b or (a, b) in compared: continue
+                    compared.add((a, b))
+                    if minhash_similarity(signatures[a], signatures[b]) >= threshold: parent[root_b] = root_a
+        groups = {}
+        for p in parent: groups.setdefault(find(p), []).append(p)
+        for root, members in groups.items():
+            if root not in parent: members.append(root)
+            members.sort(key=order.get, reverse=True)
+        return sorted((g for g in groups.values() if len(g) > 1), key=lambda g: (len(g), order[g[0]]), reverse=True)
+    def index_missing_prompt_tokens(self, batch_size=2000):
+        total = 0
+        while True:
+            rows = self._execute("SELECT path, positive_prompt FROM images WHERE tokens_indexed=0 AND timestamp IS NOT NULL LIMIT ?", (batch_size,), fetch='all')
+            if not rows: return total
+            with self._get_connection() as conn: self._index_prompt_tokens(conn, rows)
+            total += len(rows)
+    def find_similar_images(self, source_path, limit=500, common_ratio=0.2):
+        # 기준 이미지와 토큰을 하나 이상 공유하는 이미지만 후보로 삼고, IDF 가중치 합으로 점수를 매겨 상위 limit 개만 힙으로 고른다.
+        # 전체의 common_ratio 이상에 등장하는 흔한 토큰(masterpiece 등)은 다른 토큰이 있으면 후보 수집에서 제외한다.
+        source = self._execute("SELECT t.id, t.df FROM image_tokens it JOIN prompt_tokens t ON t.id = it.token_id WHERE it.image_path=?", (source_path,), fetch='all')
+        if not source: return []
+        n = self._execute("SELECT COUNT(*) FROM images", fetch='one')[0]
+        doc_freq = dict(source)
+        weights = {tid: math.log(1 + (n - df + 0.5) / (df + 0.5)) for tid, df in doc_freq.items()}
+        selective = {tid: w for tid, w in weights.items() if doc_freq[tid] <= max(10, n * common_ratio)}
+        weights = selective or weights
+        with self._get_connection() as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS query_tokens (token_id INTEGER PRIMARY KEY, weight REAL)")
+            conn.execute("DELETE FROM query_tokens")
+            conn.executemany("INSERT INTO query_tokens VALUES (?, ?)", weights.items())
+            hidden = self.get_unmounted_root_ids()
+            cursor = conn.execute(f"""SELECT it.image_path, SUM(q.weight) FROM query_tokens q CROSS JOIN image_tokens it ON it.token_id = q.token_id
+                WHERE it.image_path <> ? {'AND ' + self._hidden_paths_condition(hidden, 'it.image_path') if hidden else ''} GROUP BY it.image_path""", (source_path, *hidden))
+            top = heapq.nlargest(limit, cursor, key=lambda row: row[1])
+            conn.execute("DELETE FROM query_tokens")
+        return top
+    def _add_missing_columns(self, table, columns):
+        existing = {row[1] for row in self._execute(f"PRAGMA table_info({table})", fetch='all')}
+        for name, column_type in columns.items():
+            if name not in existing: self._execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+    def setup_search_index(self):
+        # images_fts 의 rowid 는 images.id (INTEGER PRIMARY KEY 라 VACUUM 에도 바뀌지 않는 rowid) 와 같게 유지하고, 트리거로 동기화한다.
+        is_new = not self._execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='images_fts'", fetch='one')
+        self._execute('''CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(path UNINDEXED, name, positive_prompt, negative_prompt, other_params, tags, tokenize="unicode61 remove_diacritics 2")''')
+        tags_of = self._fts_tags_of
+        self._execute(f'''CREATE TRIGGER IF NOT EXISTS images_fts_ai AFTER INSERT ON images BEGIN
+            INSERT INTO images_fts (rowid, path, name, positive_prompt, negative_prompt, other_params, tags) VALUES (new.rowid, new.path, path_basename(new.path), new.positive_prompt, new.negative_prompt, new.other_params, {tags_of('new.path')}); END''')
+        self._execute('''CREATE TRIGGER IF NOT EXISTS images_fts_au AFTER UPDATE OF path, positive_prompt, negative_prompt, other_params ON images BEGIN
+            UPDATE images_fts SET path=new.path, name=path_basename(new.path), positive_prompt=new.positive_prompt, negative_prompt=new.negative_prompt, other_params=new.other_params WHERE rowid=new.rowid; END''')
+        self._execute('''CREATE TRIGGER IF NOT EXISTS images_fts_ad AFTER DELETE ON images BEGIN
+            DELETE FROM images_fts WHERE rowid=old.rowid; END''')
+        # 일괄 태그 작업은 fts_sync_paused 에 행을 넣어 행 단위 트리거를 멈추고, 끝에서 선택된 이미지의 tags 를 한 번씩만 갱신한다.
+        self._execute("CREATE TABLE IF NOT EXISTS fts_sync_paused (paused INTEGER)")
+        self._execute("DROP TRIGGER IF EXISTS image_tags_fts_ai"); self._execute("DROP TRIGGER IF EXISTS image_tags_fts_ad")
+        self._execute(f'''CREATE TRIGGER image_tags_fts_ai AFTER INSERT ON image_tags WHEN NOT EXISTS (SELECT 1 FROM fts_sync_paused) BEGIN
+            UPDATE images_fts SET tags={tags_of('new.image_path')} WHERE rowid=(SELECT rowid FROM images WHERE path=new.image_path); END''')
+        self._execute(f'''CREATE TRIGGER image_tags_fts_ad AFTER DELETE ON image_tags WHEN NOT EXISTS (SELECT 1 FROM fts_sync_paused) BEGIN
+            UPDATE images_fts SET tags={tags_of('old.image_path')} WHERE rowid=(SELECT rowid FROM images WHERE path=old.image_path); END''')
+        self._execute(f'''CREATE TRIGGER IF NOT EXISTS tags_fts_au AFTER UPDATE OF name ON tags BEGIN
+            UPDATE images_fts SET tags={tags_of('images_fts.path')} WHERE rowid IN (SELECT i.rowid FROM images i JOIN image_tags it ON it.image_path = i.path WHERE it.tag_id=new.id); END''')
+        self._execute(f'''CREATE TRIGGER IF NOT EXISTS tags_fts_ad AFTER DELETE ON tags BEGIN
+            UPDATE images_fts SET tags={tags_of('images_fts.path')} WHERE rowid IN (SELECT i.rowid FROM images i JOIN image_tags it ON it.image_path = i.path WHERE it.tag_id=old.id); END''')
+        if is_new: self.rebuild_search_index()
+    @staticmethod
+    def _fts_tags_of(ref): return f"(SELECT group_concat(t.name, ' ') FROM image_tags it JOIN tags t ON t.id = it.tag_id WHERE it.image_path = {ref})"
+    def rebuild_search_index(self):
+        with self._get_connection() as conn:
+            conn.execute("DELETE FROM images_fts")
+            conn.execute('''INSERT INTO images_fts (rowid, path, name, positive_prompt, negative_prompt, other_params, tags)
+                SELECT i.rowid, i.path, path_basename(i.path), i.positive_prompt, i.negative_prompt, i.other_params,
+                (SELECT group_concat(t.name, ' ') FROM image_tags it JOIN tags t ON t.id = it.tag_id WHERE it.image_path = i.path) FROM images i''')
+            conn.commit()
+    def sync_files(self, entries, root_id=None):
+        # 스캔 결과를 임시 테이블에 넣고 추가/변경/삭제를 SQL 로 한 번에 반영한다. root_id 를 주면 그 루트의 이미지만 삭제 대상이 된다.
+        return len(self._merge_scan(entries, root_id=root_id))
+    def apply_file_changes(self, entries, removed_paths, root_id=None):
+        # 폴더 감시에서 들어온 일부 파일만 반영한다. 반환값은 (이전 경로, 새 경로) 이동 목록.
+        return self._merge_scan(entries, removed_paths, root_id)
+    def _merge_scan(self, entries, removed_paths=None, root_id=None):
+        # 같은 (inode, 크기, mtime) 을 가진 파일이 사라지고 새로 생긴 경우는 이동으로 보고 즐겨찾기/태그/앨범을 유지한다.
+        entries = [e if isinstance(e, tuple) else (e, None, None, None) for e in entries]
+        root = self.get_root(root_id) if root_id is not None else None
+        with self._get_connection() as conn:
+            # 읽은 뒤 쓰는 트랜잭션이므로 쓰기 잠금을 먼저 잡는다. 루트별 스캔이 동시에 병합할 때 읽기 -> 쓰기 승격이 바로 SQLITE_BUSY 로 실패하지 않도록.
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS scan (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, inode INTEGER)")
+            conn.execute("DELETE FROM scan")
+            conn.executemany("INSERT OR REPLACE INTO scan (path, size, mtime, inode) VALUES (?, ?, ?, ?)", entries)
+            conn.execute("DROP TABLE IF EXISTS temp.gone")
+            if removed_paths is None:
+                if root is None: conn.execute("CREATE TEMP TABLE gone AS SELECT path, size, mtime, inode FROM images WHERE path NOT IN (SELECT path FROM scan)")
+                else: conn.execute("CREATE TEMP TABLE gone AS SELECT path, size, mtime, inode FROM images WHERE root_id = ? AND path NOT IN (SELECT path FROM scan)", (root_id,))
+            else:
+                conn.execute("CREATE TEMP TABLE gone (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, inode INTEGER)")
+                conn.executemany("INSERT OR IGNORE INTO gone SELECT path, size, mtime, inode FROM images WHERE path=?", [(p,) for p in removed_paths])
+            moves = conn.execute('''SELECT g.path, s.path FROM gone g JOIN scan s ON s.inode = g.inode AND s.size = g.size AND s.mtime = g.mtime
+                WHERE g.inode IS NOT NULL AND s.path NOT IN (SELECT path FROM images) GROUP BY s.path''').fetchall()
+            for table, column in self.PATH_REFERENCES: conn.executemany(f"UPDATE OR IGNORE {table} SET {column}=? WHERE {column}=?", [(new, old) for old, new in moves])
+            gone = [row[0] for row in conn.execute("SELECT path FROM gone WHERE path IN (SELECT path FROM images)")]
+            added = [row[0] for row in conn.execute("SELECT path FROM scan WHERE path NOT IN (SELECT path FROM images) OR path IN (SELECT path FROM gone) ORDER BY mtime, path")]
+            conn.execute("DELETE FROM images WHERE path IN (SELECT path FROM gone)")
+            conn.execute('''INSERT INTO images (path, size, mtime, inode) SELECT path, size, mtime, inode FROM scan WHERE path NOT IN (SELECT path FROM images)''')
+            conn.execute('''UPDATE images SET (size, mtime, inode, phash) = (SELECT size, mtime, inode, NULL FROM scan WHERE scan.path = images.path)
+                WHERE path IN (SELECT s.path FROM scan s JOIN images i ON i.path = s.path WHERE i.size IS NOT s.size OR i.mtime IS NOT s.mtime OR i.inode IS NOT s.inode)''')
+            if root is not None:
+                start = len(self.root_prefix(root[1])) + 1
+                conn.execute("UPDATE images SET root_id=?, rel_path=substr(path, ?) WHERE path IN (SELECT path FROM scan) AND (root_id IS NOT ? OR rel_path IS NOT substr(path, ?))", (root_id, start, root_id, start))
+            conn.execute("DELETE FROM scan"); conn.execute("DROP TABLE temp.gone")
+        if moves or gone or added: self._notify("files_changed", added, gone, moves)
+        return moves
+    def get_library_snapshot(self):
+        # LibraryModel 적재용: 오래된 것부터 (경로, 즐겨찾기). 내려진 루트의 이미지는 빠진다.
+        hidden = self.get_unmounted_root_ids()
+        return self._execute(f"SELECT path, is_favorite FROM images {'WHERE ' + self._mounted_condition(hidden, 'root_id') if hidden else ''} ORDER BY mtime, path", tuple(hidden), fetch='all')
+    def get_all_image_paths(self, root_ids=None):
+        # root_ids 를 주면 그 루트들만, 아니면 올라가 있는 루트 전체.
+        if root_ids is not None:
+            root_ids = list(root_ids)
+            return [row[0] for row in self._execute(f"SELECT path FROM images WHERE root_id IN ({','.join('?' for _ in root_ids)}) ORDER BY mtime DESC, path DESC", tuple(root_ids), fetch='all')]
+        hidden = self.get_unmounted_root_ids()
+        return [row[0] for row in self._execute(f"SELECT path FROM images {'WHERE ' + self._mounted_condition(hidden, 'root_id') if hidden else ''} ORDER BY mtime DESC, path DESC", tuple(hidden), fetch='all')]
+    # --- 라이브러리 루트 ---
+    def setup_roots(self):
+        # 라이브러리는 여러 루트 폴더로 이루어진다. images.path 는 지금처럼 (루트 경로 + 상대 경로) 문자열로 두어 앱 전체의 식별자로 쓰고,
+        # root_id/rel_path 는 루트가 다른 경로로 옮겨졌을 때 relocate_root 가 경로를 다시 만드는 근거가 된다. mounted=0 인 루트의 이미지는 색인을 유지한 채 숨긴다.
+        self._execute("CREATE TABLE IF NOT EXISTS roots (id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT UNIQUE NOT NULL, label TEXT, mounted INTEGER DEFAULT 1, position INTEGER)")
+        self._add_missing_columns("images", {"root_id": "INTEGER", "rel_path": "TEXT"})
+        self._execute("CREATE INDEX IF NOT EXISTS idx_images_root ON images (root_id)")
+    @staticmethod
+    def root_prefix(path): return os.path.join(os.path.normpath(path), "")
+    @staticmethod
+    def _mounted_condition(hidden, column="i.root_id"): return f"COALESCE({column}, 0) NOT IN ({','.join('?' for _ in hidden)})"
+    @staticmethod
+    def _hidden_paths_condition(hidden, column):
+        # images 를 조인하지 않는 쿼리(토큰 역색인, FTS)용: 내려진 루트의 경로를 root_id 인덱스로 뽑아 뺀다.
+        return f"{column} NOT IN (SELECT path FROM images WHERE root_id IN ({','.join('?' for _ in hidden)}))"
+    def get_roots(self): return self._execute("SELECT id, path, label, mounted FROM roots ORDER BY position, id", fetch='all')
+    def get_root(self, root_id): return self._execute("SELECT id, path, label, mounted FROM roots WHERE id=?", (root_id,), fetch='one')
+    def get_unmounted_root_ids(self): return [row[0] for row in self._execute("SELECT id FROM roots WHERE mounted=0", fetch='all')]
+    def get_root_image_counts(self): return dict(self._execute("SELECT root_id, COUNT(*) FROM images WHERE root_id IS NOT NULL GROUP BY root_id", fetch='all'))
+    def _check_root_overlap(self, path, exclude=None):
+        # 루트끼리 겹치면 바깥 루트의 스캔과 안쪽 루트의 스캔이 같은 파일의 root_id 를 서로 빼앗으므로 막는다.
+        target = os.path.normcase(self.root_prefix(os.path.abspath(path)))
+        for root_id, root_path, label, _ in self.get_roots():
+            other = os.path.normcase(self.root_prefix(os.path.abspath(root_path)))
+            if root_id != exclude and (target.startswith(other) or other.startswith(target)): raise ValueError(f"이미 등록된 루트({label}: {root_path})와 겹치는 폴더입니다.")
+    def ensure_default_root(self, folder):
+        # 루트가 하나도 없는 DB (단일 image_folder 시절) 는 그 폴더를 첫 루트로 등록하고 기존 행을 넘겨받는다.
+        if not self.get_roots(): self.add_root(folder)
+        return self.get_roots()
+    def add_root(self, path, label=None):
+        path = os.path.normpath(path)
+        self._check_root_overlap(path)
+        prefix = self.root_prefix(path)
+        with self._get_connection() as conn:
+            root_id = conn.execute("INSERT INTO roots (path, label, mounted, position) VALUES (?, ?, 1, (SELECT COALESCE(MAX(position), 0) + 1 FROM roots))", (path, label or os.path.basename(path) or path)).lastrowid
+            # 아직 어느 루트에도 속하지 않은 행 중 이 폴더 아래에 있는 것은 그대로 넘겨받는다 (태그/앨범/메타데이터 유지).
+            conn.execute("UPDATE images SET root_id=?, rel_path=substr(path, ?) WHERE root_id IS NULL AND substr(path, 1, ?) = ?", (root_id, len(prefix) + 1, len(prefix), prefix))
+        self._notify("roots_changed")
+        return root_id
+    def remove_root(self, root_id):
+        # 루트를 라이브러리에서 빼고 그 이미지의 색인과 태그/앨범 소속을 지운다. 파일은 건드리지 않는다.
+        with self._get_connection() as conn:
+            gone = [row[0] for row in conn.execute("SELECT path FROM images WHERE root_id=?", (root_id,))]
+            conn.execute("INSERT INTO fts_sync_paused VALUES (1)")
+            for table in ("image_tags", "album_images"): conn.execute(f"DELETE FROM {table} WHERE image_path IN (SELECT path FROM images WHERE root_id=?)", (root_id,))
+            conn.execute("DELETE FROM fts_sync_paused")
+            conn.execute("DELETE FROM images WHERE root_id=?", (root_id,)); conn.execute("DELETE FROM roots WHERE id=?", (root_id,))
+        if gone: self._notify("files_changed", [], gone, [])
+        self._notify("roots_changed")
+    def set_root_mounted(self, root_id, mounted):
+        # 내린 루트는 스캔/감시/파싱에서 빠지고 갤러리에서 숨겨지지만 행은 남으므로, 다시 올리면 그 루트만 스캔해 변경분만 반영한다.
+        self._execute("UPDATE roots SET mounted=? WHERE id=?", (1 if mounted else 0, root_id)); self._notify("roots_changed")
+    def rename_root(self, root_id, label): self._execute("UPDATE roots SET label=? WHERE id=?", (label, root_id)); self._notify("roots_changed")
+    def relocate_root(self, root_id, new_path):
+        # 루트 폴더가 다른 경로(드라이브 문자, 마운트 지점)로 옮겨진 경우: rel_path 로 새 경로를 만들어 모든 경로 참조를 한 번에 바꾼다.
+        # 다시 스캔하거나 파싱하지 않는다. 반환값은 (이전 경로, 새 경로) 이동 목록 (썸네일 캐시 키 갱신용).
+        new_path = os.path.normpath(new_path)
+        self._check_root_overlap(new_path, exclude=root_id)
+        prefix = self.root_prefix(new_path)
+        with self._get_connection() as conn:
+            moves = [(path, prefix + rel) for path, rel in conn.execute("SELECT path, rel_path FROM images WHERE root_id=? AND rel_path IS NOT NULL", (root_id,)) if path != prefix + rel]
+            conn.execute("UPDATE roots SET path=? WHERE id=?", (new_path, root_id))
+            for table, column in self.PATH_REFERENCES: conn.executemany(f"UPDATE OR IGNORE {table} SET {column}=? WHERE {column}=?", [(new, old) for old, new in moves])
+        if moves: self._notify("files_changed", [], [], moves)
+        self._notify("roots_changed")
+        return moves
+    # 정렬 키: (첫째 키, 동률 해소 키, 내림차순 여부). 키셋 페이지네이션은 마지막 행의 (k1, k2) 다음부터 읽는다.
+    GALLERY_SORTS = {"newest": ("i.mtime", "i.path", True), "oldest": ("i.mtime", "i.path", False), "path": ("i.path", "i.rowid", False),
+                     "relevance": ("bm25(images_fts, 0.0, 10.0, 5.0, 1.0, 1.0, 8.0)", "i.rowid", False)}
+    FACETS = {"model": "category", "sampler": "category", "scheduler": "category", "lora": "category",
+              "cfg": "range", "steps": "range", "seed": "range", "width": "range", "height": "range", "denoise": "range"}
+    def _is_dense(self, count_query, params, ratio=0.05):
+        # 소속 이미지가 전체의 ratio 이상이면 정렬 인덱스를 따라 훑으며 행마다 확인하는 편이 LIMIT 에서 바로 멈추므로 빠르다.
+        # 적으면 소속 목록을 인덱스로 먼저 뽑아 정렬한다. (통계 없이도 계획이 흔들리지 않도록 직접 고른다)
+        total = self._execute("SELECT COUNT(*) FROM images", fetch='one')[0]
+        return total > 0 and self._execute(count_query, params, fetch='one')[0] >= total * ratio
+    def _compile_filter(self, f, exclude_facet=None):
+        # GalleryFilter -> (FROM 절, WHERE 조건 목록, 매개변수). 검색어가 FTS 질의로 바뀌지 않으면 None.
+        where, params, source = [], [], "images i"
+        if f.search.strip():
+            match_query = build_fts_query(f.search)
+            if not match_query: return None
+            source = "images_fts JOIN images i ON i.rowid = images_fts.rowid"; where.append("images_fts MATCH ?"); params.append(match_query)
+        if f.favorites: where.append("i.is_favorite = 1" if not self._is_dense("SELECT COUNT(*) FROM images WHERE is_favorite = 1", ()) else "+i.is_favorite = 1")
+        for table, key, value in (("album_images", "album_id", f.album_id), ("image_tags", "tag_id", f.tag_id)):
+            if value is None: continue
+            if self._is_dense(f"SELECT COUNT(*) FROM {table} WHERE {key} = ?", (value,)): where.append(f"EXISTS (SELECT 1 FROM {table} m WHERE m.image_path = i.path AND m.{key} = ?)")
+            else: where.append(f"i.path IN (SELECT image_path FROM {table} WHERE {key} = ?)")
+            params.append(value)
+        if f.blacklist:
+            where.append(f"NOT EXISTS (SELECT 1 FROM image_tags bt JOIN tags t ON t.id = bt.tag_id WHERE bt.image_path = i.path AND t.name IN ({','.join('?' for _ in f.blacklist)}))")
+            params.extend(f.blacklist)
+        hidden = self.get_unmounted_root_ids()
+        if hidden: where.append(self._mounted_condition(hidden)); params.extend(hidden)
+        facet_where, facet_params = self._compile_facets(f.facets, exclude_facet)
+        if facet_where:
+            # 조합 전체가 조밀하면 파라미터 인덱스를 끄고('+') 정렬 인덱스를 따라가며 확인한다 (_is_dense 와 같은 판단).
+            dense = self._is_dense(f"SELECT COUNT(*) FROM images i WHERE {' AND '.join(facet_where)}", tuple(facet_params))
+            where.extend(c.replace("i.", "+i.", 1) if dense and c.startswith("i.") else c for c in facet_where); params.extend(facet_params)
+        return source, where, params
+    def _compile_facets(self, facets, exclude_facet=None):
+        where, params = [], []
+        for facet, value in (facets or {}).items():
+            kind = self.FACETS.get(facet)
+            if kind is None or facet == exclude_facet or not value: continue
+            if kind == "category":
+                values, placeholders = list(value), ','.join('?' for _ in value)
+                where.append(f"i.path IN (SELECT image_path FROM image_loras WHERE lora IN ({placeholders}))" if facet == "lora" else f"i.{facet} IN ({placeholders})"); params.extend(values)
+            else:
+                low, high = value
+                if low is not None: where.append(f"i.{facet} >= ?"); params.append(low)
+                if high is not None: where.append(f"i.{facet} <= ?"); params.append(high)
+        return where, params
+    def get_facet_counts(self, gallery_filter, facet, limit=100):
+        # 다른 조건은 모두 적용하고 이 패싯 자신의 조건만 뺀 상태에서 값별 이미지 수. 반환: [(값, 개수)] 많은 순.
+        compiled = self._compile_filter(gallery_filter, exclude_facet=facet)
+        if compiled is None or facet not in self.FACETS: return []
+        source, where, params = compiled
+        if facet == "lora": source += " JOIN image_loras l ON l.image_path = i.path"; column = "l.lora"
+        else: column = f"i.{facet}"; where = where + [f"{column} IS NOT NULL"]
+        query = f"SELECT {column}, COUNT(*) FROM {source} {'WHERE ' + ' AND '.join(where) if where else ''} GROUP BY {column} ORDER BY 2 DESC, 1 LIMIT ?"
+        try: return self._execute(query, tuple(params) + (limit,), fetch='all')
+        except sqlite3.OperationalError as e: print(f"Facet count error for {facet}: {e}"); return []
+    def query_images(self, gallery_filter, after=None, limit=200):
+        # GalleryFilter 를 하나의 SQL 로 컴파일해 한 페이지를 읽는다. 반환값은 (경로 목록, 다음 페이지 커서 또는 None).
+        f, compiled = gallery_filter, self._compile_filter(gallery_filter)
+        if compiled is None: return [], None
+        source, where, params = compiled
+        k1, k2, descending = self.GALLERY_SORTS[f.effective_sort]
+        outer = ""
+        if after is not None: outer = f"WHERE (k1, k2) {'<' if descending else '>'} (?, ?)"; params.extend(after)
+        direction = "DESC" if descending else "ASC"
+        query = f"""SELECT path, k1, k2 FROM (SELECT i.path AS path, {k1} AS k1, {k2} AS k2 FROM {source} {'WHERE ' + ' AND '.join(where) if where else ''})
+            {outer} ORDER BY k1 {direction}, k2 {direction} LIMIT ?"""
+        try: rows = self._execute(query, tuple(params) + (limit,), fetch='all')
+        except sqlite3.OperationalError as e: print(f"Gallery query error for {f.search!r}: {e}"); return [], None
+        return [row[0] for row in rows], (rows[-1][1], rows[-1][2]) if len(rows) == limit else None
+    def match_paths(self, gallery_filter, paths):
+        # paths 중 보기 조건(검색어, 블랙리스트, 파라미터 필터 등)을 통과하는 것. 폴더 감시로 들어온 새 파일을 현재 보기에 넣을지 정할 때 쓴다.
+        compiled = self._compile_filter(gallery_filter)
+        if compiled is None: return []
+        source, where, params = compiled
+        paths, matched = list(paths), []
+        for i in range(0, len(paths), 500):
+            chunk = paths[i:i + 500]
+            conditions = where + [f"i.path IN ({','.join('?' for _ in chunk)})"]
+            query = f"SELECT i.path FROM {source} WHERE {' AND '.join(conditions)}"
+            try: matched.extend(row[0] for row in self._execute(query, tuple(params) + tuple(chunk), fetch='all'))
+            except sqlite3.OperationalError as e: print(f"Gallery match error for {gallery_filter.search!r}: {e}"); return []
+        return matched
+    def get_stale_metadata_rows(self, paths=None, root_id=None):
+        # root_id 를 주면 그 루트만, 아니면 올라가 있는 루트 전체 (내려진 루트의 파일은 읽을 수 없으므로 뺀다).
+        query = "SELECT path, timestamp FROM images WHERE (timestamp IS NULL OR mtime IS NULL OR timestamp < mtime)"
+        if root_id is not None: return self._execute(query + " AND root_id=? ORDER BY mtime DESC", (root_id,), fetch='all')
+        hidden = self.get_unmounted_root_ids()
+        if paths is None: return self._execute(query + (" AND " + self._mounted_condition(hidden, "root_id") if hidden else "") + " ORDER BY mtime DESC", tuple(hidden), fetch='all')
+        paths, rows = list(paths), []
+        for i in range(0, len(paths), 500):
+            chunk = paths[i:i + 500]
+            rows.extend(self._execute(query + f" AND path IN ({','.join('?' for _ in chunk)})", tuple(chunk), fetch='all'))
+        return rows
+    @METRICS.timed("db.update_image_cache")
+    def update_image_cache_many(self, rows, templates=None):
+        # rows: [(경로, 파싱 결과, timestamp[, 파싱 캐시 키])], templates: extract_metadata 가 새로 만든 {캐시 키: 템플릿}
+        rows = [(r[0], r[1], r[2], r[3] if len(r) > 3 else None) for r in rows]
+        with self._get_connection() as conn:
+            if templates: conn.executemany("INSERT OR IGNORE INTO parse_cache (key, prompt, negative_prompt, others) VALUES (?, ?, ?, ?)", [(key, t['prompt'], t['negative_prompt'], t['others']) for key, t in templates.items()])
+            conn.executemany("UPDATE images SET positive_prompt=?, negative_prompt=?, other_params=?, timestamp=?, parse_key=? WHERE path=?", [(d['prompt'], d['negative_prompt'], d['others'], ts, key, path) for path, d, ts, key in rows])
+            self._index_prompt_tokens(conn, [(path, d['prompt']) for path, d, _, _ in rows])
+            self._index_generation_params(conn, [(path, d['others'], d['prompt']) for path, d, _, _ in rows])
+    def update_image_cache(self, path, parsed_data, timestamp): self.update_image_cache_many([(path, parsed_data, timestamp)])
+    def prune_parse_cache(self):
+        # 어떤 이미지도 가리키지 않는 템플릿을 지운다 (파일 삭제나 재파싱 뒤).
+        self._execute("DELETE FROM parse_cache WHERE key NOT IN (SELECT parse_key FROM images WHERE parse_key IS NOT NULL)")
+    # dHash 는 부호 없는 64비트이므로 SQLite INTEGER(부호 있는 64비트) 범위로 바꿔 저장한다.
+    def set_visual_hash(self, path, value): self._execute("UPDATE images SET phash=? WHERE path=?", (value - (1 << 64) if value >= 1 << 63 else value, path))
+    def get_visual_hash(self, path):
+        row = self._execute("SELECT phash FROM images WHERE path=?", (path,), fetch='one')
+        return row[0] & 0xFFFFFFFFFFFFFFFF if row and row[0] is not None else None
+    def get_visual_hashes(self):
+        hidden = self.get_unmounted_root_ids()
+        rows = self._execute(f"SELECT path, phash FROM images WHERE phash IS NOT NULL {'AND ' + self._mounted_condition(hidden, 'root_id') if hidden else ''}", tuple(hidden), fetch='all')
+        return [(path, value & 0xFFFFFFFFFFFFFFFF) for path, value in rows]
+    def get_paths_missing_visual_hash(self, root_ids=None):
+        if root_ids is not None:
+            root_ids = list(root_ids)
+            return [row[0] for row in self._execute(f"SELECT i.path FROM images i JOIN thumbnails t ON t.source_path = i.path WHERE i.phash IS NULL AND i.root_id IN ({','.join('?' for _ in root_ids)}) GROUP BY i.path", tuple(root_ids), fetch='all')]
+        hidden = self.get_unmounted_root_ids()
+        return [row[0] for row in self._execute(f"SELECT i.path FROM images i JOIN thumbnails t ON t.source_path = i.path WHERE i.phash IS NULL {'AND ' + self._mounted_condition(hidden) if hidden else ''} GROUP BY i.path", tuple(hidden), fetch='all')]
+    def get_cached_translations(self, sources, dest):
+        sources, found = list(sources), {}
+        for i in range(0, len(sources), 500):
+            chunk = sources[i:i + 500]
+            found.update(self._execute(f"SELECT source, translated FROM translation_cache WHERE dest=? AND source IN ({','.join('?' for _ in chunk)})", (dest, *chunk), fetch='all'))
+        return found
+    def put_cached_translations(self, translations, dest, backend):
+        now = time.time()
+        self._executemany("INSERT OR REPLACE INTO translation_cache (source, dest, translated, backend, created) VALUES (?, ?, ?, ?, ?)", [(source, dest, translated, backend, now) for source, translated in translations.items()])
+    def clear_translation_cache(self): self._execute("DELETE FROM translation_cache")
     def get_parsed_prompts(self, path): return self._execute("SELECT positive_prompt, negative_prompt FROM images WHERE path=?", (path,), fetch='one') or ("", "")
     def get_image_data(self, path): return self._execute("SELECT is_favorite, timestamp FROM images WHERE path=?", (path,), fetch='one') or (0, 0)
-    def set_favorite(self, path, is_fav): self._execute("UPDATE images SET is_favorite=? WHERE path=?", (1 if is_fav else 0, path))
+    def set_favorite(self, path, is_fav): self._execute("UPDATE images SET is_favorite=? WHERE path=?", (1 if is_fav else 0, path)); self._notify("favorite", path, bool(is_fav))
     def get_favorites(self): return {row[0] for row in self._execute("SELECT path FROM images WHERE is_favorite=1", fetch='all')}
     def get_albums(self): return self._execute("SELECT id, name FROM albums ORDER BY position", fetch='all')
     def add_album(self, name):
         max_pos = self._execute("SELECT MAX(position) FROM albums", fetch='one')[0] or 0
         self._execute("INSERT INTO albums (name, position) VALUES (?, ?)", (name, max_pos + 1))
     def rename_album(self, album_id, new_name): self._execute("UPDATE albums SET name=? WHERE id=?", (new_name, album_id))
-    def delete_album(self, album_id): self._execute("DELETE FROM albums WHERE id=?", (album_id,))
+    def delete_album(self, album_id): self._execute("DELETE FROM albums WHERE id=?", (album_id,)); self._notify("album_deleted", album_id)
     def get_album_images(self, album_id): return {row[0] for row in self._execute("SELECT image_path FROM album_images WHERE album_id=?", (album_id,), fetch='all')}
-    def add_image_to_album(self, album_id, path): self._execute("INSERT OR IGNORE INTO album_images (album_id, image_path) VALUES (?, ?)", (album_id, path))
-    def remove_image_from_album(self, album_id, path): self._execute("DELETE FROM album_images WHERE album_id=? AND image_path=?", (album_id, path))
+    def add_image_to_album(self, album_id, path): self._execute("INSERT OR IGNORE INTO album_images (album_id, image_path) VALUES (?, ?)", (album_id, path)); self._notify("album_image_added", album_id, path)
+    def remove_image_from_album(self, album_id, path): self._execute("DELETE FROM album_images WHERE album_id=? AND image_path=?", (album_id, path)); self._notify("album_image_removed", album_id, path)
+    # --- 일괄 작업: 선택 목록을 임시 테이블에 한 번 넣고, 한 트랜잭션 안에서 집합 단위 SQL 로 쓴다 ---
+    def _load_selection(self, conn, paths):
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS selection (path TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM selection")
+        conn.executemany("INSERT OR IGNORE INTO selection (path) VALUES (?)", ((p,) for p in paths))
+    def _finish_bulk_tag_change(self, conn):
+        conn.execute(f"UPDATE images_fts SET tags={self._fts_tags_of('images_fts.path')} WHERE rowid IN (SELECT i.rowid FROM selection s JOIN images i ON i.path = s.path)")
+        conn.execute("DELETE FROM fts_sync_paused"); conn.execute("DELETE FROM selection")
+    def bulk_set_favorite(self, paths, is_fav):
+        paths = list(paths)
+        with self._get_connection() as conn:
+            self._load_selection(conn, paths)
+            conn.execute("UPDATE images SET is_favorite=? WHERE path IN (SELECT path FROM selection) AND is_favorite IS NOT ?", (1 if is_fav else 0, 1 if is_fav else 0))
+            conn.execute("DELETE FROM selection")
+        self._notify("favorite_many", paths, bool(is_fav))
+    def bulk_add_tags(self, paths, tag_names):
+        # 태그 id 는 한 번만 확인하고, (선택 x 태그) 조합을 INSERT ... SELECT 한 문장으로 넣는다. 반환값은 {태그 이름: id}.
+        paths, tag_names = list(paths), sorted({t.strip().lower() for t in tag_names if t.strip()})
+        if not tag_names: return {}
+        with self._get_connection() as conn:
+            conn.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", [(t,) for t in tag_names])
+            tag_map = dict(conn.execute(f"SELECT name, id FROM tags WHERE name IN ({','.join('?' for _ in tag_names)})", tag_names).fetchall())
+            self._load_selection(conn, paths)
+            conn.execute("INSERT INTO fts_sync_paused VALUES (1)")
+            conn.execute(f"""INSERT OR IGNORE INTO image_tags (image_path, tag_id) SELECT s.path, t.id FROM selection s JOIN images i ON i.path = s.path
+                CROSS JOIN tags t WHERE t.id IN ({','.join('?' for _ in tag_map)})""", list(tag_map.values()))
+            self._finish_bulk_tag_change(conn)
+        self._notify("tags_added_many", paths, tag_map)
+        return tag_map
+    def bulk_remove_tags(self, paths, tag_ids):
+        paths, tag_ids = list(paths), list(tag_ids)
+        if not tag_ids: return
+        with self._get_connection() as conn:
+            self._load_selection(conn, paths)
+            conn.execute("INSERT INTO fts_sync_paused VALUES (1)")
+            conn.execute(f"DELETE FROM image_tags WHERE tag_id IN ({','.join('?' for _ in tag_ids)}) AND image_path IN (SELECT path FROM selection)", tag_ids)
+            self._finish_bulk_tag_change(conn)
+        self._notify("tags_removed_many", paths, tag_ids)
+    def bulk_add_to_album(self, album_id, paths):
+        paths = list(paths)
+        with self._get_connection() as conn:
+            self._load_selection(conn, paths)
+            conn.execute("INSERT OR IGNORE INTO album_images (album_id, image_path) SELECT ?, s.path FROM selection s JOIN images i ON i.path = s.path", (album_id,))
+            conn.execute("DELETE FROM selection")
+        self._notify("album_images_added_many", album_id, paths)
     def get_all_tags(self): return self._execute("SELECT id, name FROM tags ORDER BY name", fetch='all')
     def get_image_tags(self, path): return self._execute("SELECT t.id, t.name FROM tags t JOIN image_tags it ON t.id = it.tag_id WHERE it.image_path = ?", (path,), fetch='all')
     def add_tag_to_image(self, path, tag_name):
@@ -133,19 +1550,118 @@ class DatabaseManager:
         self._execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (tag_name,))
         tag_id = self._execute("SELECT id FROM tags WHERE name=?", (tag_name,), fetch='one')[0]
         self._execute("INSERT OR IGNORE INTO image_tags (image_path, tag_id) VALUES (?, ?)", (path, tag_id))
-    def remove_tag_from_image(self, path, tag_id): self._execute("DELETE FROM image_tags WHERE image_path=? AND tag_id=?", (path, tag_id))
-    def delete_tag(self, tag_id): self._execute("DELETE FROM tags WHERE id=?", (tag_id,))
-    def rename_tag(self, tag_id, new_name): self._execute("UPDATE tags SET name=? WHERE id=?", (new_name, tag_id))
+        self._notify("tag_added", path, tag_id, tag_name)
+    def remove_tag_from_image(self, path, tag_id): self._execute("DELETE FROM image_tags WHERE image_path=? AND tag_id=?", (path, tag_id)); self._notify("tag_removed", path, tag_id)
+    def delete_tag(self, tag_id): self._execute("DELETE FROM tags WHERE id=?", (tag_id,)); self._notify("tag_deleted", tag_id)
+    def rename_tag(self, tag_id, new_name): self._execute("UPDATE tags SET name=? WHERE id=?", (new_name, tag_id)); self._notify("tag_renamed", tag_id, new_name)
     def get_images_by_tag(self, tag_id): return {row[0] for row in self._execute("SELECT image_path FROM image_tags WHERE tag_id=?", (tag_id,), fetch='all')}
     def get_image_paths_with_tags(self, tag_names: list):
         if not tag_names: return set()
         placeholders = ','.join('?' for _ in tag_names)
         query = f""" SELECT DISTINCT image_path FROM image_tags WHERE tag_id IN (SELECT id FROM tags WHERE name IN ({placeholders})) """
         return {row[0] for row in self._execute(query, tuple(tag_names), fetch='all')}
+    def search_image_paths(self, term, limit=None):
+        match_query = build_fts_query(term)
+        if not match_query: return []
+        hidden = self.get_unmounted_root_ids()
+        query = f"SELECT path FROM images_fts WHERE images_fts MATCH ? {'AND ' + self._hidden_paths_condition(hidden, 'path') if hidden else ''} ORDER BY bm25(images_fts, 0.0, 10.0, 5.0, 1.0, 1.0, 8.0)"
+        params = (match_query, *hidden)
+        if limit: query += " LIMIT ?"; params += (limit,)
+        try: return [row[0] for row in self._execute(query, params, fetch='all')]
+        except sqlite3.OperationalError as e: print(f"Search error for {term!r}: {e}"); return []
+    def get_thumbnail_cache_size(self): return self._execute("SELECT COALESCE(SUM(bytes), 0) FROM thumbnails", fetch='one')[0]
+    def get_last_thumbnail_segment(self): return self._execute("SELECT MAX(segment) FROM thumbnails", fetch='one')[0]
+    def get_thumbnail_entry(self, key): return self._execute("SELECT segment, offset, bytes FROM thumbnails WHERE key=?", (key,), fetch='one')
+    def get_existing_thumbnail_keys(self, keys):
+        keys, found = list(keys), set()
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            found.update(row[0] for row in self._execute(f"SELECT key FROM thumbnails WHERE key IN ({','.join('?' for _ in chunk)})", tuple(chunk), fetch='all'))
+        return found
+    def get_thumbnail_entries_for_source(self, path, exclude_key=None): return self._execute("SELECT key, bytes, segment FROM thumbnails WHERE source_path=? AND key<>?", (path, exclude_key or ""), fetch='all')
+    def add_thumbnail_entry(self, key, path, size, last_access, segment=None, offset=None):
+        old = self._execute("SELECT bytes FROM thumbnails WHERE key=?", (key,), fetch='one')
+        self._execute("INSERT OR REPLACE INTO thumbnails (key, source_path, bytes, last_access, segment, offset) VALUES (?, ?, ?, ?, ?, ?)", (key, path, size, last_access, segment, offset))
+        return old[0] if old else 0
+    def rekey_thumbnail_entries(self, rows): self._executemany("UPDATE OR REPLACE thumbnails SET key=?, source_path=? WHERE key=?", rows)
+    def touch_thumbnail_entries(self, rows): self._executemany("UPDATE thumbnails SET last_access=? WHERE key=?", rows)
+    def get_least_recent_thumbnails(self, limit): return self._execute("SELECT key, bytes, segment FROM thumbnails ORDER BY last_access LIMIT ?", (limit,), fetch='all')
+    def delete_thumbnail_entries(self, keys): self._executemany("DELETE FROM thumbnails WHERE key=?", [(k,) for k in keys])
+    def get_thumbnail_segment_usage(self): return self._execute("SELECT segment, SUM(bytes) FROM thumbnails WHERE segment IS NOT NULL GROUP BY segment", fetch='all')
+    def get_thumbnail_segment_entries(self, segment): return self._execute("SELECT key, offset, bytes FROM thumbnails WHERE segment=?", (segment,), fetch='all')
+    def move_thumbnail_entry(self, key, segment, offset): self._execute("UPDATE thumbnails SET segment=?, offset=? WHERE key=?", (segment, offset, key))
     def get_tag_id_by_name(self, name):
         result = self._execute("SELECT id FROM tags WHERE name = ?", (name,), fetch='one')
         return result[0] if result else None
 
+class GalleryFilter:
+    # 갤러리 보기 조건. DatabaseManager.query_images 가 인덱스를 타는 하나의 SQL 로 컴파일한다.
+    # sort="relevance" 는 검색어가 있을 때만 관련도순이고, 없으면 최신순이다.
+    # facets: {"model"/"sampler"/"scheduler"/"lora": (값, ...) 중 하나라도, "cfg"/"steps"/"seed"/...: (최소 또는 None, 최대 또는 None)}
+    __slots__ = ("favorites", "album_id", "tag_id", "blacklist", "search", "sort", "facets")
+    def __init__(self, favorites=False, album_id=None, tag_id=None, blacklist=(), search="", sort="relevance", facets=None):
+        self.favorites, self.album_id, self.tag_id, self.blacklist, self.search, self.sort = favorites, album_id, tag_id, tuple(blacklist), search, sort
+        self.facets = dict(facets or {})
+    @property
+    def effective_sort(self):
+        return "newest" if self.sort == "relevance" and not self.search.strip() else self.sort
+
+# --- 라이브러리 모델 (소속/순위/즐겨찾기) ---
+def bitset_from_ids(ids):
+    ids = list(ids)
+    if not ids: return 0
+    data = bytearray(max(ids) // 8 + 1)
+    for i in ids: data[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(data, 'little')
+
+class LibraryModel:
+    # 이미지마다 조밀한 정수 id 를 주고 (오래된 것 -> 최근 순, 새 파일은 뒤에 붙는다), 즐겨찾기를 파이썬 정수 비트셋으로 들고 있는다.
+    # 보기 모드 필터는 DB(query_images)가 맡고, 이 모델은 썸네일 셀의 즐겨찾기 표시와 새 파일 판별/정렬(rank)처럼 행마다 DB 를 부르기엔 잦은 조회만 맡는다.
+    # (앨범/태그/블랙리스트 비트셋으로 보기를 거르던 경로는 검색·파라미터 필터·정렬·페이지를 함께 처리하는 query_images 와 결과가 어긋나 없앴다.)
+    # DatabaseManager 의 변경 알림으로 동기화되며, 삭제된 id 는 재사용하지 않는다.
+    __slots__ = ("paths", "ids", "favorites", "loaded", "lock")
+    def __init__(self, db=None):
+        self.paths, self.ids, self.favorites = [], {}, 0
+        self.loaded, self.lock = False, threading.RLock()
+        if db is not None: db.add_listener(self.on_db_event)
+    def load(self, db):
+        images = db.get_library_snapshot()
+        with self.lock:
+            self.paths = [path for path, _ in images]
+            self.ids = {path: i for i, path in enumerate(self.paths)}
+            self.favorites = bitset_from_ids(i for i, (_, is_fav) in enumerate(images) if is_fav)
+            self.loaded = True
+    def __len__(self): return len(self.ids)
+    def __contains__(self, path): return path in self.ids
+    def rank(self, path): return self.ids.get(path, -1)
+    def is_favorite(self, path):
+        i = self.ids.get(path)
+        return i is not None and self.favorites >> i & 1 == 1
+    def _set_bit(self, mask, path, on):
+        i = self.ids.get(path)
+        if i is None: return mask
+        return mask | (1 << i) if on else mask & ~(1 << i)
+    def _set_bits(self, mask, paths, on):
+        bits = bitset_from_ids(self.ids[p] for p in paths if p in self.ids)
+        return mask | bits if on else mask & ~bits
+    def on_db_event(self, event, *args):
+        if not self.loaded: return
+        with self.lock:
+            if event == "favorite": self.favorites = self._set_bit(self.favorites, args[0], args[1])
+            elif event == "favorite_many": self.favorites = self._set_bits(self.favorites, args[0], args[1])
+            elif event == "files_changed": self._apply_file_changes(*args)
+    def _apply_file_changes(self, added, gone, moves):
+        for old_path, new_path in moves:
+            i = self.ids.pop(old_path, None)
+            if i is not None: self.ids[new_path] = i; self.paths[i] = new_path
+        # 지워진 id 들로 마스크를 한 번에 만들어 한 번만 AND-NOT 한다 (경로마다 큰 정수 연산을 하면 배치 하나가 O(k·N)).
+        cleared = [i for i in (self.ids.pop(path, None) for path in gone) if i is not None]
+        for i in cleared: self.paths[i] = None
+        if cleared: self.favorites &= ~bitset_from_ids(cleared)
+        for path in added:
+            if path in self.ids: continue
+            self.ids[path] = len(self.paths); self.paths.append(path)
+
 class TranslationWindow(ctk.CTkToplevel):
     def __init__(self, parent, original_text, translated_map):
         super().__init__(parent)
@@ -171,49 +1687,145 @@ class TranslationWindow(ctk.CTkToplevel):
         ctk.CTkButton(self, text="수정된 번역을 사전에 저장", command=self.save_to_dictionary).pack(pady=10)
 
     def save_to_dictionary(self):
-        for orig, entry_widget in self.translation_entries.items():
-            self.app.translator.custom_dict[orig] = entry_widget.get()
-        self.app.translator.save_custom_translations()
+        self.app.db.update_custom_translations({orig: entry_widget.get() for orig, entry_widget in self.translation_entries.items()})
         messagebox.showinfo("저장 완료", "번역 내용이 사용자 사전에 저장되었습니다.")
         self.destroy()
 
+# --- 번역 엔진 ---
+def split_prompt_fragments(text): return [p.strip() for p in text.replace('\n', ',').split(',') if p.strip()]
+
+class TranslationBackend:
+    # translate_batch(texts, dest) 는 texts 와 같은 순서·길이의 번역 리스트를 돌려준다. 엔진의 작업 스레드들에서 동시에 호출된다.
+    name, max_batch_chars = "base", 4500
+    def translate_batch(self, texts, dest): raise NotImplementedError
+
+class GoogleTranslateBackend(TranslationBackend):
+    # 조각들을 줄바꿈으로 이어 한 요청으로 보낸다. 돌아온 줄 수가 어긋나면 그 묶음만 조각별 요청으로 다시 보낸다.
+    name = "google"
+    def __init__(self): self._local = threading.local()
+    def _translator(self):
+        translator = getattr(self._local, 'translator', None)
+        if translator is None: translator = self._local.translator = Translator()
+        return translator
+    def translate_batch(self, texts, dest):
+        translator = self._translator()
+        lines = translator.translate("\n".join(texts), dest=dest).text.split("\n")
+        if len(lines) == len(texts): return [line.strip() for line in lines]
+        return [translator.translate(text, dest=dest).text for text in texts]
+
+class HttpTranslateBackend(TranslationBackend):
+    # LibreTranslate 호환 API (POST, q 에 문자열 배열). 자체 호스팅 서버나 테스트용 로컬 대역 서버에 쓴다.
+    name = "http"
+    def __init__(self, url, api_key=None, timeout=30): self.url, self.api_key, self.timeout = url, api_key, timeout
+    def translate_batch(self, texts, dest):
+        payload = {"q": list(texts), "source": "auto", "target": dest, "format": "text"}
+        if self.api_key: payload["api_key"] = self.api_key
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode('utf-8'), headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response: translated = json.load(response)["translatedText"]
+        if isinstance(translated, str): translated = [translated]
+        if len(translated) != len(texts): raise ValueError(f"번역 서버가 {len(texts)}개 중 {len(translated)}개만 돌려주었습니다.")
+        return translated
+
+class DictionaryBackend(TranslationBackend):
+    # 오프라인 백엔드. 사전에 없는 조각은 원문을 그대로 돌려주며, latency 로 요청당 왕복 지연을 흉내 낼 수 있다.
+    name = "dictionary"
+    def __init__(self, entries=None, latency=0.0): self.entries, self.latency = dict(entries or {}), latency
+    @classmethod
+    def from_file(cls, path):
+        if not path: return cls()
+        with open(path, 'r', encoding='utf-8') as f: return cls(json.load(f))
+    def translate_batch(self, texts, dest):
+        if self.latency: time.sleep(self.latency)
+        return [self.entries.get(text, text) for text in texts]
+
+class TranslationEngine:
+    # 조각을 중복 제거한 뒤 사용자 사전 → 번역 캐시(SQLite) → 백엔드 순으로 찾는다.
+    # 백엔드 요청은 개수(batch_size)와 글자 수(max_batch_chars) 상한으로 묶고, 최대 workers 개까지 동시에 보낸다.
+    def __init__(self, db, backend, workers=4, batch_size=50):
+        self.db, self.backend, self.batch_size = db, backend, batch_size
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="translate")
+    def batches(self, texts):
+        batch, chars = [], 0
+        for text in texts:
+            if batch and (len(batch) >= self.batch_size or chars + len(text) + 1 > self.backend.max_batch_chars): yield batch; batch, chars = [], 0
+            batch.append(text); chars += len(text) + 1
+        if batch: yield batch
+    def translate(self, fragments, dest='ko'):
+        # 반환: ({조각: 번역}, [예외]). 실패한 묶음의 조각은 원문으로 채우고 캐시하지 않는다.
+        # 원문이 그대로 돌아온 조각(사전에 없는 단어 등)도 캐시하지 않아, 나중에 더 나은 백엔드로 바꾸면 다시 물어본다.
+        unique = list(dict.fromkeys(fragments))
+        result = self.db.get_custom_translations(unique)
+        pending = [f for f in unique if f not in result]
+        if pending:
+            result.update(self.db.get_cached_translations(pending, dest))
+            pending = [f for f in pending if f not in result]
+        fresh, errors = {}, []
+        futures = [(batch, self.executor.submit(self.backend.translate_batch, batch, dest)) for batch in self.batches(pending)]
+        for batch, future in futures:
+            try: fresh.update(zip(batch, future.result()))
+            except Exception as e: errors.append(e); result.update((f, f) for f in batch)
+        cacheable = {f: t for f, t in fresh.items() if t != f}
+        if cacheable: self.db.put_cached_translations(cacheable, dest, self.backend.name)
+        result.update(fresh)
+        return result, errors
+    def shutdown(self): self.executor.shutdown(wait=False, cancel_futures=True)
+
 class TranslatorService:
     def __init__(self, app):
         self.app = app
-        self.custom_dict = self.load_custom_translations()
-    def load_custom_translations(self):
+        self.import_legacy_dictionary()
+        self.engine = TranslationEngine(app.db, self.create_backend(app.config), workers=app.config.get("translation_workers", 4))
+    @staticmethod
+    def create_backend(config):
+        backend = config.get("translation_backend", "google")
+        if backend == "http": return HttpTranslateBackend(config.get("translation_server_url", "http://localhost:5000/translate"), config.get("translation_api_key"))
+        if backend == "dictionary": return DictionaryBackend.from_file(config.get("translation_dictionary_file"))
+        return GoogleTranslateBackend()
+    def import_legacy_dictionary(self):
+        # 예전 JSON 사전은 한 번만 DB 로 가져오고, 다시 가져오지 않도록 이름을 바꿔 백업으로 남긴다.
+        if not os.path.exists(CUSTOM_TRANSLATIONS_FILE): return
         try:
-            with open(CUSTOM_TRANSLATIONS_FILE, 'r', encoding='utf-8') as f: return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            default_dict = {"1girl": "소녀 1명", "masterpiece": "걸작", "best quality": "최고 품질"}
-            self.save_custom_translations(default_dict)
-            return default_dict
-    def save_custom_translations(self, data=None):
-        if data is None: data = self.custom_dict
-        with open(CUSTOM_TRANSLATIONS_FILE, 'w', encoding='utf-8') as f: json.dump(data, f, indent=4, ensure_ascii=False)
-    def translate(self, text_to_translate):
-        original_parts = [p.strip() for p in text_to_translate.replace('\n',',').split(',') if p.strip()]
-        if not original_parts: return {}, "Empty"
-        
-        translated_map, parts_for_google = {}, []
-        for part in original_parts:
-            if part in self.custom_dict:
-                translated_map[part] = self.custom_dict[part]
-            else:
-                parts_for_google.append(part)
-        
-        if parts_for_google:
-            try:
-                translator = Translator()
-                for part in parts_for_google:
-                    translated_map[part] = translator.translate(part, dest='ko').text
-            except Exception as e:
-                messagebox.showerror("Google 번역 오류", f"오류: {e}")
-                for part in parts_for_google:
-                    translated_map[part] = part
-        
-        final_map = {orig: translated_map[orig] for orig in original_parts}
-        return final_map, "Hybrid"
+            with open(CUSTOM_TRANSLATIONS_FILE, 'r', encoding='utf-8') as f: count = self.app.db.import_custom_translations(json.load(f))
+            os.replace(CUSTOM_TRANSLATIONS_FILE, CUSTOM_TRANSLATIONS_FILE + ".imported")
+            print(f"Imported {count} custom translations from {CUSTOM_TRANSLATIONS_FILE}")
+        except (OSError, json.JSONDecodeError, AttributeError) as e: print(f"Error importing {CUSTOM_TRANSLATIONS_FILE}: {e}")
+    def translate(self, text_to_translate, dest='ko'):
+        fragments = split_prompt_fragments(text_to_translate)
+        if not fragments: return {}, []
+        translated, errors = self.engine.translate(fragments, dest)
+        return {f: translated[f] for f in fragments}, errors
+    def translate_async(self, text_to_translate, callback, dest='ko'):
+        # callback(번역 맵 또는 None, [예외]) 은 작업 스레드에서 호출된다.
+        def run():
+            try: result = self.translate(text_to_translate, dest)
+            except Exception as e: result = (None, [e])
+            finally: self.engine.db.release_connection()
+            callback(*result)
+        threading.Thread(target=run, daemon=True).start()
+
+class ImagePyramid:
+    # 원본은 draft()(JPEG 는 DCT 단계에서 1/2~1/8 로 디코딩)와 reduce()(정수배 박스 축소)로 화면 크기 근처까지만 줄여 보관하고,
+    # 그 아래로 절반씩 줄인 레벨 몇 개를 더 둔다. 원본 해상도 이미지는 디코딩 직후 버리므로 상세 창이 들고 있는 메모리는 화면 크기에 묶인다.
+    # 단 draft() 는 JPEG 에만 효과가 있어 PNG/WebP 는 reduce() 전에 원본 해상도로 한 번 전부 디코딩된다. 그 버퍼는 줄인 직후 놓으므로
+    # 최대 메모리는 원본 한 장 + 화면 크기 레벨이고, PIL 의 MAX_IMAGE_PIXELS 를 넘는 원본만 열지 않는다 (상세 창은 썸네일 미리보기를 계속 보여 준다).
+    def __init__(self, fp, screen_size, min_side=256):
+        with Image.open(fp) as img:
+            self.source_size = img.size
+            if img.format != "JPEG" and Image.MAX_IMAGE_PIXELS and img.width * img.height > Image.MAX_IMAGE_PIXELS:
+                raise ValueError(f"{img.format} image too large to decode: {img.width}x{img.height}")
+            img.draft("RGB", screen_size)
+            factor = max(1, min(img.width // screen_size[0], img.height // screen_size[1]))
+            base = img.reduce(factor) if factor > 1 else img.copy()
+        del img  # 원본 해상도 버퍼를 레벨을 만들기 전에 놓는다
+        if base.mode not in ("RGB", "RGBA"): base = base.convert("RGBA" if "A" in base.getbands() or "transparency" in base.info else "RGB")
+        self.levels = [base]
+        while min(self.levels[-1].size) // 2 >= min_side: self.levels.append(self.levels[-1].reduce(2))
+    def level_for(self, size):
+        # 요청 크기 이상인 레벨 중 가장 작은 것. 모두 작으면 가장 큰 레벨.
+        return next((level for level in reversed(self.levels) if level.width >= size[0] and level.height >= size[1]), self.levels[0])
+    def render(self, size):
+        level = self.level_for(size)
+        return level if level.size == tuple(size) else level.resize(size, Image.LANCZOS)
 
 class DetailWindow(ctk.CTkToplevel):
     def __init__(self, parent, file_path):
@@ -221,13 +1833,13 @@ class DetailWindow(ctk.CTkToplevel):
         self.transient(parent); self.grab_set()
         self.gallery_app, self.db, self.file_path = parent, parent.db, file_path
         self.title(f"상세 정보: {os.path.basename(file_path)}"); self.geometry("1300x800"); self.minsize(1000, 600)
-        self.resize_job = None
-        
-        try:
-            self.pil_image = Image.open(self.file_path)
-        except Exception as e:
-            print(f"Error opening image {file_path}: {e}")
-            self.pil_image = None
+        self.resize_job, self.pyramid, self.preview, self.render_generation = None, None, None, 0
+        # 캐시된 썸네일을 먼저 보여 주고, 화면 크기에 맞춘 피라미드는 백그라운드에서 디코딩한다.
+        thumbnail = self.gallery_app.thumbnail_store.get(file_path)
+        if thumbnail:
+            try: self.preview = Image.open(io.BytesIO(thumbnail)); self.preview.load()
+            except Exception as e: print(f"Error reading cached thumbnail {file_path}: {e}")
+        threading.Thread(target=self.load_pyramid, args=((self.winfo_screenwidth(), self.winfo_screenheight()),), daemon=True).start()
         
         self.grid_columnconfigure(0, weight=1); self.grid_columnconfigure(1, weight=1); self.grid_rowconfigure(0, weight=1)
         
@@ -246,16 +1858,30 @@ class DetailWindow(ctk.CTkToplevel):
         right_panel.grid(row=0, column=1, padx=(0,10), pady=10, sticky="nsew")
         right_panel.grid_columnconfigure(0, weight=1)
         
-        self.parsed_data = parse_image_metadata(self.pil_image.info if self.pil_image else {})
+        try: self.image_info = read_image_metadata(self.file_path)
+        except Exception as e: print(f"Error reading metadata {file_path}: {e}"); self.image_info = {}
+        self.parsed_data = parse_image_metadata(self.image_info)
         self.create_info_widgets(right_panel)
 
+    def load_pyramid(self, screen_size):
+        try: pyramid = ImagePyramid(self.file_path, screen_size)
+        except Exception as e: print(f"Error opening image {self.file_path}: {e}"); return
+        self.run_on_ui(self.on_pyramid_ready, pyramid)
+    def run_on_ui(self, callback, *args):
+        try: self.after(0, callback, *args)
+        except (RuntimeError, tk.TclError): pass  # 창이 이미 닫힌 경우
+    def on_pyramid_ready(self, pyramid):
+        if not self.winfo_exists(): return
+        self.pyramid, self.preview = pyramid, None
+        self.perform_resize(None)
+
     def on_resize(self, event):
         if self.resize_job:
             self.after_cancel(self.resize_job)
         self.resize_job = self.after(100, lambda: self.perform_resize(event))
 
     def perform_resize(self, event):
-        if not self.pil_image:
+        if not self.pyramid and not self.preview:
             return
 
         # Get container size
@@ -265,7 +1891,7 @@ class DetailWindow(ctk.CTkToplevel):
         if available_width <= 1 or available_height <= 1:
             return
 
-        img_w, img_h = self.pil_image.size
+        img_w, img_h = self.pyramid.source_size if self.pyramid else self.preview.size
         img_aspect = img_w / img_h
 
         new_w = available_width
@@ -278,9 +1904,20 @@ class DetailWindow(ctk.CTkToplevel):
         new_w = max(50, new_w)
         new_h = max(50, new_h)
 
-        # Resize with PIL and convert to Tkinter-compatible image
-        resized = self.pil_image.resize((new_w, new_h), Image.LANCZOS)
-        tk_image = ImageTk.PhotoImage(resized)
+        if not self.pyramid:
+            self.show_image(self.preview.resize((new_w, new_h), Image.BILINEAR)); return
+        # 가장 가까운 큰 레벨에서 백그라운드로 리샘플링하고, 그 사이 더 새로운 요청이 있었으면 결과를 버린다.
+        self.render_generation += 1
+        threading.Thread(target=self.render_in_background, args=(self.pyramid, (new_w, new_h), self.render_generation), daemon=True).start()
+
+    def render_in_background(self, pyramid, size, generation):
+        self.run_on_ui(self.on_render_ready, pyramid.render(size), generation)
+    def on_render_ready(self, resized, generation):
+        if generation == self.render_generation and self.winfo_exists(): self.show_image(resized)
+
+    def show_image(self, pil_image):
+        # Convert to Tkinter-compatible image
+        tk_image = ImageTk.PhotoImage(pil_image)
 
         self.image_label.configure(image=tk_image)
         self.image_label.image = tk_image  # Keep reference to avoid garbage collection
@@ -294,6 +1931,7 @@ class DetailWindow(ctk.CTkToplevel):
         self.fav_button.pack(side="left")
         
         ctk.CTkButton(action_frame, text="유사 이미지 찾기", command=lambda: self.gallery_app.find_similar_images(self.file_path)).pack(side="left", padx=10)
+        ctk.CTkButton(action_frame, text="시각적으로 유사한 이미지", command=lambda: self.gallery_app.find_visually_similar(self.file_path)).pack(side="left")
         
         tab_view = ctk.CTkTabview(parent)
         tab_view.pack(fill="x", expand=True, padx=10)
@@ -307,10 +1945,10 @@ class DetailWindow(ctk.CTkToplevel):
         raw_tab_view_inner.pack(fill="both", expand=True)
         raw_prompt_box = ctk.CTkTextbox(raw_tab_view_inner.add("Prompt (raw)"), wrap="none")
         raw_prompt_box.pack(fill="both", expand=True)
-        raw_prompt_box.insert("1.0", json.dumps(self.pil_image.info.get("prompt", {}), indent=4, ensure_ascii=False) if self.pil_image else "")
+        raw_prompt_box.insert("1.0", json.dumps(self.image_info.get("prompt", {}), indent=4, ensure_ascii=False))
         raw_workflow_box = ctk.CTkTextbox(raw_tab_view_inner.add("Workflow (raw)"), wrap="none")
         raw_workflow_box.pack(fill="both", expand=True)
-        raw_workflow_box.insert("1.0", json.dumps(self.pil_image.info.get("workflow", {}), indent=4, ensure_ascii=False) if self.pil_image else "")
+        raw_workflow_box.insert("1.0", json.dumps(self.image_info.get("workflow", {}), indent=4, ensure_ascii=False))
         
         tag_section_frame = ctk.CTkFrame(parent)
         tag_section_frame.pack(fill="x", expand=True, padx=10, pady=10)
@@ -348,15 +1986,16 @@ class DetailWindow(ctk.CTkToplevel):
         if not text_to_translate:
             messagebox.showinfo("번역", "번역할 내용이 없습니다.")
             return
-        try:
-            self.gallery_app.status_label.configure(text="번역 중...")
-            self.gallery_app.update_idletasks()
-            translated_map, src_lang = self.gallery_app.translator.translate(text_to_translate)
-            TranslationWindow(self, text_to_translate, translated_map)
-            self.gallery_app.status_label.configure(text="번역 완료.")
-        except Exception as e:
-            messagebox.showerror("번역 오류", f"번역 중 오류가 발생했습니다:\n{e}")
-            self.gallery_app.status_label.configure(text="번역 오류.")
+        self.gallery_app.status_label.configure(text="번역 중...")
+        self.gallery_app.translator.translate_async(text_to_translate, lambda translated_map, errors: self.run_on_ui(self.on_translation_ready, text_to_translate, translated_map, errors))
+    def on_translation_ready(self, text_to_translate, translated_map, errors):
+        if not self.winfo_exists(): return
+        if translated_map is None:
+            messagebox.showerror("번역 오류", f"번역 중 오류가 발생했습니다:\n{errors[0]}", parent=self)
+            self.gallery_app.status_label.configure(text="번역 오류."); return
+        if errors: messagebox.showwarning("번역 오류", f"일부 조각을 번역하지 못해 원문을 그대로 표시합니다:\n{errors[0]}", parent=self)
+        TranslationWindow(self, text_to_translate, translated_map)
+        self.gallery_app.status_label.configure(text="번역 일부 실패." if errors else "번역 완료.")
     
     def display_tags(self):
         for widget in self.tag_display_frame.winfo_children(): widget.destroy()
@@ -382,7 +2021,7 @@ class DetailWindow(ctk.CTkToplevel):
         is_fav = not (self.db.get_image_data(self.file_path)[0] == 1)
         self.db.set_favorite(self.file_path, is_fav)
         self.fav_button.configure(text="★" if is_fav else "☆")
-        self.gallery_app.populate_gallery()
+        self.gallery_app.refresh_gallery()
         
     def copy_to_clipboard(self, content):
         self.clipboard_clear()
@@ -391,13 +2030,12 @@ class DetailWindow(ctk.CTkToplevel):
 class SettingsWindow(ctk.CTkToplevel):
     def __init__(self, parent):
         super().__init__(parent)
-        self.transient(parent); self.grab_set(); self.title("설정"); self.geometry("500x350"); self.app = parent
+        self.transient(parent); self.grab_set(); self.title("설정"); self.geometry("560x400"); self.app = parent
         self.grid_columnconfigure(1, weight=1)
         
         ctk.CTkLabel(self, text="이미지 폴더:").grid(row=0, column=0, padx=20, pady=10, sticky="w")
-        self.folder_entry = ctk.CTkEntry(self, width=250); self.folder_entry.grid(row=0, column=1, padx=5, pady=10, sticky="ew")
-        self.folder_entry.insert(0, self.app.config.get("image_folder", "images"))
-        ctk.CTkButton(self, text="찾아보기", command=self.browse_folder).grid(row=0, column=2, padx=5)
+        ctk.CTkLabel(self, text=", ".join(label for _, _, label, _ in self.app.db.get_roots()), anchor="w").grid(row=0, column=1, padx=5, pady=10, sticky="ew")
+        ctk.CTkButton(self, text="폴더 관리", command=self.open_roots_window).grid(row=0, column=2, padx=5)
         
         ctk.CTkLabel(self, text="썸네일 크기:").grid(row=1, column=0, padx=20, pady=10, sticky="w")
         self.thumb_size_menu = ctk.CTkOptionMenu(self, values=["120x160", "150x200", "180x240", "210x280"])
@@ -414,24 +2052,210 @@ class SettingsWindow(ctk.CTkToplevel):
         self.filter_tags_entry.grid(row=3, column=1, columnspan=2, padx=5, pady=10, sticky="ew")
         self.filter_tags_entry.insert(0, ", ".join(self.app.config.get("filtered_tags", [])))
         
-        ctk.CTkButton(self, text="저장 및 다시 시작", command=self.save_and_restart).grid(row=4, column=0, columnspan=3, pady=20)
+        ctk.CTkLabel(self, text="썸네일 캐시 (MB):").grid(row=4, column=0, padx=20, pady=10, sticky="w")
+        self.thumb_cache_entry = ctk.CTkEntry(self, width=100)
+        self.thumb_cache_entry.grid(row=4, column=1, padx=5, pady=10, sticky="w")
+        self.thumb_cache_entry.insert(0, str(self.app.config.get("thumbnail_cache_mb", 1024)))
+        self.thumb_packed_var = tk.BooleanVar(value=self.app.config.get("thumbnail_packed", False))
+        ctk.CTkCheckBox(self, text="세그먼트 파일에 묶어서 저장", variable=self.thumb_packed_var).grid(row=4, column=2, padx=5, pady=10, sticky="w")
+        
+        ctk.CTkButton(self, text="저장 및 다시 시작", command=self.save_and_restart).grid(row=5, column=0, columnspan=3, pady=20)
+
+    def open_roots_window(self):
+        # 폴더 변경은 재시작 없이 바로 반영된다.
+        self.destroy(); self.app.open_roots_window()
 
-    def browse_folder(self):
-        folder = filedialog.askdirectory()
-        if folder:
-            self.folder_entry.delete(0, "end")
-            self.folder_entry.insert(0, folder)
-            
     def save_and_restart(self):
         w, h = map(int, self.thumb_size_menu.get().split('x'))
         filtered_tags = [tag.strip().lower() for tag in self.filter_tags_entry.get().split(',') if tag.strip()]
-        new_config = {"image_folder": self.folder_entry.get(), "thumbnail_width": w, "thumbnail_height": h, "theme": self.theme_menu.get(), "filtered_tags": filtered_tags}
+        try: cache_mb = max(16, int(self.thumb_cache_entry.get()))
+        except ValueError: cache_mb = self.app.config.get("thumbnail_cache_mb", 1024)
+        new_config = dict(self.app.config, thumbnail_width=w, thumbnail_height=h, theme=self.theme_menu.get(), filtered_tags=filtered_tags, thumbnail_cache_mb=cache_mb, thumbnail_packed=self.thumb_packed_var.get())
         with open(CONFIG_FILE, 'w') as f:
             json.dump(new_config, f, indent=4)
         if messagebox.askokcancel("재시작 필요", "설정을 적용하려면 프로그램을 다시 시작해야 합니다.\n지금 다시 시작하시겠습니까?"):
             self.app.restart_program()
         self.destroy()
 
+class LibraryRootsWindow(ctk.CTkToplevel):
+    # 라이브러리 루트 폴더 관리. 추가/올리기는 그 루트만 스캔하고, 내리기는 색인을 남긴 채 숨기며, 경로 변경은 다시 스캔/파싱 없이 경로만 바꾼다.
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.transient(parent); self.grab_set(); self.title("라이브러리 폴더"); self.geometry("760x420"); self.app, self.db = parent, parent.db
+        self.grid_columnconfigure(0, weight=1); self.grid_rowconfigure(0, weight=1)
+        self.list_frame = ctk.CTkScrollableFrame(self); self.list_frame.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
+        self.list_frame.grid_columnconfigure(1, weight=1)
+        ctk.CTkButton(self, text="폴더 추가", command=self.add_root).grid(row=1, column=0, pady=(0, 10))
+        self.populate()
+
+    def populate(self):
+        for widget in self.list_frame.winfo_children(): widget.destroy()
+        counts = self.db.get_root_image_counts()
+        for row, (root_id, path, label, mounted) in enumerate(self.db.get_roots()):
+            var = tk.BooleanVar(value=bool(mounted))
+            ctk.CTkSwitch(self.list_frame, text="", width=50, variable=var, command=lambda rid=root_id, v=var: self.toggle_mounted(rid, v.get())).grid(row=row, column=0, padx=5, pady=4)
+            state = self.app.root_progress.get(root_id, (label, "마운트됨" if mounted else "내려짐"))[1]
+            ctk.CTkLabel(self.list_frame, text=f"{label} — {counts.get(root_id, 0)}장, {state}\n{path}", anchor="w", justify="left").grid(row=row, column=1, padx=5, sticky="w")
+            ctk.CTkButton(self.list_frame, text="이름 변경", width=80, command=lambda rid=root_id, old=label: self.rename_root(rid, old)).grid(row=row, column=2, padx=2)
+            ctk.CTkButton(self.list_frame, text="경로 변경", width=80, command=lambda rid=root_id, old=label: self.relocate_root(rid, old)).grid(row=row, column=3, padx=2)
+            ctk.CTkButton(self.list_frame, text="제거", width=60, fg_color="red", command=lambda rid=root_id, old=label: self.remove_root(rid, old)).grid(row=row, column=4, padx=2)
+
+    def add_root(self):
+        folder = filedialog.askdirectory(parent=self)
+        if folder and self.app.add_library_root(folder, parent=self): self.populate()
+
+    def toggle_mounted(self, root_id, mounted):
+        self.app.set_library_root_mounted(root_id, mounted); self.populate()
+
+    def rename_root(self, root_id, old_label):
+        new_label = ctk.CTkInputDialog(text=f"'{old_label}'의 새 이름을 입력하세요:", title="폴더 이름 변경").get_input()
+        if new_label and new_label != old_label: self.db.rename_root(root_id, new_label); self.populate()
+
+    def relocate_root(self, root_id, label):
+        # 드라이브를 옮기거나 마운트 지점이 바뀐 경우. 태그/앨범/즐겨찾기/메타데이터/썸네일이 그대로 이어진다.
+        folder = filedialog.askdirectory(parent=self, title=f"'{label}' 폴더의 새 위치")
+        if folder and self.app.relocate_library_root(root_id, folder, parent=self): self.populate()
+
+    def remove_root(self, root_id, label):
+        if messagebox.askyesno("폴더 제거 확인", f"'{label}' 폴더를 라이브러리에서 제거하시겠습니까?\n이 폴더 이미지의 태그/앨범/즐겨찾기 정보가 삭제됩니다. (파일은 삭제되지 않습니다)", parent=self):
+            self.app.remove_library_root(root_id); self.populate()
+
+class FacetWindow(ctk.CTkToplevel):
+    # 생성 파라미터 패싯 필터. 체크/범위를 바꿀 때마다 갤러리를 다시 조회하고, 패싯별 개수는 백그라운드에서 다시 센다.
+    # 각 패싯의 개수는 그 패싯 자신을 뺀 나머지 조건으로 센다 (선택지를 넓힐 때 몇 장이 늘어나는지 보이도록).
+    CATEGORIES = (("model", "모델"), ("sampler", "샘플러"), ("scheduler", "스케줄러"), ("lora", "LoRA"))
+    RANGES = (("cfg", "CFG", float), ("steps", "Steps", int), ("seed", "Seed", int), ("width", "Width", int), ("height", "Height", int), ("denoise", "Denoise", float))
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("생성 파라미터 필터"); self.geometry("760x680"); self.app, self.db = parent, parent.db
+        self.count_generation = 0
+        self.grid_columnconfigure((0, 1), weight=1); self.grid_rowconfigure((0, 1), weight=1)
+        self.lists, self.vars = {}, {}
+        for i, (facet, label) in enumerate(self.CATEGORIES):
+            frame = ctk.CTkScrollableFrame(self, label_text=label)
+            frame.grid(row=i // 2, column=i % 2, padx=10, pady=(10, 0), sticky="nsew")
+            self.lists[facet] = frame
+
+        range_frame = ctk.CTkFrame(self); range_frame.grid(row=2, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+        self.range_entries = {}
+        for i, (facet, label, _) in enumerate(self.RANGES):
+            row, column = divmod(i, 3); column *= 3  # 한 줄에 세 개씩
+            ctk.CTkLabel(range_frame, text=label).grid(row=row, column=column, padx=(10, 2))
+            low, high = ctk.CTkEntry(range_frame, width=70, placeholder_text="최소"), ctk.CTkEntry(range_frame, width=70, placeholder_text="최대")
+            low.grid(row=row, column=column + 1, padx=2, pady=8); high.grid(row=row, column=column + 2, padx=(2, 10), pady=8)
+            lo, hi = self.app.facet_filters.get(facet, (None, None))
+            if lo is not None: low.insert(0, str(lo))
+            if hi is not None: high.insert(0, str(hi))
+            for entry in (low, high): entry.bind("<Return>", lambda e: self.apply_ranges())
+            self.range_entries[facet] = (low, high)
+        button_frame = ctk.CTkFrame(self, fg_color="transparent"); button_frame.grid(row=3, column=0, columnspan=2, pady=(0, 10))
+        ctk.CTkButton(button_frame, text="범위 적용", command=self.apply_ranges).pack(side="left", padx=5)
+        ctk.CTkButton(button_frame, text="모두 해제", command=self.clear_all).pack(side="left", padx=5)
+        self.status_label = ctk.CTkLabel(button_frame, text=""); self.status_label.pack(side="left", padx=10)
+        self.refresh_counts()
+
+    def refresh_counts(self):
+        self.count_generation += 1
+        generation, gallery_filter = self.count_generation, self.app.current_gallery_filter()
+        self.status_label.configure(text="개수 세는 중...")
+        def run():
+            try: counts = {facet: self.db.get_facet_counts(gallery_filter, facet) for facet, _ in self.CATEGORIES}
+            finally: self.db.release_connection()
+            try: self.after(0, self.show_counts, generation, counts)
+            except (RuntimeError, tk.TclError): pass  # 창이 이미 닫힌 경우
+        threading.Thread(target=run, daemon=True).start()
+
+    def show_counts(self, generation, counts):
+        if generation != self.count_generation or not self.winfo_exists(): return
+        for facet, rows in counts.items():
+            frame, selected = self.lists[facet], set(self.app.facet_filters.get(facet, ()))
+            for widget in frame.winfo_children(): widget.destroy()
+            rows = list(rows) + [(value, 0) for value in selected - {value for value, _ in rows}]
+            for value, count in rows:
+                var = tk.BooleanVar(value=value in selected)
+                ctk.CTkCheckBox(frame, text=f"{value} ({count})", variable=var, command=lambda f=facet, v=value, b=var: self.toggle(f, v, b.get())).pack(anchor="w", pady=1)
+        self.status_label.configure(text=f"{len(self.app.displayed_image_files)}{'+' if self.app.page_cursor is not None else ''}장 표시 중")
+
+    def toggle(self, facet, value, checked):
+        values = [v for v in self.app.facet_filters.get(facet, ()) if v != value] + ([value] if checked else [])
+        self.app.set_facet(facet, tuple(values) or None)
+        self.refresh_counts()
+
+    def apply_ranges(self):
+        for facet, _, cast in self.RANGES:
+            low, high = self.range_entries[facet]
+            try: bounds = tuple(cast(entry.get()) if entry.get().strip() else None for entry in (low, high))
+            except ValueError: messagebox.showwarning("범위 오류", f"{facet} 범위는 숫자로 입력하세요.", parent=self); return
+            self.app.facet_filters.pop(facet, None)
+            if bounds != (None, None): self.app.facet_filters[facet] = bounds
+        self.app.set_facet(None, None)
+        self.refresh_counts()
+
+    def clear_all(self):
+        for low, high in self.range_entries.values(): low.delete(0, "end"); high.delete(0, "end")
+        self.app.facet_filters.clear(); self.app.set_facet(None, None)
+        self.refresh_counts()
+
+class MetricsWindow(ctk.CTkToplevel):
+    # 모달이 아닌 창: 갤러리를 조작하면서 지표가 1초마다 갱신되는 것을 볼 수 있다.
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("성능 지표"); self.geometry("900x520"); self.app, self.refresh_job, self.profile_summary = parent, None, ""
+        self.grid_columnconfigure(0, weight=1); self.grid_rowconfigure(1, weight=1)
+
+        controls = ctk.CTkFrame(self, fg_color="transparent"); controls.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="ew")
+        self.enabled_var, self.tracing_var, self.profile_var = tk.BooleanVar(value=METRICS.enabled), tk.BooleanVar(value=METRICS.tracing), tk.BooleanVar(value=METRICS.profiler is not None)
+        ctk.CTkSwitch(controls, text="계측", variable=self.enabled_var, command=self.toggle_metrics).pack(side="left", padx=5)
+        ctk.CTkSwitch(controls, text="트레이스 기록", variable=self.tracing_var, command=self.toggle_tracing).pack(side="left", padx=5)
+        ctk.CTkSwitch(controls, text="cProfile (UI 스레드)", variable=self.profile_var, command=self.toggle_profile).pack(side="left", padx=5)
+        ctk.CTkButton(controls, text="Chrome trace 내보내기", width=150, command=self.export_trace).pack(side="right", padx=5)
+        ctk.CTkButton(controls, text="JSON 내보내기", width=110, command=self.export_json).pack(side="right", padx=5)
+        ctk.CTkButton(controls, text="초기화", width=70, command=METRICS.reset).pack(side="right", padx=5)
+
+        self.table = ctk.CTkTextbox(self, font=ctk.CTkFont(family="Courier", size=12), wrap="none")
+        self.table.grid(row=1, column=0, padx=10, pady=(0, 10), sticky="nsew")
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.refresh()
+
+    def refresh(self):
+        rows = METRICS.snapshot()
+        lines = [f"{'name':<30}{'count':>9}{'total ms':>11}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'bytes':>12}"]
+        lines += [f"{r['name'][:29]:<30}{r['count']:>9}{r['total_ms']:>11.1f}{r['mean_ms']:>9.2f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['max_ms']:>9.2f}{r['bytes']:>12}" for r in rows]
+        if not METRICS.enabled: lines.append("\n계측이 꺼져 있습니다. 위의 '계측' 스위치를 켜면 수집을 시작합니다.")
+        thumbnails = self.app.thumbnail_pipeline.stats()
+        lines.append(f"\n썸네일 파이프라인: 대기 {thumbnails['queued']}, 처리 중 {thumbnails['in_flight']}, 완료 {thumbnails['completed']}, {thumbnails['throughput']:.1f}장/초 | 트레이스 이벤트 {len(METRICS.trace)}개")
+        if self.profile_summary: lines.append("\n마지막 cProfile 요약 (누적 시간 상위 30개):\n" + self.profile_summary)
+        self.table.configure(state="normal"); self.table.delete("1.0", "end"); self.table.insert("1.0", "\n".join(lines)); self.table.configure(state="disabled")
+        self.refresh_job = self.after(1000, self.refresh)
+
+    def toggle_metrics(self):
+        METRICS.enabled = self.enabled_var.get()
+        self.app.config["metrics_enabled"] = METRICS.enabled
+        with open(CONFIG_FILE, 'w') as f: json.dump(self.app.config, f, indent=4)
+
+    def toggle_tracing(self):
+        METRICS.tracing = self.tracing_var.get()
+        if METRICS.tracing and not METRICS.enabled: self.enabled_var.set(True); self.toggle_metrics()
+
+    def toggle_profile(self):
+        if self.profile_var.get(): METRICS.start_profile(); return
+        path = filedialog.asksaveasfilename(parent=self, title="프로파일 저장", defaultextension=".prof", filetypes=[("pstats", "*.prof")])
+        self.profile_summary = METRICS.stop_profile(path or None)
+        if path: messagebox.showinfo("프로파일 저장", f"{path} 에 저장했습니다. (요약은 이 창 아래에 표시됨)", parent=self)
+
+    def export_json(self):
+        path = filedialog.asksaveasfilename(parent=self, title="지표 내보내기", defaultextension=".json", filetypes=[("JSON", "*.json")])
+        if path: METRICS.export_json(path)
+
+    def export_trace(self):
+        if not METRICS.trace: messagebox.showinfo("Chrome trace", "기록된 트레이스가 없습니다. '트레이스 기록'을 켠 뒤 다시 시도하세요.", parent=self); return
+        path = filedialog.asksaveasfilename(parent=self, title="Chrome trace 내보내기", defaultextension=".json", filetypes=[("Trace Event JSON", "*.json")])
+        if path: METRICS.export_chrome_trace(path)
+
+    def on_close(self):
+        if self.refresh_job: self.after_cancel(self.refresh_job)
+        self.destroy()
+
 class ManagementWindow(ctk.CTkToplevel):
     def __init__(self, parent):
         super().__init__(parent)
@@ -536,25 +2360,14 @@ class ManagementWindow(ctk.CTkToplevel):
             widget.destroy()
         self.trans_entries.clear()
 
-        search_term = self.trans_search_entry.get().lower()
-        
+        search_term = self.trans_search_entry.get().strip()
+
         if not search_term:
-            self.trans_count_label.configure(text="검색어를 입력하여 사전을 편집하세요.")
+            self.trans_count_label.configure(text=f"검색어를 입력하여 사전을 편집하세요. (전체 {self.db.count_custom_translations()}개)")
             return
 
-        full_dict = self.app.translator.custom_dict
-        filtered_items = [
-            (k, v) for k, v in full_dict.items() 
-            if search_term in k.lower() or search_term in v.lower()
-        ]
-
-        display_limit = 200 
-        displayed_count = 0
-
-        for i, (key, value) in enumerate(filtered_items):
-            if displayed_count >= display_limit:
-                break
-                
+        total, items = self.db.search_custom_translations(search_term, limit=200)
+        for i, (key, value) in enumerate(items):
             key_entry = ctk.CTkEntry(self.trans_scroll_frame)
             key_entry.insert(0, key)
             key_entry.grid(row=i, column=0, padx=5, pady=2, sticky="ew")
@@ -563,60 +2376,202 @@ class ManagementWindow(ctk.CTkToplevel):
             value_entry.insert(0, value)
             value_entry.grid(row=i, column=1, padx=5, pady=2, sticky="ew")
 
-            self.trans_entries[key] = (key_entry, value_entry)
-            displayed_count += 1
-        
-        if displayed_count < len(filtered_items):
-            self.trans_count_label.configure(text=f"{len(filtered_items)}개 중 {displayed_count}개 표시됨. (검색어 구체화 필요)")
+            self.trans_entries[key] = (key_entry, value_entry, value)
+
+        if len(items) < total:
+            self.trans_count_label.configure(text=f"{total}개 중 {len(items)}개 표시됨. (검색어 구체화 필요)")
         else:
-            self.trans_count_label.configure(text=f"{displayed_count}개 항목 표시됨.")
+            self.trans_count_label.configure(text=f"{len(items)}개 항목 표시됨.")
 
     def save_translations(self):
-        for original_key, (key_entry, value_entry) in self.trans_entries.items():
+        # 화면에 표시된 항목 중 바뀐 것만 지우거나 덮어쓴다.
+        upserts, deletes = {}, []
+        for original_key, (key_entry, value_entry, original_value) in self.trans_entries.items():
             new_key = key_entry.get()
             new_value = value_entry.get()
 
             if not new_key:
-                if original_key in self.app.translator.custom_dict:
-                     del self.app.translator.custom_dict[original_key]
+                deletes.append(original_key)
                 continue
-            
+
             if original_key != new_key:
-                if original_key in self.app.translator.custom_dict:
-                    del self.app.translator.custom_dict[original_key]
-            
-            self.app.translator.custom_dict[new_key] = new_value
+                deletes.append(original_key)
+
+            if original_key != new_key or new_value != original_value:
+                upserts[new_key] = new_value
+
+        self.db.update_custom_translations(upserts, deletes)
 
-        self.app.translator.save_custom_translations()
-        
         messagebox.showinfo("저장 완료", "번역 사전이 저장되었습니다.")
         self.filter_translations()
 
 
+class ThumbnailCell(ctk.CTkFrame):
+    def __init__(self, master, app, thumbnail_size):
+        super().__init__(master)
+        self.app, self.file_path, self.index = app, None, None
+        self.img_button = ctk.CTkButton(self, text="", fg_color="transparent", width=thumbnail_size[0], height=thumbnail_size[1], command=self.on_click)
+        self.img_button.pack(padx=5, pady=5)
+        self.img_button.bind("<Button-3>", self.on_right_click)
+        self.fav_button = ctk.CTkButton(self, text="☆", width=28, height=28, command=self.on_favorite)
+        self.checkbox_var = tk.BooleanVar(value=False)
+        self.checkbox = ctk.CTkCheckBox(self, text="", variable=self.checkbox_var, command=self.on_checkbox)
+        self.group_label = ctk.CTkLabel(self, text="", width=36, height=22, corner_radius=6, fg_color=("gray80", "gray25"))
+    def bind_item(self, index, file_path):
+        self.index, self.file_path = index, file_path
+        self.img_button.configure(image=self.app.get_thumbnail_image(file_path))
+        group = self.app.duplicate_groups.get(file_path) if self.app.current_view_mode == "Near Duplicates" else None
+        if group: self.group_label.configure(text=f"×{len(group)}"); self.group_label.place(in_=self.img_button, relx=0.0, rely=1.0, anchor="sw", x=5, y=-5)
+        else: self.group_label.place_forget()
+        if self.app.is_selection_mode:
+            self.fav_button.place_forget()
+            self.checkbox_var.set(file_path in self.app.selected_files)
+            self.checkbox.place(in_=self.img_button, relx=0.0, rely=0.0, anchor="nw", x=5, y=5)
+        else:
+            self.checkbox.place_forget()
+            self.fav_button.configure(text="★" if self.app.library.is_favorite(file_path) else "☆")
+            self.fav_button.place(in_=self.img_button, relx=1.0, rely=0.0, anchor="ne", x=-5, y=5)
+    def on_click(self):
+        if self.file_path: self.app.on_thumbnail_click(self.file_path)
+    def on_right_click(self, event):
+        if self.file_path and not self.app.is_selection_mode: self.app.show_context_menu(event, self.file_path)
+    def on_favorite(self):
+        if self.file_path: self.app.toggle_favorite(self.file_path)
+    def on_checkbox(self):
+        if self.file_path: self.app.on_checkbox_toggle(self.file_path, self.checkbox_var)
+
+class VirtualThumbnailGrid(ctk.CTkFrame):
+    # 화면에 보이는 행(+ overscan)만큼의 셀만 만들어 두고, 스크롤 위치에 따라 셀을 재사용한다.
+    def __init__(self, master, app, overscan_rows=2):
+        super().__init__(master)
+        self.app, self.overscan_rows = app, overscan_rows
+        self.items, self.cells, self.offset, self.columns = [], [], 0, 1
+        self.set_cell_size((180, 240))
+        self.grid_rowconfigure(0, weight=1); self.grid_columnconfigure(0, weight=1)
+        self.viewport = ctk.CTkFrame(self, fg_color="transparent", corner_radius=0)
+        self.viewport.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns", padx=(0, 3), pady=3)
+        self.viewport.bind("<Configure>", lambda e: self.relayout())
+        self.bind_all("<MouseWheel>", self.on_mouse_wheel, add="+")
+        self.bind_all("<Button-4>", self.on_mouse_wheel, add="+")
+        self.bind_all("<Button-5>", self.on_mouse_wheel, add="+")
+    def set_cell_size(self, thumbnail_size):
+        if getattr(self, 'thumbnail_size', None) == thumbnail_size: return
+        self.thumbnail_size = thumbnail_size
+        self.col_pitch, self.row_pitch = thumbnail_size[0] + 40, thumbnail_size[1] + 40
+        for cell in self.cells: cell.destroy()
+        self.cells = []
+        if hasattr(self, 'viewport'): self.relayout()
+    def set_items(self, items):
+        self.items, self.offset = items, 0
+        for cell in self.cells: cell.index = None
+        self.scroll_to(0)
+    def refresh(self):
+        for cell in self.cells: cell.index = None
+        self.render()
+    def items_changed(self):
+        for cell in self.cells: cell.index = None
+        self.scroll_to(self.offset)
+    def refresh_item(self, file_path):
+        for cell in self.cells:
+            if cell.index is not None and cell.file_path == file_path: cell.bind_item(cell.index, file_path)
+    def viewport_size(self):
+        # place() 좌표는 위젯 스케일링이 적용되므로 논리 좌표로 환산해서 계산한다.
+        scaling = ctk.ScalingTracker.get_widget_scaling(self)
+        return self.viewport.winfo_width() / scaling, self.viewport.winfo_height() / scaling
+    def visible_range(self):
+        first_row = int(self.offset // self.row_pitch)
+        last_row = int((self.offset + self.viewport_size()[1]) // self.row_pitch)
+        return first_row * self.columns, min(len(self.items), (last_row + 1) * self.columns)
+    def relayout(self):
+        width, height = self.viewport_size()
+        if width <= 1 or height <= 1: return
+        columns = max(1, int(width // self.col_pitch))
+        pool_size = (int(height // self.row_pitch) + 2 + 2 * self.overscan_rows) * columns
+        if columns != self.columns or pool_size != len(self.cells):
+            self.columns = columns
+            while len(self.cells) < pool_size: self.cells.append(ThumbnailCell(self.viewport, self.app, self.thumbnail_size))
+            while len(self.cells) > pool_size: self.cells.pop().destroy()
+            for cell in self.cells: cell.index = None; cell.place_forget()
+        self.scroll_to(self.offset)
+    def content_height(self):
+        return -(-len(self.items) // self.columns) * self.row_pitch
+    def scroll_to(self, offset):
+        view_height = max(1, self.viewport_size()[1])
+        total = self.content_height()
+        self.offset = max(0, min(offset, total - view_height))
+        self.scrollbar.set(self.offset / total, (self.offset + view_height) / total) if total > view_height else self.scrollbar.set(0, 1)
+        self.render()
+    @METRICS.timed("ui.grid_render")
+    def render(self):
+        if not self.cells: return
+        pool_size = len(self.cells)
+        first = max(0, int(self.offset // self.row_pitch) - self.overscan_rows) * self.columns
+        x_margin = max(0, (self.viewport_size()[0] - self.columns * self.col_pitch) // 2)
+        for index in range(first, first + pool_size):
+            cell = self.cells[index % pool_size]
+            if index >= len(self.items):
+                cell.index = None; cell.place_forget(); continue
+            if cell.index != index: cell.bind_item(index, self.items[index])
+            row, col = divmod(index, self.columns)
+            cell.place(x=x_margin + col * self.col_pitch + 10, y=row * self.row_pitch + 10 - self.offset)
+        visible_start, visible_end = self.visible_range()
+        visible = self.items[visible_start:visible_end]
+        overscan = self.items[first:visible_start] + self.items[visible_end:first + pool_size]
+        self.app.on_gallery_rendered(visible, overscan)
+        if first + pool_size >= len(self.items): self.app.on_gallery_near_end()
+    def on_scrollbar(self, action, value, unit=None):
+        if action == 'moveto': self.scroll_to(float(value) * self.content_height())
+        elif action == 'scroll':
+            step = self.viewport_size()[1] if unit == 'pages' else self.row_pitch // 2
+            self.scroll_to(self.offset + int(value) * step)
+    def on_mouse_wheel(self, event):
+        widget_name = str(event.widget)
+        if not widget_name.startswith(str(self.viewport)): return
+        if event.num == 4: direction = -1
+        elif event.num == 5: direction = 1
+        else: direction = -1 if event.delta > 0 else 1
+        self.scroll_to(self.offset + direction * self.row_pitch // 2)
+
 class ImagePromptGallery(ctk.CTk):
+    SORT_LABELS = {"기본 (검색 시 관련도순)": "relevance", "최신순": "newest", "오래된순": "oldest", "경로순": "path"}
     def __init__(self):
         super().__init__()
         self.load_config()
+        METRICS.enabled = self.config.get("metrics_enabled", False)
         ctk.set_appearance_mode(self.config.get("theme", "System"))
         ctk.set_default_color_theme("blue")
         setup_directories()
         self.db = DatabaseManager(DB_FILE)
         self.title("프롬프트 이미지 갤러리"); self.geometry("1600x1000")
-        self.all_image_files, self.displayed_image_files, self.selected_files = [], [], set()
+        self.library, self.displayed_image_files, self.selected_files = LibraryModel(self.db), [], set()
         self.current_view_mode, self.current_view_id, self.search_term, self.detail_win = "All Images", None, "", None
+        self.duplicate_groups, self.duplicate_generation, self.visual_index, self.metrics_window = {}, 0, None, None
+        self.facet_filters, self.facet_window = {}, None
+        self.gallery_filter, self.page_cursor, self.page_job = GalleryFilter(), None, None
         self.search_job, self.is_selection_mode = None, False
+        self.metadata_indexers, self.folder_watchers, self.root_progress, self.closing = {}, {}, {}, threading.Event()
+        # 폴더 변경 반영은 작업 스레드 하나에서 도착 순서대로 한다 (생성 뒤 삭제 같은 연속 변경이 뒤바뀌지 않도록).
+        self.folder_change_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="folder-changes")
         self.grid_rowconfigure(1, weight=1); self.grid_columnconfigure(1, weight=1)
         self.create_top_bar(); self.create_tag_sidebar()
-        self.scrollable_frame = ctk.CTkScrollableFrame(self); self.scrollable_frame.grid(row=1, column=1, padx=10, pady=10, sticky="nsew")
+        self.thumbnail_images, self.thumbnail_status_job = OrderedDict(), None
+        self.thumbnail_store = ThumbnailStore(self.db, budget_mb=self.config.get("thumbnail_cache_mb", 1024), fmt=self.config.get("thumbnail_format", "WEBP"), packed=self.config.get("thumbnail_packed", False))
+        self.thumbnail_pipeline = ThumbnailPipeline(lambda fp, data: self.after(0, self.on_thumbnail_ready, fp, data), render_args=(self.thumbnail_store.max_size, self.thumbnail_store.fmt))
+        placeholder = Image.new("RGB", (8, 8), (200, 200, 200))
+        self.placeholder_image = ctk.CTkImage(light_image=placeholder, dark_image=Image.new("RGB", (8, 8), (60, 60, 60)), size=(180, 240))
+        self.gallery_grid = VirtualThumbnailGrid(self, self); self.gallery_grid.grid(row=1, column=1, padx=10, pady=10, sticky="nsew")
         self.create_batch_action_bar()
         self.status_label = ctk.CTkLabel(self, text="준비 완료", anchor="w"); self.status_label.grid(row=3, column=0, columnspan=2, padx=10, pady=(0, 5), sticky="ew")
         self.translator = TranslatorService(self)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.after(100, self.initial_load)
     def load_config(self):
         try:
             with open(CONFIG_FILE, 'r') as f: self.config = json.load(f)
         except (FileNotFoundError, json.JSONDecodeError):
-            self.config = {"image_folder": "images", "thumbnail_width": 180, "thumbnail_height": 240, "theme": "System", "translation_engine": "Hybrid", "filtered_tags": []}
+            self.config = {"image_folder": "images", "thumbnail_width": 180, "thumbnail_height": 240, "theme": "System", "translation_engine": "Hybrid", "filtered_tags": [], "thumbnail_cache_mb": 1024, "thumbnail_format": "WEBP", "thumbnail_packed": False, "recursive_scan": True, "watch_folder": True, "near_duplicate_threshold": 0.8, "visual_similarity_radius": 10, "gallery_sort": "relevance", "translation_backend": "google", "translation_server_url": "http://localhost:5000/translate", "translation_workers": 4, "metrics_enabled": False}
     def create_top_bar(self):
         top_frame = ctk.CTkFrame(self, fg_color="transparent"); top_frame.grid(row=0, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
         top_frame.grid_columnconfigure(1, weight=1)
@@ -625,12 +2580,18 @@ class ImagePromptGallery(ctk.CTk):
         search_entry.bind("<KeyRelease>", self.on_search)
         self.view_mode_button = ctk.CTkButton(top_frame, text="All Images", command=self.open_view_menu)
         self.view_mode_button.grid(row=0, column=2, padx=10)
+        self.sort_menu = ctk.CTkOptionMenu(top_frame, values=list(self.SORT_LABELS), width=150, command=self.on_sort_change)
+        self.sort_menu.set(next((label for label, key in self.SORT_LABELS.items() if key == self.config.get("gallery_sort", "relevance")), "기본 (검색 시 관련도순)"))
+        self.sort_menu.grid(row=0, column=3)
         admin_frame = ctk.CTkFrame(top_frame, fg_color="transparent")
-        admin_frame.grid(row=0, column=3, padx=(10,0))
+        admin_frame.grid(row=0, column=4, padx=(10,0))
+        self.facet_button = ctk.CTkButton(admin_frame, text="파라미터 필터", width=110, command=self.open_facet_window)
+        self.facet_button.pack(side="left", padx=(0, 5))
         self.selection_mode_button = ctk.CTkButton(admin_frame, text="선택", command=self.toggle_selection_mode);
         self.selection_mode_button.pack(side="left")
         ctk.CTkButton(admin_frame, text="관리", width=80, command=self.open_management_window).pack(side="left", padx=5)
         ctk.CTkButton(admin_frame, text="설정", width=80, command=self.open_settings).pack(side="left")
+        ctk.CTkButton(admin_frame, text="지표", width=60, command=self.open_metrics_window).pack(side="left", padx=(5, 0))
         ctk.CTkButton(admin_frame, text="새로고침", width=100, command=self.initial_load).pack(side="left", padx=5)
     def create_batch_action_bar(self):
         self.batch_action_bar = ctk.CTkFrame(self, height=50)
@@ -645,6 +2606,8 @@ class ImagePromptGallery(ctk.CTk):
         batch_tag_frame.pack(side="left", padx=10)
         ctk.CTkButton(batch_tag_frame, text="태그 일괄 추가", command=self.batch_add_tags).pack(side="left", padx=5)
         ctk.CTkButton(batch_tag_frame, text="태그 일괄 제거", command=self.batch_remove_tags).pack(side="left")
+        self.batch_album_button = ctk.CTkButton(self.batch_action_bar, text="앨범에 추가", command=self.open_batch_album_menu)
+        self.batch_album_button.pack(side="left", padx=10)
 
         self.selected_count_label = ctk.CTkLabel(self.batch_action_bar, text="0개 선택됨")
         self.selected_count_label.pack(side="right", padx=10)
@@ -663,62 +2626,126 @@ class ImagePromptGallery(ctk.CTk):
             self.change_view_mode("All Images")
     def initial_load(self):
         self.load_config()
-        self.image_folder = self.config.get("image_folder", "images")
         self.thumbnail_size = (self.config.get("thumbnail_width", 180), self.config.get("thumbnail_height", 240))
-        self.status_label.configure(text="이미지 파일 동기화 중..."); self.update()
-        if not os.path.isdir(self.image_folder): os.makedirs(self.image_folder)
-        file_paths = sorted([os.path.join(self.image_folder, f) for f in os.listdir(self.image_folder) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))], key=os.path.getmtime, reverse=True)
-        self.db.sync_files(file_paths)
-        self.all_image_files = self.db.get_all_image_paths()
-        self.status_label.configure(text="메타데이터 캐싱 중..."); self.update()
-        threading.Thread(target=self.update_metadata_cache_threaded, daemon=True).start()
+        self.gallery_grid.set_cell_size(self.thumbnail_size)
+        self.placeholder_image.configure(size=self.thumbnail_size)
+        # 루트가 없는 DB 는 설정의 image_folder 를 첫 루트로 등록한다 (예전 단일 폴더 색인은 그대로 넘겨받는다).
+        default_folder = self.config.get("image_folder", "images")
+        if not self.db.get_roots() and not os.path.isdir(default_folder): os.makedirs(default_folder)
+        self.db.ensure_default_root(default_folder)
+        self.library.load(self.db)
+        for indexer in self.metadata_indexers.values(): indexer.cancel()
+        self.metadata_indexers, self.root_progress = {}, {}
+        # 올라가 있는 루트마다 스캔 -> 병합 -> 파싱을 각자의 스레드에서 동시에 돌린다. 파싱 프로세스 수는 루트끼리 나눠 쓴다.
+        roots = [root for root in self.db.get_roots() if root[3]]
+        self.start_folder_watchers(roots)
+        workers = max(1, ((os.cpu_count() or 2) - 1) // max(1, len(roots)))
+        for root in roots: self.scan_root(root, workers)
+        if not roots: self.update_after_cache()
+    @METRICS.timed("ui.filter_and_display")
     def filter_and_display_images(self):
         if self.current_view_mode == "Similar Images":
              return
-        
-        all_files = set(self.all_image_files)
-        filtered_tags = self.config.get("filtered_tags", [])
-        if filtered_tags:
-            blacklisted_paths = self.db.get_image_paths_with_tags(filtered_tags)
-            files_to_show = all_files - blacklisted_paths
-        else:
-            files_to_show = all_files
+        mode, blacklist = self.current_view_mode, self.config.get("filtered_tags", [])
+        if mode == "Near Duplicates":
+            self.show_near_duplicate_groups(GalleryFilter(blacklist=blacklist)); return
+        # 첫 페이지만 읽어 바로 보여 주고, 나머지는 스크롤이 끝에 가까워질 때 load_next_page 로 이어 붙인다.
+        self.gallery_filter = self.current_gallery_filter()
+        self.displayed_image_files, self.page_cursor = self.db.query_images(self.gallery_filter)
+        self.populate_gallery()
+    def current_gallery_filter(self):
         mode = self.current_view_mode
-        if mode == "Favorites":
-            files_to_show &= self.db.get_favorites()
-        elif mode.startswith("Album:"):
-            files_to_show &= self.db.get_album_images(self.current_view_id)
-        elif mode.startswith("Tag:"):
-            files_to_show &= self.db.get_images_by_tag(self.current_view_id)
-        if self.search_term:
-            search_results, term = set(), self.search_term.lower()
-            for path in files_to_show:
-                pos, neg = self.db.get_parsed_prompts(path)
-                tags = " ".join([t[1] for t in self.db.get_image_tags(path)])
-                if term in f"{os.path.basename(path).lower()} {pos.lower()} {neg.lower()} {tags.lower()}":
-                    search_results.add(path)
-            files_to_show &= search_results
-        self.displayed_image_files = sorted(list(files_to_show), key=lambda p: self.all_image_files.index(p) if p in self.all_image_files else -1)
+        return GalleryFilter(favorites=mode == "Favorites", album_id=self.current_view_id if mode.startswith("Album:") else None,
+                             tag_id=self.current_view_id if mode.startswith("Tag:") else None, blacklist=self.config.get("filtered_tags", []), search=self.search_term,
+                             sort=self.config.get("gallery_sort", "relevance"), facets=self.facet_filters)
+    def set_facet(self, facet, values):
+        if facet is not None:
+            if values: self.facet_filters[facet] = values
+            else: self.facet_filters.pop(facet, None)
+        self.facet_button.configure(text=f"파라미터 필터 ({len(self.facet_filters)})" if self.facet_filters else "파라미터 필터")
+        self.filter_and_display_images()
+    def open_facet_window(self):
+        if self.facet_window is not None and self.facet_window.winfo_exists(): self.facet_window.focus(); return
+        self.facet_window = FacetWindow(self)
+    def on_gallery_near_end(self):
+        if self.page_cursor is not None and not self.page_job: self.page_job = self.after_idle(self.load_next_page)
+    def load_next_page(self):
+        self.page_job = None
+        if self.page_cursor is None: return
+        paths, self.page_cursor = self.db.query_images(self.gallery_filter, after=self.page_cursor)
+        self.displayed_image_files.extend(paths)
+        self.gallery_grid.items_changed()
+    def on_sort_change(self, label):
+        self.config["gallery_sort"] = self.SORT_LABELS[label]
+        with open(CONFIG_FILE, 'w') as f: json.dump(self.config, f, indent=4)
+        self.filter_and_display_images()
+    def show_near_duplicate_groups(self, gallery_filter):
+        # 그룹마다 가장 최근 이미지 하나만 대표로 보여 주고, 나머지는 우클릭 메뉴의 '그룹 펼치기'로 본다.
+        # 그룹 계산은 라이브러리 크기에 비례하므로 백그라운드에서 하고, 그 사이 보기가 바뀌었으면 결과를 버린다.
+        self.page_cursor, self.duplicate_groups, self.displayed_image_files = None, {}, []
+        self.duplicate_generation += 1
+        generation, threshold = self.duplicate_generation, self.config.get("near_duplicate_threshold", 0.8)
+        self.populate_gallery()
+        self.status_label.configure(text="근사 중복 그룹 계산 중...")
+        def run():
+            try: groups = self.db.get_near_duplicate_groups(threshold, gallery_filter)
+            finally: self.db.release_connection()
+            self.after(0, self.on_near_duplicate_groups, generation, {group[0]: group for group in groups})
+        threading.Thread(target=run, daemon=True).start()
+    def on_near_duplicate_groups(self, generation, groups):
+        if generation != self.duplicate_generation or self.current_view_mode != "Near Duplicates": return
+        self.duplicate_groups, self.displayed_image_files = groups, list(groups)
+        self.populate_gallery()
+        self.status_label.configure(text=f"근사 중복 그룹 {len(groups)}개 ({sum(map(len, groups.values()))}개 이미지)")
+    def show_static_results(self, title, paths, status):
+        self.displayed_image_files, self.page_cursor = paths, None
+        self.current_view_mode = "Similar Images"
+        self.view_mode_button.configure(text=title)
         self.populate_gallery()
+        self.status_label.configure(text=status)
+    def expand_duplicate_group(self, file_path):
+        self.show_static_results("근사 중복 그룹", list(self.duplicate_groups.get(file_path, [file_path])), f"'{os.path.basename(file_path)}' 그룹의 이미지 {len(self.duplicate_groups.get(file_path, [file_path]))}개")
+    def find_near_duplicates(self, source_path):
+        threshold = self.config.get("near_duplicate_threshold", 0.8)
+        matches = self.db.find_near_duplicates(source_path, threshold)
+        if not matches and not self.db.get_parsed_prompts(source_path)[0]:
+            messagebox.showinfo("알림", "기준 이미지의 프롬프트 정보가 없습니다."); return
+        self.show_static_results("근사 중복 검색 결과", [source_path] + [path for path, _ in matches], f"'{os.path.basename(source_path)}'와(과) 유사도 {threshold:.0%} 이상인 이미지 {len(matches)}개")
+    @METRICS.timed("ui.populate_gallery")
     def populate_gallery(self):
-        for widget in self.scrollable_frame.winfo_children(): widget.destroy()
-        columns = max(1, self.scrollable_frame.winfo_width() // (self.thumbnail_size[0] + 40)); self.scrollable_frame.grid_columnconfigure(list(range(columns)), weight=1)
-        for i, file_path in enumerate(self.displayed_image_files):
-            row, col = i // columns, i % columns
-            item_frame = ctk.CTkFrame(self.scrollable_frame); item_frame.grid(row=row, column=col, padx=10, pady=10, sticky="nsew")
-            try:
-                thumbnail_path = self.get_or_create_thumbnail(file_path)
-                if thumbnail_path:
-                    ctk_img = ctk.CTkImage(Image.open(thumbnail_path), size=self.thumbnail_size)
-                    img_button = ctk.CTkButton(item_frame, image=ctk_img, text="", fg_color="transparent", command=lambda fp=file_path: self.on_thumbnail_click(fp)); img_button.pack(padx=5, pady=5)
-                    if not self.is_selection_mode:
-                        is_fav, _ = self.db.get_image_data(file_path)
-                        fav_button = ctk.CTkButton(item_frame, text="★" if is_fav else "☆", width=28, height=28, command=lambda fp=file_path: self.toggle_favorite(fp)); fav_button.place(in_=img_button, relx=1.0, rely=0.0, anchor="ne", x=-5, y=5)
-                        img_button.bind("<Button-3>", lambda event, fp=file_path: self.show_context_menu(event, fp))
-                    else:
-                        checkbox_var = tk.BooleanVar(value=file_path in self.selected_files)
-                        checkbox = ctk.CTkCheckBox(item_frame, text="", variable=checkbox_var, command=lambda fp=file_path, v=checkbox_var: self.on_checkbox_toggle(fp, v)); checkbox.place(in_=img_button, relx=0.0, rely=0.0, anchor="nw", x=5, y=5)
-            except Exception as e: print(e)
+        self.gallery_grid.set_items(self.displayed_image_files)
+    def refresh_gallery(self):
+        self.gallery_grid.refresh()
+    @METRICS.timed("thumbnail.get_image")
+    def get_thumbnail_image(self, file_path):
+        if file_path in self.thumbnail_images:
+            self.thumbnail_images.move_to_end(file_path); return self.thumbnail_images[file_path]
+        data = self.thumbnail_store.get(file_path)
+        if data is None: return self.placeholder_image
+        try: ctk_img = ctk.CTkImage(Image.open(io.BytesIO(data)), size=self.thumbnail_size)
+        except Exception as e: print(e); ctk_img = None
+        self.cache_thumbnail_image(file_path, ctk_img)
+        return ctk_img
+    def cache_thumbnail_image(self, file_path, ctk_img):
+        self.thumbnail_images[file_path] = ctk_img
+        while len(self.thumbnail_images) > THUMBNAIL_IMAGE_CACHE_SIZE: self.thumbnail_images.popitem(last=False)
+    def on_gallery_rendered(self, visible_paths, overscan_paths):
+        priorities = {p: 1 for p in overscan_paths if p not in self.thumbnail_images}
+        priorities.update({p: 0 for p in visible_paths if p not in self.thumbnail_images})
+        self.thumbnail_pipeline.schedule(priorities)
+        if priorities and not self.thumbnail_status_job: self.update_thumbnail_status()
+    def on_thumbnail_ready(self, file_path, result):
+        if result is None: self.cache_thumbnail_image(file_path, None)
+        else: self.thumbnail_store.put(file_path, result[0]); self.record_visual_hash(file_path, result[1]); self.thumbnail_images.pop(file_path, None)
+        self.gallery_grid.refresh_item(file_path)
+    def update_thumbnail_status(self):
+        stats = self.thumbnail_pipeline.stats()
+        if self.thumbnail_pipeline.is_busy():
+            self.status_label.configure(text=f"썸네일 생성 중... 대기 {stats['queued'] + stats['in_flight']}개 | {stats['throughput']:.1f}장/초")
+            self.thumbnail_status_job = self.after(500, self.update_thumbnail_status)
+        else:
+            self.thumbnail_status_job = None
+            if stats['completed']: self.status_label.configure(text=f"썸네일 생성 완료. (누적 {stats['completed']}개)")
     def on_thumbnail_click(self, file_path):
         if self.is_selection_mode: self.toggle_selection(file_path)
         else: self.open_detail_view(file_path)
@@ -727,24 +2754,21 @@ class ImagePromptGallery(ctk.CTk):
         else: self.selected_files.discard(file_path)
         self.update_batch_action_bar()
     def toggle_selection(self, file_path):
-        checkbox_var = tk.BooleanVar(value=file_path not in self.selected_files); self.on_checkbox_toggle(file_path, checkbox_var); self.populate_gallery()
+        checkbox_var = tk.BooleanVar(value=file_path not in self.selected_files); self.on_checkbox_toggle(file_path, checkbox_var); self.refresh_gallery()
     def clear_selection(self):
-        self.selected_files.clear(); self.update_batch_action_bar(); self.populate_gallery()
+        self.selected_files.clear(); self.update_batch_action_bar(); self.refresh_gallery()
     def batch_set_favorite(self, is_fav):
         if not self.selected_files: return
-        for path in self.selected_files: self.db.set_favorite(path, is_fav)
+        self.db.bulk_set_favorite(self.selected_files, is_fav)
         messagebox.showinfo("완료", f"{len(self.selected_files)}개 이미지를 즐겨찾기 {'추가' if is_fav else '제거'}했습니다.")
-        self.populate_gallery()
+        self.refresh_gallery()
     def batch_add_tags(self):
         if not self.selected_files: return
         dialog = ctk.CTkInputDialog(text="추가할 태그를 입력하세요 (쉼표로 구분):", title="태그 일괄 추가")
         tags_str = dialog.get_input()
         if not tags_str: return
         
-        tags_to_add = [t.strip().lower() for t in tags_str.split(',') if t.strip()]
-        for path in self.selected_files:
-            for tag in tags_to_add:
-                self.db.add_tag_to_image(path, tag)
+        self.db.bulk_add_tags(self.selected_files, tags_str.split(','))
         
         self.update_tag_sidebar()
         messagebox.showinfo("완료", f"{len(self.selected_files)}개 이미지에 태그를 추가했습니다.")
@@ -766,13 +2790,21 @@ class ImagePromptGallery(ctk.CTk):
             messagebox.showinfo("알림", "존재하지 않는 태그입니다.")
             return
 
-        for path in self.selected_files:
-            for tag_id in tag_ids_to_remove:
-                self.db.remove_tag_from_image(path, tag_id)
+        self.db.bulk_remove_tags(self.selected_files, tag_ids_to_remove)
         
         self.update_tag_sidebar()
         messagebox.showinfo("완료", f"{len(self.selected_files)}개 이미지에서 태그를 제거했습니다.")
 
+    def open_batch_album_menu(self):
+        if not self.selected_files: return
+        menu = tk.Menu(self, tearoff=0)
+        albums = self.db.get_albums()
+        if not albums: menu.add_command(label="(앨범 없음)", state="disabled")
+        for album_id, album_name in albums: menu.add_command(label=album_name, command=lambda aid=album_id, name=album_name: self.batch_add_to_album(aid, name))
+        menu.tk_popup(self.batch_album_button.winfo_rootx(), self.batch_album_button.winfo_rooty() - 10)
+    def batch_add_to_album(self, album_id, album_name):
+        self.db.bulk_add_to_album(album_id, self.selected_files)
+        messagebox.showinfo("완료", f"{len(self.selected_files)}개 이미지를 '{album_name}' 앨범에 추가했습니다.")
     def update_batch_action_bar(self):
         count = len(self.selected_files); self.selected_count_label.configure(text=f"{count}개 선택됨")
     def toggle_selection_mode(self):
@@ -781,10 +2813,13 @@ class ImagePromptGallery(ctk.CTk):
             self.selection_mode_button.configure(fg_color=("lightblue", "blue")); self.batch_action_bar.grid(row=2, column=0, columnspan=2, sticky="ew", padx=10, pady=5)
         else:
             self.selection_mode_button.configure(fg_color=ctk.ThemeManager.theme["CTkButton"]["fg_color"]); self.batch_action_bar.grid_remove(); self.clear_selection()
-        self.populate_gallery()
+        self.refresh_gallery()
     def show_context_menu(self, event, file_path):
         context_menu = tk.Menu(self, tearoff=0)
         context_menu.add_command(label="유사 이미지 찾기", command=lambda: self.find_similar_images(file_path))
+        context_menu.add_command(label="시각적으로 유사한 이미지 찾기", command=lambda: self.find_visually_similar(file_path))
+        context_menu.add_command(label="근사 중복 찾기", command=lambda: self.find_near_duplicates(file_path))
+        if self.current_view_mode == "Near Duplicates" and file_path in self.duplicate_groups: context_menu.add_command(label=f"이 그룹 펼치기 ({len(self.duplicate_groups[file_path])}개)", command=lambda: self.expand_duplicate_group(file_path))
         context_menu.add_separator()
         add_to_album_menu = tk.Menu(context_menu, tearoff=0)
         albums = self.db.get_albums()
@@ -821,54 +2856,175 @@ class ImagePromptGallery(ctk.CTk):
             self.status_label.configure(text="준비 완료")
             return
         
-        source_tags = {tag.strip().lower() for tag in source_prompt.split(',') if tag.strip()}
-        
-        scores = []
-        for path in self.all_image_files:
-            if path == source_path: continue
-            
-            other_prompt, _ = self.db.get_parsed_prompts(path)
-            if not other_prompt: continue
-            
-            other_tags = {tag.strip().lower() for tag in other_prompt.split(',') if tag.strip()}
-            
-            score = len(source_tags.intersection(other_tags))
-            if score > 0:
-                scores.append((score, path))
-        
-        scores.sort(key=lambda x: x[0], reverse=True)
-        
-        self.displayed_image_files = [path for score, path in scores]
-        self.current_view_mode = "Similar Images"
-        self.view_mode_button.configure(text="유사 이미지 검색 결과")
-        self.populate_gallery()
-        self.status_label.configure(text=f"유사 이미지 {len(self.displayed_image_files)}개 검색 완료.")
+        paths = [path for path, score in self.db.find_similar_images(source_path)]
+        self.show_static_results("유사 이미지 검색 결과", paths, f"유사 이미지 {len(paths)}개 검색 완료.")
 
+    def find_visually_similar(self, source_path):
+        self.status_label.configure(text=f"'{os.path.basename(source_path)}'와(과) 시각적으로 유사한 이미지 검색 중...")
+        self.update_idletasks()
+        value = self.db.get_visual_hash(source_path)
+        if value is None:
+            try: data, value = render_thumbnail(source_path, self.thumbnail_store.max_size, self.thumbnail_store.fmt)
+            except Exception as e:
+                messagebox.showerror("오류", f"이미지를 읽을 수 없습니다: {e}"); self.status_label.configure(text="준비 완료"); return
+            self.thumbnail_store.put(source_path, data); self.record_visual_hash(source_path, value)
+        radius = self.config.get("visual_similarity_radius", 10)
+        matches = [path for distance, path in self.get_visual_index().search(value, radius) if path != source_path]
+        self.show_static_results("시각적 유사 이미지", [source_path] + matches, f"시각적으로 유사한 이미지 {len(matches)}개 (해시 거리 {radius} 이내, 썸네일이 만들어진 {len(self.visual_index.hashes)}개 중)")
+    def record_visual_hash(self, file_path, value):
+        self.db.set_visual_hash(file_path, value)
+        if self.visual_index is not None: self.visual_index.add(file_path, value)
+    def get_visual_index(self):
+        if self.visual_index is None: self.visual_index = VisualHashIndex(self.db.get_visual_hashes())
+        return self.visual_index
+    def hash_cached_thumbnails(self, cancelled):
+        # 지각 해시가 없던 시절에 만들어진 썸네일은 캐시된 바이트를 디코딩해 해시만 채운다.
+        for path in self.db.get_paths_missing_visual_hash():
+            if cancelled.is_set(): return
+            data = self.thumbnail_store.peek(path)
+            if data is None: continue
+            try:
+                with Image.open(io.BytesIO(data)) as img: self.record_visual_hash(path, visual_hash(img))
+            except Exception as e: print(f"Error hashing thumbnail for {path}: {e}")
     def toggle_favorite(self, file_path):
-        is_fav = not (self.db.get_image_data(file_path)[0] == 1); self.db.set_favorite(file_path, is_fav); self.populate_gallery()
+        is_fav = not (self.db.get_image_data(file_path)[0] == 1); self.db.set_favorite(file_path, is_fav); self.refresh_gallery()
     def create_new_album_and_add(self, file_path):
         dialog = ctk.CTkInputDialog(text="새 앨범 이름을 입력하세요:", title="앨범 만들기"); album_name = dialog.get_input()
         if album_name: self.db.add_album(album_name); album_id = self.db._execute("SELECT id FROM albums WHERE name=?", (album_name,), fetch='one')[0]; self.db.add_image_to_album(album_id, file_path); self.update_view_mode_menu()
     def remove_image_from_current_album(self, file_path):
         self.db.remove_image_from_album(self.current_view_id, file_path); self.filter_and_display_images()
-    def get_or_create_thumbnail(self, fp):
-        bn = os.path.basename(fp); tp = os.path.join(THUMBNAIL_DIR, bn)
-        if not os.path.exists(tp) or os.path.getmtime(fp) > os.path.getmtime(tp):
-            try:
-                with Image.open(fp) as img: img.thumbnail((512, 512), Image.Resampling.LANCZOS); img.save(tp, "PNG")
-            except Exception as e: print(f"Error creating thumbnail for {fp}: {e}"); return None
-        return tp
-    def update_metadata_cache_threaded(self):
-        for path in self.all_image_files:
-            _, timestamp = self.db.get_image_data(path)
-            if not timestamp or os.path.getmtime(path) > timestamp:
-                try:
-                    with Image.open(path) as img: parsed_data = parse_image_metadata(img.info)
-                    self.db.update_image_cache(path, parsed_data, os.path.getmtime(path))
-                except Exception: self.db.update_image_cache(path, {'prompt':'', 'negative_prompt':'', 'others':''}, os.path.getmtime(path))
-        self.after(0, self.update_after_cache)
+    def scan_root(self, root, workers=None):
+        # 루트 하나만 스캔 -> 병합 -> 파싱한다. 같은 루트에서 돌던 작업은 취소하고, 다른 루트의 작업은 건드리지 않는다.
+        root_id = root[0]
+        if root_id in self.metadata_indexers: self.metadata_indexers[root_id].cancel()
+        indexer = self.metadata_indexers[root_id] = MetadataIndexer(self.db, workers=workers, on_progress=lambda done, total: self.after(0, self.on_root_progress, root_id, f"메타데이터 {done}/{total}"))
+        self.root_progress[root_id] = (root[2], "스캔 중"); self.update_root_status()
+        threading.Thread(target=self.scan_root_threaded, args=(root, indexer), daemon=True).start()
+    def scan_root_threaded(self, root, indexer):
+        try: self.scan_root_files(root, indexer)
+        finally: self.db.release_connection()
+    def scan_root_files(self, root, indexer):
+        root_id, path = root[0], root[1]
+        # 폴더가 없으면 (드라이브가 빠진 경우) 빈 스캔으로 색인을 지우지 않도록 건너뛴다.
+        if not os.path.isdir(path): self.after(0, self.on_root_finished, root_id, indexer, "폴더 없음"); return
+        entries = scan_image_files(path, recursive=self.config.get("recursive_scan", True))
+        if indexer.cancelled.is_set(): return
+        self.db.sync_files(entries, root_id)
+        self.after(0, self.on_root_progress, root_id, "메타데이터 캐싱 중")
+        indexer.run(root_id=root_id)
+        self.after(0, self.on_root_finished, root_id, indexer, f"{len(entries)}개")
+    def on_root_progress(self, root_id, text):
+        if root_id in self.root_progress: self.root_progress[root_id] = (self.root_progress[root_id][0], text); self.update_root_status()
+    def update_root_status(self):
+        self.status_label.configure(text=" · ".join(f"{label}: {text}" for label, text in self.root_progress.values()))
+    def on_root_finished(self, root_id, indexer, text):
+        if self.metadata_indexers.get(root_id) is not indexer: return  # 같은 루트를 다시 스캔하기 시작했거나 내린 경우
+        del self.metadata_indexers[root_id]
+        if indexer.cancelled.is_set(): return
+        self.on_root_progress(root_id, f"완료 ({text})")
+        if self.metadata_indexers: self.filter_and_display_images(); return
+        # 마지막 루트가 끝나면 루트 전체에 걸친 후처리(토큰/파라미터 색인, 파싱 캐시 정리, 지각 해시)를 한 번만 한다.
+        threading.Thread(target=self.finish_metadata_cache_threaded, daemon=True).start()
+    def finish_metadata_cache_threaded(self):
+        try:
+            self.db.index_missing_prompt_tokens(); self.db.index_missing_generation_params(); self.db.prune_parse_cache()
+            if not self.closing.is_set(): self.after(0, self.update_after_cache)
+            self.hash_cached_thumbnails(self.closing)
+        finally: self.db.release_connection()
+    def start_folder_watchers(self, roots):
+        for watcher in self.folder_watchers.values(): watcher.stop()
+        self.folder_watchers = {}
+        for root in roots: self.start_folder_watcher(root)
+    def start_folder_watcher(self, root):
+        root_id = root[0]
+        self.stop_folder_watcher(root_id)
+        if self.config.get("watch_folder", True) and os.path.isdir(root[1]):
+            self.folder_watchers[root_id] = FolderWatcher(root[1], lambda changed, removed, rescan: self.after(0, self.on_folder_changes, root_id, changed, removed, rescan), recursive=self.config.get("recursive_scan", True))
+    def stop_folder_watcher(self, root_id):
+        watcher = self.folder_watchers.pop(root_id, None)
+        if watcher: watcher.stop()
+    def on_folder_changes(self, root_id, changed, removed, rescan):
+        if root_id not in self.folder_watchers: return  # 내리거나 제거한 루트에서 늦게 도착한 알림
+        if rescan: self.scan_root(self.db.get_root(root_id)); return
+        # DB 병합(_merge_scan)은 다른 스캔이나 명령줄 인덱서가 쓰기 잠금을 쥐고 있으면 최대 10초 기다리므로 UI 스레드에서 하지 않는다.
+        self.folder_change_executor.submit(self.apply_folder_changes_threaded, root_id, changed, removed)
+    def apply_folder_changes_threaded(self, root_id, changed, removed):
+        entries, new_paths = [], []
+        try:
+            for path in changed:
+                try: st = os.stat(path); entries.append((path, st.st_size, st.st_mtime, st.st_ino or None))
+                except OSError: pass
+            new_paths = [e[0] for e in entries if e[0] not in self.library]
+            moved = dict(self.db.apply_file_changes(entries, removed, root_id))
+            if self.closing.is_set(): return
+            self.after(0, self.on_folder_changes_applied, moved, set(removed) - set(moved))
+            if entries: MetadataIndexer(self.db).run([e[0] for e in entries])
+        except Exception as e: print(f"Error applying folder changes: {e}"); return
+        finally: self.db.release_connection()
+        if entries and not self.closing.is_set(): self.after(0, self.add_changed_files_to_gallery, [e[0] for e in entries], new_paths)
+    def on_folder_changes_applied(self, moved, gone):
+        if self.visual_index is not None:
+            for old_path, new_path in moved.items(): self.visual_index.move(old_path, new_path)
+            for path in gone: self.visual_index.discard(path)
+        if moved or gone:
+            self.displayed_image_files[:] = [moved.get(p, p) for p in self.displayed_image_files if p not in gone]
+            self.selected_files -= gone
+            self.gallery_grid.items_changed()
+    # --- 라이브러리 루트 관리 (LibraryRootsWindow) ---
+    def open_roots_window(self):
+        LibraryRootsWindow(self)
+    def stop_root(self, root_id):
+        if root_id in self.metadata_indexers: self.metadata_indexers.pop(root_id).cancel()
+        self.root_progress.pop(root_id, None); self.stop_folder_watcher(root_id)
+    def reload_library_view(self):
+        # 루트 구성이 바뀐 뒤: 라이브러리 모델과 지각 해시 색인을 다시 읽고 현재 보기를 다시 조회한다.
+        self.library.load(self.db); self.visual_index = None; self.selected_files.clear()
+        self.update_batch_action_bar(); self.filter_and_display_images(); self.update_root_status()
+    def add_library_root(self, folder, parent=None):
+        try: root_id = self.db.add_root(folder)
+        except (ValueError, sqlite3.IntegrityError) as e: messagebox.showwarning("폴더 추가 실패", str(e) if isinstance(e, ValueError) else "이미 등록된 폴더입니다.", parent=parent); return False
+        root = self.db.get_root(root_id)
+        self.start_folder_watcher(root); self.scan_root(root)
+        return True
+    def set_library_root_mounted(self, root_id, mounted):
+        self.db.set_root_mounted(root_id, mounted)
+        if mounted: root = self.db.get_root(root_id); self.start_folder_watcher(root); self.scan_root(root)
+        else: self.stop_root(root_id)
+        self.reload_library_view()
+    def remove_library_root(self, root_id):
+        self.stop_root(root_id); self.db.remove_root(root_id); self.reload_library_view()
+    def relocate_library_root(self, root_id, folder, parent=None):
+        # 경로 문자열만 바꾸므로 태그/앨범/즐겨찾기/파싱 결과가 유지되고, 썸네일도 키만 바꿔 그대로 쓴다. 이동 뒤 그 루트만 스캔해 달라진 파일을 맞춘다.
+        self.stop_root(root_id)
+        try: moves = self.db.relocate_root(root_id, folder)
+        except (ValueError, sqlite3.IntegrityError) as e: messagebox.showwarning("경로 변경 실패", str(e) if isinstance(e, ValueError) else "이미 등록된 폴더입니다.", parent=parent); return False
+        self.thumbnail_store.relocate(moves); self.thumbnail_images.clear()
+        root = self.db.get_root(root_id)
+        if root[3]: self.start_folder_watcher(root); self.scan_root(root)
+        self.reload_library_view()
+        return True
+    def add_changed_files_to_gallery(self, paths, new_paths):
+        # 라이브러리 모델에는 DB 반영 시점에 이미 들어가 있으므로, 여기서는 메타데이터가 채워진 새 파일을 화면 목록 앞에 붙이거나, 관련도순 검색이면 다시 조회한다.
+        new_set = set(new_paths)
+        for path in paths:
+            if path not in new_set: self.thumbnail_images.pop(path, None)
+        new_paths = sorted((p for p in new_paths if p in self.library), key=self.library.rank, reverse=True)
+        if new_paths:
+            shown = self.filter_new_paths(new_paths)
+            # 관련도순이면 맨 앞이 제자리가 아니므로, 새 검색 결과가 있을 때 bm25 순위대로 다시 조회한다.
+            if shown and self.gallery_filter.effective_sort == "relevance": self.filter_and_display_images()
+            else: self.displayed_image_files[0:0] = shown
+            self.status_label.configure(text=f"새 이미지 {len(new_paths)}개 추가됨. (총 {len(self.library)}개)")
+        self.gallery_grid.items_changed()
+    def filter_new_paths(self, paths):
+        # 새로 생긴 파일은 즐겨찾기/앨범/태그에 속할 수 없으므로 전체 보기일 때만, 현재 보기 조건(검색어, 파라미터 필터 등)을 통과한 것만 추가한다.
+        # 최신순/관련도순이 아니면 다음 새로고침 때 나타나게 둔다.
+        if self.current_view_mode != "All Images" or self.gallery_filter.effective_sort not in ("newest", "relevance"): return []
+        if not self.search_term.strip() and not self.gallery_filter.facets and not self.gallery_filter.blacklist: return paths
+        matched = set(self.db.match_paths(self.gallery_filter, paths))
+        return [p for p in paths if p in matched]
     def update_after_cache(self):
-        self.status_label.configure(text=f"{len(self.all_image_files)}개 이미지 로드 완료. 검색 준비 완료."); self.update_tag_sidebar(); self.filter_and_display_images()
+        self.status_label.configure(text=f"{len(self.library)}개 이미지 로드 완료. 검색 준비 완료."); self.update_tag_sidebar(); self.filter_and_display_images()
     def open_detail_view(self, file_path):
         if self.detail_win is not None and self.detail_win.winfo_exists(): self.detail_win.destroy()
         self.detail_win = DetailWindow(self, file_path); self.detail_win.focus()
@@ -876,12 +3032,22 @@ class ImagePromptGallery(ctk.CTk):
         SettingsWindow(self)
     def open_management_window(self):
         ManagementWindow(self)
+    def open_metrics_window(self):
+        if self.metrics_window is not None and self.metrics_window.winfo_exists(): self.metrics_window.focus(); return
+        self.metrics_window = MetricsWindow(self)
+    def on_close(self):
+        self.closing.set()
+        for indexer in self.metadata_indexers.values(): indexer.cancel()
+        for watcher in self.folder_watchers.values(): watcher.stop()
+        self.folder_change_executor.shutdown(wait=False, cancel_futures=True)
+        self.translator.engine.shutdown(); self.thumbnail_pipeline.shutdown(); self.thumbnail_store.close(); self.db.close(); self.destroy()
     def restart_program(self):
-        self.destroy(); os.execl(sys.executable, sys.executable, *sys.argv)
+        self.on_close(); os.execl(sys.executable, sys.executable, *sys.argv)
     def open_view_menu(self):
         menu = tk.Menu(self, tearoff=0)
         menu.add_command(label="All Images", command=lambda: self.change_view_mode("All Images"))
         menu.add_command(label="Favorites", command=lambda: self.change_view_mode("Favorites"))
+        menu.add_command(label="Near Duplicates", command=lambda: self.change_view_mode("Near Duplicates"))
         albums = self.db.get_albums()
         if albums:
             menu.add_separator()
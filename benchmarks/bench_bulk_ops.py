@@ -0,0 +1,74 @@
+# 선택된 이미지에 대한 일괄 작업(태그 추가/제거, 즐겨찾기, 앨범 추가)을 "행마다 메서드 호출 + 쿼리마다 새 연결"(이전 방식)과
+# 임시 테이블 + 집합 단위 SQL 한 트랜잭션(현재 방식)으로 비교한다. 이전 방식은 --legacy-max 이하의 선택 크기에서만 잰다.
+# 사용법: python benchmarks/bench_bulk_ops.py [--library N] [--sizes 10,100,1000,10000,50000] [--legacy-max N]
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import DatabaseManager
+
+class FreshConnectionDatabaseManager(DatabaseManager):
+    # 변경 전 연결 방식: 매 호출마다 sqlite3.connect.
+    def _get_connection(self):
+        conn = sqlite3.connect(self.db_file, timeout=10)
+        conn.create_function("path_basename", 1, lambda p: os.path.basename(p) if p else "", deterministic=True)
+        return conn
+
+def legacy_ops(db, paths, tags):
+    # 변경 전 ImagePromptGallery.batch_* 의 반복문 그대로.
+    def add_tags():
+        for path in paths:
+            for tag in tags: db.add_tag_to_image(path, tag)
+    def remove_tags():
+        tag_ids = [db.get_tag_id_by_name(tag) for tag in tags]
+        for path in paths:
+            for tag_id in tag_ids: db.remove_tag_from_image(path, tag_id)
+    def favorite():
+        for path in paths: db.set_favorite(path, True)
+    def album():
+        for path in paths: db.add_image_to_album(1, path)
+    return {"add 3 tags": add_tags, "remove 3 tags": remove_tags, "favorite": favorite, "album add": album}
+
+def bulk_ops(db, paths, tags):
+    return {"add 3 tags": lambda: db.bulk_add_tags(paths, tags), "remove 3 tags": lambda: db.bulk_remove_tags(paths, [db.get_tag_id_by_name(t) for t in tags]),
+            "favorite": lambda: db.bulk_set_favorite(paths, True), "album add": lambda: db.bulk_add_to_album(1, paths)}
+
+def build_db(db_file, library):
+    db = DatabaseManager(db_file)
+    db.sync_files([(f"/library/image_{i:06d}.png", 1000, float(i), None) for i in range(library)])
+    db.add_album("benchmark")
+    db.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--library", type=int, default=60000)
+    parser.add_argument("--sizes", default="10,100,1000,10000,50000")
+    parser.add_argument("--legacy-max", type=int, default=1000)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    tags = ["bench_a", "bench_b", "bench_c"]
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "bulk.db")
+        build_db(db_file, max(args.library, max(sizes)))
+        print(f"{'selection':>10} {'operation':>14} {'per-row (s)':>12} {'bulk (s)':>10}")
+        for size in sizes:
+            paths = [f"/library/image_{i:06d}.png" for i in range(size)]
+            results = {}
+            for name, cls, make_ops in (("legacy", FreshConnectionDatabaseManager, legacy_ops), ("bulk", DatabaseManager, bulk_ops)):
+                if name == "legacy" and size > args.legacy_max: continue
+                db = cls(db_file)
+                for op, fn in make_ops(db, paths, tags).items():
+                    start = time.perf_counter(); fn(); results[(name, op)] = time.perf_counter() - start
+                with db._get_connection() as conn:
+                    conn.execute("DELETE FROM image_tags"); conn.execute("DELETE FROM album_images"); conn.execute("UPDATE images SET is_favorite=0"); conn.execute("UPDATE images_fts SET tags=NULL WHERE tags IS NOT NULL")
+                db.close()
+            for op in ("add 3 tags", "remove 3 tags", "favorite", "album add"):
+                legacy = results.get(("legacy", op))
+                print(f"{size:>10} {op:>14} {legacy if legacy is not None else float('nan'):>12.3f} {results[('bulk', op)]:>10.3f}")
+
+if __name__ == "__main__":
+    main()
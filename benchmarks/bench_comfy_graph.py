@@ -0,0 +1,122 @@
+# ComfyUI 그래프 해석: 예전 재귀 구현과 ComfyGraph(반복 + 노드별 메모)의 결과와 시간을 비교한다.
+# realistic: synthetic_corpus 의 그래프(조건 노드 사슬, 공유 인코더, LoRA 사슬)를 깊이별로.
+# ladder: 두 입력이 모두 같은 이전 노드를 가리키는 Combine 사다리 끝에 빈 프롬프트(PrimitiveString 링크)가 달린 최악의 경우. 재귀 구현은 2^깊이 번 방문한다.
+# chain: 리루트 노드가 일렬로 이어진 아주 깊은 그래프. 재귀 구현은 재귀 한도에 걸린다.
+# 사용법: python benchmarks/bench_comfy_graph.py [--samples N] [--depths 4,8,16,32] [--ladder-depths 8,16,20,24] [--chain-depths 100,1000,10000] [--legacy-max-ladder 20] [--repeat N]
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import ComfyGraph
+from synthetic_corpus import make_comfy_prompt, make_vocabulary
+
+def legacy_trace_prompt(prompt_json, start_node_id_str):
+    # 비교 기준: 이전 버전의 trace_comfy_prompt 그대로.
+    start_node_id = str(start_node_id_str)
+    if start_node_id not in prompt_json: return ""
+    node_data = prompt_json[start_node_id]; class_type, inputs = node_data.get('class_type', ''), node_data.get('inputs', {})
+    if 'CLIPTextEncode' in class_type: return legacy_trace_prompt(prompt_json, inputs['text'][0]) if isinstance(inputs.get('text'), list) else inputs.get('text', '')
+    elif 'PromptSwitchHub' in class_type:
+        prompts = []
+        for i in range(1, 8):
+            if inputs.get(f'enabled_{i}', False):
+                prompt_input = inputs.get(f'prompt_{i}')
+                if prompt_input:
+                    if isinstance(prompt_input, list): prompts.append(legacy_trace_prompt(prompt_json, prompt_input[0]))
+                    else: prompts.append(str(prompt_input))
+        return ", ".join(p for p in prompts if p)
+    for v in inputs.values():
+        if isinstance(v, list) and v:
+            res = legacy_trace_prompt(prompt_json, v[0]);
+            if res: return res
+    return ""
+
+def legacy_trace_input(prompt_json, start_node_id_str, target_class, target_input_key):
+    start_node_id = str(start_node_id_str)
+    if start_node_id not in prompt_json: return None
+    node_data = prompt_json[start_node_id]; class_type, inputs = node_data.get('class_type', ''), node_data.get('inputs', {})
+    if target_class in class_type: return inputs.get(target_input_key)
+    for v in inputs.values():
+        if isinstance(v, list) and v:
+            res = legacy_trace_input(prompt_json, v[0], target_class, target_input_key);
+            if res: return res
+    return None
+
+def sampler_of(graph):
+    return [n for n in graph.values() if 'KSampler' in n.get('class_type', '')][-1]['inputs']
+
+def legacy_resolve(graph):
+    inputs = sampler_of(graph)
+    return (legacy_trace_prompt(graph, inputs['positive'][0]), legacy_trace_prompt(graph, inputs['negative'][0]),
+            legacy_trace_input(graph, inputs['model'][0], "CheckpointLoaderSimple", "ckpt_name"))
+
+def resolve(graph):
+    comfy = ComfyGraph(graph); inputs = comfy.node(comfy.nodes_of('KSampler')[-1])[1]
+    return comfy.prompt(inputs['positive'][0]), comfy.prompt(inputs['negative'][0]), comfy.find_input(inputs['model'][0], "CheckpointLoaderSimple", "ckpt_name")
+
+def make_ladder(depth):
+    graph = {"1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "model.safetensors"}},
+             "2": {"class_type": "PrimitiveString", "inputs": {"value": "masterpiece, 1girl"}},
+             "3": {"class_type": "CLIPTextEncode", "inputs": {"text": ["2", 0], "clip": ["1", 1]}}}
+    node = "3"
+    for i in range(depth):
+        graph[str(10 + i)] = {"class_type": "ConditioningCombine", "inputs": {"conditioning_1": [node, 0], "conditioning_2": [node, 0]}}; node = str(10 + i)
+    graph["4"] = {"class_type": "CLIPTextEncode", "inputs": {"text": "blurry", "clip": ["1", 1]}}
+    graph["5"] = {"class_type": "KSampler", "inputs": {"seed": 1, "model": ["1", 0], "positive": [node, 0], "negative": ["4", 0]}}
+    return graph
+
+def make_chain(depth):
+    graph = {"1": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "model.safetensors"}},
+             "2": {"class_type": "CLIPTextEncode", "inputs": {"text": "masterpiece, 1girl", "clip": ["1", 1]}}}
+    node, model = "2", "1"
+    for i in range(depth):
+        graph[f"r{i}"] = {"class_type": "Reroute", "inputs": {"": [node, 0]}}; node = f"r{i}"
+        graph[f"m{i}"] = {"class_type": "Reroute", "inputs": {"": [model, 0]}}; model = f"m{i}"
+    graph["3"] = {"class_type": "KSampler", "inputs": {"seed": 1, "model": [model, 0], "positive": [node, 0], "negative": [node, 0]}}
+    return graph
+
+def timed(fn, graphs, repeat):
+    # repeat 번 중 가장 빠른 값.
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try: results = [fn(g) for g in graphs]
+        except RecursionError: return None, "RecursionError"
+        best = min(best, time.perf_counter() - start)
+    return results, f"{best / len(graphs) * 1e6:.1f}"
+
+def report(name, graphs, repeat, run_legacy=True, legacy_repeat=None):
+    nodes = sum(len(g) for g in graphs) // len(graphs)
+    new_results, new_us = timed(resolve, graphs, repeat)
+    legacy_results, legacy_us = timed(legacy_resolve, graphs, legacy_repeat or repeat) if run_legacy else (None, "skipped")
+    same = "-" if legacy_results is None else ("yes" if legacy_results == new_results else "NO")
+    print(f"{name:<22}{nodes:>8}{legacy_us:>16}{new_us:>14}  {same}")
+    return same != "NO"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--samples", type=int, default=200, help="realistic 깊이별 그래프 수")
+    parser.add_argument("--depths", default="4,8,16,32")
+    parser.add_argument("--ladder-depths", default="8,16,20,24")
+    parser.add_argument("--chain-depths", default="100,1000,10000")
+    parser.add_argument("--legacy-max-ladder", type=int, default=20, help="이보다 깊은 ladder 는 재귀 구현을 건너뛴다 (2^깊이 방문)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    vocab, loras = make_vocabulary(rng, 500), [f"lora_{i:03d}" for i in range(50)]
+    print(f"{'graph':<22}{'nodes':>8}{'legacy us/img':>16}{'new us/img':>14}  same result")
+    ok = True
+    for depth in (int(d) for d in args.depths.split(',')):
+        ok &= report(f"realistic depth={depth}", [make_comfy_prompt(rng, vocab, loras, rng.getrandbits(32), depth) for _ in range(args.samples)], args.repeat)
+    for depth in (int(d) for d in args.ladder_depths.split(',')):
+        ok &= report(f"ladder depth={depth}", [make_ladder(depth)], args.repeat, run_legacy=depth <= args.legacy_max_ladder, legacy_repeat=1)
+    for depth in (int(d) for d in args.chain_depths.split(',')):
+        ok &= report(f"chain depth={depth}", [make_chain(depth)], args.repeat)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# DatabaseManager 의 쿼리당 오버헤드를 "쿼리마다 새 연결"(이전 방식)과 "스레드별 영구 연결 + WAL"(현재 방식)으로 비교한다.
+# 백그라운드 스레드가 일괄 쓰기를 하는 동안의 읽기 지연도 함께 측정한다.
+# 사용법: python benchmarks/bench_db_connection.py [--rows N] [--queries N]
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import DatabaseManager
+
+class FreshConnectionDatabaseManager(DatabaseManager):
+    # 변경 전 동작: 매 호출마다 sqlite3.connect, 기본 rollback 저널.
+    def _get_connection(self):
+        conn = sqlite3.connect(self.db_file, timeout=10)
+        conn.create_function("path_basename", 1, lambda p: os.path.basename(p) if p else "", deterministic=True)
+        return conn
+
+def build_db(db_file, rows):
+    db = DatabaseManager(db_file)
+    db.sync_files([f"/library/image_{i:06d}.png" for i in range(rows)])
+    db.close()
+    with sqlite3.connect(db_file) as conn: conn.execute("PRAGMA journal_mode=DELETE")
+
+def time_queries(db, paths):
+    samples = []
+    for path in paths:
+        start = time.perf_counter(); db.get_image_data(path); samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+def run(cls, db_file, paths, rows):
+    db = cls(db_file)
+    idle = time_queries(db, paths)
+    stop = threading.Event()
+    def writer():
+        while not stop.is_set(): db.update_image_cache_many([(f"/library/image_{i:06d}.png", {'prompt': 'a', 'negative_prompt': '', 'others': ''}, time.time()) for i in range(0, rows, 7)])
+    thread = threading.Thread(target=writer); thread.start()
+    busy = time_queries(db, paths)
+    stop.set(); thread.join()
+    db.close()
+    return idle, busy
+
+def describe(samples):
+    samples = sorted(samples)
+    return f"mean {statistics.fmean(samples):8.1f}us  p50 {samples[len(samples) // 2]:8.1f}us  p99 {samples[int(len(samples) * 0.99)]:8.1f}us"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    paths = [f"/library/image_{i * 7 % args.rows:06d}.png" for i in range(args.queries)]
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, cls in (("fresh connection", FreshConnectionDatabaseManager), ("pooled + WAL", DatabaseManager)):
+            db_file = os.path.join(tmp, f"{cls.__name__}.db")
+            build_db(db_file, args.rows)
+            idle, busy = run(cls, db_file, paths, args.rows)
+            print(f"{name:<18} idle:   {describe(idle)}")
+            print(f"{'':<18} writer: {describe(busy)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# 헤더 전용 메타데이터 리더(read_image_metadata)와 PIL(Image.open().info) 경로의 읽은 바이트 수와 지연 시간을 비교한다.
+# 사용법: python benchmarks/bench_metadata_reader.py [이미지 폴더] [--repeat N]
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PIL import Image, PngImagePlugin
+from app import read_image_metadata_from, parse_image_metadata
+
+A1111_PARAMETERS = "masterpiece, best quality, 1girl, solo, long hair, looking at viewer\nNegative prompt: lowres, bad anatomy\nSteps: 28, Sampler: Euler a, CFG scale: 7, Seed: 1234, Size: 832x1216, Model: animagine"
+
+class CountingReader(io.BufferedReader):
+    # 버퍼 크기와 무관하게 리더가 실제로 요청해서 받은 바이트 수를 센다.
+    def __init__(self, raw):
+        super().__init__(raw, buffer_size=512); self.bytes_read = 0
+    def read(self, size=-1):
+        data = super().read(size); self.bytes_read += len(data); return data
+    def read1(self, size=-1):
+        data = super().read1(size); self.bytes_read += len(data); return data
+    def readinto(self, b):
+        n = super().readinto(b); self.bytes_read += n or 0; return n
+
+def make_samples(folder, size=(2048, 2048)):
+    img = Image.effect_noise(size, 64).convert("RGB")
+    png_info = PngImagePlugin.PngInfo(); png_info.add_text("parameters", A1111_PARAMETERS)
+    img.save(os.path.join(folder, "a1111.png"), pnginfo=png_info)
+    comfy_prompt = {"3": {"class_type": "KSampler", "inputs": {"seed": 1, "steps": 20, "cfg": 7, "sampler_name": "euler", "scheduler": "normal", "denoise": 1, "model": ["4", 0], "positive": ["6", 0], "negative": ["7", 0]}},
+                    "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "model.safetensors"}},
+                    "6": {"class_type": "CLIPTextEncode", "inputs": {"text": "a cat"}}, "7": {"class_type": "CLIPTextEncode", "inputs": {"text": "blurry"}}}
+    png_info = PngImagePlugin.PngInfo(); png_info.add_text("prompt", json.dumps(comfy_prompt)); png_info.add_text("workflow", json.dumps({"nodes": []}))
+    img.save(os.path.join(folder, "comfy.png"), pnginfo=png_info)
+    exif = Image.Exif(); exif.get_ifd(0x8769)[0x9286] = b"UNICODE\0" + A1111_PARAMETERS.encode("utf-16-be")
+    img.save(os.path.join(folder, "a1111.jpg"), exif=exif.tobytes(), quality=90)
+    img.save(os.path.join(folder, "a1111.webp"), exif=exif.tobytes(), quality=80)
+    exif = Image.Exif(); exif[0x0110] = "prompt:" + json.dumps(comfy_prompt)
+    img.save(os.path.join(folder, "comfy.webp"), exif=exif.tobytes(), quality=80)
+
+def measure(path, reader, repeat):
+    total_bytes, start = 0, time.perf_counter()
+    for _ in range(repeat):
+        with CountingReader(io.FileIO(path)) as f:
+            result = reader(f); total_bytes += f.bytes_read
+    return (time.perf_counter() - start) / repeat * 1000, total_bytes // repeat, result
+
+def pil_reader(f):
+    with Image.open(f) as img: return dict(img.info)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder", nargs="?")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.folder or tmp
+        if not args.folder: make_samples(folder)
+        print(f"{'file':<24}{'size':>10}{'header ms':>11}{'header B':>10}{'PIL ms':>9}{'PIL B':>10}  prompt found (header/PIL)")
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if not name.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')): continue
+            fast_ms, fast_bytes, fast_info = measure(path, read_image_metadata_from, args.repeat)
+            pil_ms, pil_bytes, pil_info = measure(path, pil_reader, args.repeat)
+            found = [bool(parse_image_metadata(info or {})['prompt']) for info in (fast_info, pil_info)]
+            print(f"{name[:23]:<24}{os.path.getsize(path):>10}{fast_ms:>11.3f}{fast_bytes:>10}{pil_ms:>9.3f}{pil_bytes:>10}  {found[0]}/{found[1]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# 유사 이미지 검색을 "모든 이미지의 프롬프트를 읽어 태그 교집합 계산"(이전 방식)과 토큰 역색인 + IDF top-k(현재 방식)로 비교한다.
+# 사용법: python benchmarks/bench_similar.py [--images N] [--vocab N] [--queries N]
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import DatabaseManager
+
+def build_db(db_file, images, vocab_size, seed=0):
+    rng = random.Random(seed)
+    vocab = [f"tag_{i}" for i in range(vocab_size)]
+    db = DatabaseManager(db_file)
+    paths = [f"/library/image_{i:06d}.png" for i in range(images)]
+    db.sync_files(paths)
+    start = time.perf_counter()
+    for i in range(0, images, 2000):
+        rows = []
+        for path in paths[i:i + 2000]:
+            tags = ["masterpiece", "best quality"] + rng.sample(vocab[:vocab_size // 10], 5) + rng.sample(vocab, 15)
+            rows.append((path, {'prompt': ", ".join(tags), 'negative_prompt': '', 'others': ''}, time.time()))
+        db.update_image_cache_many(rows)
+    print(f"indexed {images} images in {time.perf_counter() - start:.1f}s")
+    return db, paths
+
+def scan_similar(db, paths, source_path):
+    # 변경 전 동작: 이미지마다 get_parsed_prompts 를 호출하고 파이썬에서 교집합 크기로 정렬.
+    source_prompt, _ = db.get_parsed_prompts(source_path)
+    source_tags = {tag.strip().lower() for tag in source_prompt.split(',') if tag.strip()}
+    scores = []
+    for path in paths:
+        if path == source_path: continue
+        other_prompt, _ = db.get_parsed_prompts(path)
+        if not other_prompt: continue
+        score = len(source_tags.intersection({tag.strip().lower() for tag in other_prompt.split(',') if tag.strip()}))
+        if score > 0: scores.append((score, path))
+    scores.sort(key=lambda x: x[0], reverse=True)
+    return scores
+
+def measure(fn, sources):
+    samples = []
+    for source in sources:
+        start = time.perf_counter(); fn(source); samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return f"mean {statistics.fmean(samples):8.1f}ms  p50 {samples[len(samples) // 2]:8.1f}ms  max {samples[-1]:8.1f}ms"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=50000)
+    parser.add_argument("--vocab", type=int, default=3000)
+    parser.add_argument("--queries", type=int, default=5)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db, paths = build_db(os.path.join(tmp, "similar.db"), args.images, args.vocab)
+        sources = paths[::max(1, len(paths) // args.queries)][:args.queries]
+        print(f"{'full scan':>16}: {measure(lambda s: scan_similar(db, paths, s), sources)}")
+        print(f"{'token index':>16}: {measure(lambda s: db.find_similar_images(s, limit=500), sources)}")
+        db.close()
+
+if __name__ == "__main__":
+    main()
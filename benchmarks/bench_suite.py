@@ -0,0 +1,158 @@
+# 주요 경로(폴더 동기화, 메타데이터 파싱, 썸네일, 검색, 유사 이미지, 보기 모드 필터, 일괄 태그)를 합성 코퍼스로 화면 없이 측정하고 JSON 으로 남긴다.
+# 커밋 사이의 회귀는 --compare 로 이전 결과와 비교해 찾는다 (threshold 배 이상 느려진 항목이 있으면 종료 코드 1).
+# 코퍼스는 (개수, 시드) 별로 임시 폴더에 만들어 두고 다음 실행에서 재사용한다.
+# 사용법: python benchmarks/bench_suite.py [--images N] [--seed N] [--output results.json] [--compare baseline.json] [--threshold 1.25]
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import (COMFY_SEED_RE, DatabaseManager, GalleryFilter, MetadataIndexer, ParseCache, ThumbnailStore, parse_image_metadata,
+                 read_image_metadata, render_thumbnail, scan_image_files)
+from synthetic_corpus import generate_corpus
+
+NOISE_FLOOR_MS = 1.0
+
+class Suite:
+    def __init__(self, repeat):
+        self.repeat, self.results = repeat, {}
+    def measure(self, name, fn, items=1, repeat=None):
+        # repeat 번 실행 중 가장 빠른 값 (다른 프로세스 간섭에 덜 흔들린다). items 는 한 번 실행에 처리한 항목 수 (항목당 시간 계산용).
+        samples, result = [], None
+        for _ in range(repeat or self.repeat):
+            start = time.perf_counter(); result = fn(); samples.append(time.perf_counter() - start)
+        seconds = min(samples)
+        self.results[name] = {"ms": round(seconds * 1000, 3), "items": items, "per_item_us": round(seconds / max(1, items) * 1e6, 3)}
+        print(f"{name:<32} {seconds * 1000:>12.2f} ms  {seconds / max(1, items) * 1e6:>12.2f} us/item  ({items} items)", file=sys.stderr)
+        return result
+
+def git_revision():
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError): return None
+
+def run(args, corpus):
+    suite = Suite(args.repeat)
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "bench.db"))
+        # 폴더 동기화: 빈 DB 에 처음 반영, 그리고 바뀐 것이 없는 재스캔.
+        entries = suite.measure("sync.scan", lambda: scan_image_files(args.corpus), items=corpus["files"])
+        suite.measure("sync.initial", lambda: db.sync_files(entries), items=len(entries), repeat=1)
+        suite.measure("sync.rescan", lambda: db.sync_files(scan_image_files(args.corpus)), items=len(entries))
+        paths = db.get_all_image_paths()
+
+        # 메타데이터: 파일 하나씩 읽고 파싱(형식별), 그리고 프로세스 풀 인덱서로 전체 반영.
+        sample = rng.sample(paths, min(len(paths), args.parse_sample))
+        infos = {path: read_image_metadata(path) for path in sample}
+        for kind, key in (("a1111", "parameters"), ("comfy", "prompt")):
+            subset = [info for info in infos.values() if key in info]
+            suite.measure(f"parse.{kind}", lambda s=subset: [parse_image_metadata(info) for info in s], items=len(subset))
+        suite.measure("parse.read_header", lambda: [read_image_metadata(p) for p in sample], items=len(sample))
+        # 배치 생성: 같은 ComfyUI 워크플로를 시드만 바꿔 32장씩. 직접 파싱과 파싱 캐시(빈 캐시에서 시작)를 비교한다.
+        workflows = [info["prompt"] for info in infos.values() if "prompt" in info and "parameters" not in info][:16]
+        batch = [{"prompt": COMFY_SEED_RE.sub(lambda m: m.group(1) + str(rng.getrandbits(32)), w)} for w in workflows for _ in range(32)]
+        suite.measure("parse.batch_direct", lambda: [parse_image_metadata(info) for info in batch], items=len(batch))
+        suite.measure("parse.batch_cached", lambda: (lambda cache: [cache.parse(info) for info in batch])(ParseCache()), items=len(batch))
+        suite.measure("parse.indexer", lambda: MetadataIndexer(db, workers=args.workers).run(), items=len(paths), repeat=1)
+
+        # 썸네일: 렌더링(디코딩+축소+인코딩+dHash)과 캐시 저장.
+        thumb_sample = sample[:args.thumbnail_sample]
+        rendered = suite.measure("thumbnails.render", lambda: [(p, render_thumbnail(p)) for p in thumb_sample], items=len(thumb_sample), repeat=1)
+        store = ThumbnailStore(db, root=os.path.join(tmp, "thumbnails"))
+        suite.measure("thumbnails.store", lambda: [store.put(p, data) for p, (data, _) in rendered], items=len(rendered), repeat=1)
+        suite.measure("thumbnails.read", lambda: [store.get(p) for p, _ in rendered], items=len(rendered))
+        store.close()
+
+        # 보기 모드 데이터 준비 + 일괄 작업: 즐겨찾기 10%, 앨범 5%, 태그 20%.
+        batch = rng.sample(paths, min(len(paths), args.batch_size))
+        suite.measure("batch.favorite", lambda: db.bulk_set_favorite(batch, True), items=len(batch), repeat=1)
+        suite.measure("batch.add_tags", lambda: db.bulk_add_tags(batch, ["bench_a", "bench_b", "bench_c"]), items=len(batch), repeat=1)
+        tag_ids = [db.get_tag_id_by_name(t) for t in ("bench_a", "bench_b", "bench_c")]
+        suite.measure("batch.remove_tags", lambda: db.bulk_remove_tags(batch, tag_ids), items=len(batch), repeat=1)
+        db.bulk_set_favorite(rng.sample(paths, len(paths) // 10), True)
+        db.add_album("bench"); album_id = db.get_albums()[0][0]
+        db.bulk_add_to_album(album_id, rng.sample(paths, len(paths) // 20))
+        tag_map = db.bulk_add_tags(rng.sample(paths, len(paths) // 5), ["view_tag"])
+        db.bulk_add_tags(rng.sample(paths, len(paths) // 10), ["hidden_tag"])
+
+        # 보기 모드: DB 첫 페이지 쿼리.
+        modes = {"all": {}, "favorites": {"favorites": True}, "album": {"album_id": album_id}, "tag": {"tag_id": tag_map["view_tag"]}, "blacklist": {"blacklist": ("hidden_tag",)}}
+        for mode, kwargs in modes.items():
+            suite.measure(f"view.first_page.{mode}", lambda k=kwargs: db.query_images(GalleryFilter(**k)), items=1)
+        suite.measure("view.near_duplicates", lambda: db.get_near_duplicate_groups(0.8, GalleryFilter(blacklist=("hidden_tag",))), items=1, repeat=1)
+
+        # 생성 파라미터 패싯: 가장 흔한 모델 + CFG 범위의 첫 페이지, 그리고 패널이 여는 패싯별 개수 집계.
+        top_model = (db.get_facet_counts(GalleryFilter(), "model", limit=1) or [(None, 0)])[0][0]
+        facet_filter = GalleryFilter(facets={"model": (top_model,), "cfg": (5, 7)})
+        suite.measure("view.facet.first_page", lambda: db.query_images(facet_filter), items=1)
+        suite.measure("view.facet.counts", lambda: [db.get_facet_counts(facet_filter, f) for f in ("model", "sampler", "scheduler", "lora")], items=4)
+
+        # 검색: 흔한 태그, 드문 태그, 구문, 접두어.
+        vocab = corpus.get("vocabulary") or ["hair"]
+        terms = ["masterpiece", vocab[0], vocab[-1], '"best quality"', vocab[1][:3]]
+        suite.measure("search.first_page", lambda: [db.query_images(GalleryFilter(search=t)) for t in terms], items=len(terms))
+
+        # 유사 이미지: 프롬프트 토큰 역색인 top-k.
+        sources = rng.sample(paths, min(len(paths), 20))
+        suite.measure("similar.find", lambda: [db.find_similar_images(s, limit=500) for s in sources], items=len(sources))
+        db.close()
+    return suite.results
+
+def compare(results, baseline, threshold):
+    # 느려진 비율이 threshold 이상이고 절대 차이가 NOISE_FLOOR_MS 를 넘는 항목을 회귀로 본다.
+    regressions = []
+    print(f"\n{'benchmark':<32} {'baseline ms':>12} {'current ms':>12} {'ratio':>7}")
+    for name, current in results.items():
+        old = baseline.get(name)
+        if not old: print(f"{name:<32} {'-':>12} {current['ms']:>12.2f} {'new':>7}"); continue
+        ratio = current["per_item_us"] / old["per_item_us"] if old["per_item_us"] else float("inf")
+        regressed = ratio >= threshold and current["ms"] - old["ms"] > NOISE_FLOOR_MS
+        if regressed: regressions.append(name)
+        print(f"{name:<32} {old['ms']:>12.2f} {current['ms']:>12.2f} {ratio:>6.2f}x{'  <-- regression' if regressed else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=5000, help="코퍼스 이미지 수 (1k~500k)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--comfy-ratio", type=float, default=0.4)
+    parser.add_argument("--max-depth", type=int, default=8)
+    parser.add_argument("--corpus", help="코퍼스 폴더 (기본: 임시 폴더 아래 개수/시드별 폴더, 재사용됨)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--parse-sample", type=int, default=2000)
+    parser.add_argument("--thumbnail-sample", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--output", help="결과 JSON 파일 (기본: 표준 출력)")
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args()
+    args.corpus = args.corpus or os.path.join(tempfile.gettempdir(), f"prompt_gallery_corpus_{args.images}_{args.seed}_{args.comfy_ratio}_{args.max_depth}")
+    os.makedirs(args.corpus, exist_ok=True)
+    print(f"corpus: {args.corpus}", file=sys.stderr)
+    corpus = generate_corpus(args.corpus, args.images, args.seed, args.comfy_ratio, args.max_depth, on_progress=lambda done, total: print(f"generating {done}/{total}", file=sys.stderr) if done % 10000 == 0 else None)
+    results = run(args, corpus)
+    report = {"meta": {"revision": git_revision(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                       "platform": platform.platform(), "cpus": os.cpu_count(), "workers": args.workers, "corpus": corpus["params"]}, "results": results}
+    if args.output:
+        with open(args.output, 'w') as f: json.dump(report, f, indent=2)
+    else: print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare, 'r') as f: baseline = json.load(f)
+        if baseline["meta"].get("corpus") != corpus["params"]: print("경고: 기준 결과와 코퍼스 설정이 다릅니다.", file=sys.stderr)
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions: print(f"\n{len(regressions)}개 항목이 {args.threshold}배 이상 느려졌습니다: {', '.join(regressions)}"); sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# 프롬프트 번역을 "조각마다 요청 1번, 캐시 없음"(이전 방식)과 TranslationEngine(중복 제거 + 묶음 요청 + 동시 요청 + SQLite 캐시)으로 비교한다.
+# 네트워크 대신 요청마다 --latency 만큼 지연하는 로컬 LibreTranslate 호환 대역 서버를 띄운다.
+# 사용법: python benchmarks/bench_translation.py [--prompts N] [--tags N] [--vocab N] [--latency SEC] [--workers N]
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import DatabaseManager, HttpTranslateBackend, TranslationEngine, split_prompt_fragments
+
+def start_stand_in_server(latency):
+    stats = {"requests": 0, "fragments": 0}
+    lock = threading.Lock()
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            texts = payload["q"] if isinstance(payload["q"], list) else [payload["q"]]
+            with lock: stats["requests"] += 1; stats["fragments"] += len(texts)
+            time.sleep(latency)
+            body = json.dumps({"translatedText": [f"[{payload['target']}] {t}" for t in texts]}).encode('utf-8')
+            self.send_response(200); self.send_header("Content-Type", "application/json"); self.send_header("Content-Length", str(len(body))); self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *args): pass
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+def legacy_translate(backend, text):
+    # 변경 전 TranslatorService.translate: 조각마다 순서대로 한 번씩 요청.
+    return {part: backend.translate_batch([part], 'ko')[0] for part in split_prompt_fragments(text)}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prompts", type=int, default=20)
+    parser.add_argument("--tags", type=int, default=30)
+    parser.add_argument("--vocab", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    rng = random.Random(0)
+    vocab = [f"tag number {i}" for i in range(args.vocab)]
+    prompts = [", ".join(["masterpiece", "best quality"] + rng.choices(vocab, k=args.tags)) for _ in range(args.prompts)]
+    server, stats = start_stand_in_server(args.latency)
+    backend = HttpTranslateBackend(f"http://127.0.0.1:{server.server_port}/translate")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseManager(os.path.join(tmp, "translation.db"))
+        engine = TranslationEngine(db, backend, workers=args.workers, batch_size=max(1, args.tags // args.workers))
+        print(f"{'method':>22} {'total (s)':>10} {'per prompt (ms)':>16} {'requests':>9} {'fragments sent':>15}")
+        for name, fn in (("per-fragment", lambda p: legacy_translate(backend, p)), ("engine (cold cache)", lambda p: engine.translate(split_prompt_fragments(p))),
+                         ("engine (warm cache)", lambda p: engine.translate(split_prompt_fragments(p)))):
+            stats.update(requests=0, fragments=0)
+            start = time.perf_counter()
+            for prompt in prompts: fn(prompt)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>22} {elapsed:>10.2f} {elapsed / len(prompts) * 1000:>16.1f} {stats['requests']:>9} {stats['fragments']:>15}")
+        engine.shutdown(); db.close()
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# 벤치마크용 합성 코퍼스 생성기. 같은 (개수, 시드, 옵션)이면 항상 같은 파일을 만든다.
+# A1111 은 실제와 같은 형식의 `parameters` 텍스트를, ComfyUI 는 깊이가 제각각인 `prompt` 노드 그래프를 작은 PNG/WebP/JPEG 에 넣는다.
+# (PNG 는 tEXt 청크, WebP/JPEG 는 A1111 이 EXIF UserComment, ComfyUI 가 IFD0 Make 태그의 'prompt:{...}')
+# 사용법: python benchmarks/synthetic_corpus.py 출력폴더 [--count N] [--seed N] [--comfy-ratio R] [--max-depth N] [--formats png,webp,jpg]
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from PIL import Image, PngImagePlugin
+
+MANIFEST_FILE = "corpus.json"
+QUALITY_TAGS = ["masterpiece", "best quality", "amazing quality", "very aesthetic", "absurdres", "highres"]
+SUBJECT_TAGS = ["1girl", "1boy", "2girls", "solo", "multiple girls", "animal", "cat", "dog", "landscape", "scenery", "no humans"]
+SAMPLERS = ["Euler a", "Euler", "DPM++ 2M Karras", "DPM++ SDE Karras", "DDIM", "UniPC"]
+COMFY_SAMPLERS = ["euler", "euler_ancestral", "dpmpp_2m", "dpmpp_sde", "ddim", "uni_pc"]
+MODELS = ["animagine-xl-3.1", "ponyDiffusionV6XL", "sd_xl_base_1.0", "dreamshaper_8", "counterfeitV30", "anything-v5"]
+NEGATIVE = "lowres, bad anatomy, bad hands, text, error, missing fingers, extra digit, fewer digits, cropped, worst quality, low quality, jpeg artifacts, signature, watermark, blurry"
+
+def make_vocabulary(rng, size=5000):
+    colors = ["red", "blue", "green", "black", "white", "silver", "pink", "purple", "blonde", "brown"]
+    things = ["hair", "eyes", "dress", "skirt", "shirt", "jacket", "hat", "ribbon", "background", "sky", "flower", "sword"]
+    vocab = [f"{c} {t}" for c in colors for t in things] + [f"tag_{i:05d}" for i in range(size)]
+    rng.shuffle(vocab)
+    return vocab
+
+def make_prompt(rng, vocab, loras):
+    # 자주 쓰는 태그(앞쪽 10%)와 드문 태그를 섞고, 일부는 (tag:1.2) 가중치와 <lora:이름:강도> 를 붙인다.
+    tags = rng.sample(QUALITY_TAGS, rng.randint(1, 4)) + [rng.choice(SUBJECT_TAGS)]
+    tags += rng.sample(vocab[:len(vocab) // 10], rng.randint(3, 10)) + rng.sample(vocab, rng.randint(5, 25))
+    tags = [f"({t}:{rng.choice([0.8, 1.1, 1.2, 1.3])})" if rng.random() < 0.1 else t for t in tags]
+    if rng.random() < 0.3: tags.append(f"<lora:{rng.choice(loras)}:{rng.choice([0.6, 0.8, 1.0])}>")
+    return ", ".join(tags)
+
+def make_a1111_parameters(rng, vocab, loras, seed):
+    width, height = rng.choice([(832, 1216), (1024, 1024), (512, 768), (768, 512)])
+    settings = [f"Steps: {rng.choice([20, 25, 28, 30, 40])}", f"Sampler: {rng.choice(SAMPLERS)}", f"CFG scale: {rng.choice([5, 6, 7, 7.5, 9])}", f"Seed: {seed}",
+                f"Size: {width}x{height}", f"Model hash: {rng.getrandbits(40):010x}", f"Model: {rng.choice(MODELS)}"]
+    if rng.random() < 0.3: settings += ["Denoising strength: 0.4", "Hires upscale: 2", "Hires upscaler: R-ESRGAN 4x+ Anime6B"]
+    return f"{make_prompt(rng, vocab, loras)}\nNegative prompt: {NEGATIVE}\n" + ", ".join(settings)
+
+def make_comfy_prompt(rng, vocab, loras, seed, depth):
+    # KSampler 의 positive/negative 가 depth 단계의 조건 노드(ConditioningCombine/SetArea/Concat)와 문자열 노드를 거쳐 CLIPTextEncode 에 닿고,
+    # model 은 LoraLoader 사슬을 거쳐 CheckpointLoaderSimple 에 닿는 그래프. 같은 인코더를 여러 경로가 공유하는 경우도 만든다.
+    graph, ids = {}, iter(range(1, 1_000_000))
+    def add(class_type, inputs):
+        node_id = str(next(ids)); graph[node_id] = {"class_type": class_type, "inputs": inputs}; return node_id
+    checkpoint = add("CheckpointLoaderSimple", {"ckpt_name": f"{rng.choice(MODELS)}.safetensors"})
+    model, clip = [checkpoint, 0], [checkpoint, 1]
+    for _ in range(rng.randint(0, max(0, depth // 2))):
+        lora = add("LoraLoader", {"lora_name": f"{rng.choice(loras)}.safetensors", "strength_model": 0.8, "strength_clip": 0.8, "model": model, "clip": clip})
+        model, clip = [lora, 0], [lora, 1]
+    def encoder(text):
+        if rng.random() < 0.3: text = [add("PrimitiveString", {"value": text}), 0]
+        return add("CLIPTextEncode", {"text": text, "clip": clip})
+    def conditioning_chain(text, levels):
+        node = encoder(text)
+        shared = node
+        for _ in range(levels):
+            kind = rng.choice(["ConditioningSetArea", "ConditioningCombine", "ConditioningConcat"])
+            if kind == "ConditioningSetArea": node = add(kind, {"conditioning": [node, 0], "width": 512, "height": 512, "x": 0, "y": 0, "strength": 1.0})
+            elif kind == "ConditioningCombine": node = add(kind, {"conditioning_1": [node, 0], "conditioning_2": [shared, 0]})
+            else: node = add(kind, {"conditioning_to": [node, 0], "conditioning_from": [shared, 0]})
+        return node
+    positive = conditioning_chain(make_prompt(rng, vocab, loras), depth)
+    negative = conditioning_chain(NEGATIVE, rng.randint(0, depth))
+    latent = add("EmptyLatentImage", {"width": 1024, "height": 1024, "batch_size": 1})
+    sampler = add("KSampler", {"seed": seed, "steps": rng.choice([20, 25, 30]), "cfg": rng.choice([5.0, 7.0, 8.0]), "sampler_name": rng.choice(COMFY_SAMPLERS),
+                               "scheduler": rng.choice(["normal", "karras"]), "denoise": 1.0, "model": model, "positive": [positive, 0], "negative": [negative, 0], "latent_image": [latent, 0]})
+    decode = add("VAEDecode", {"samples": [sampler, 0], "vae": [checkpoint, 2]})
+    add("SaveImage", {"images": [decode, 0], "filename_prefix": "ComfyUI"})
+    return graph
+
+def base_images(rng, count=64, size=(64, 64)):
+    # 썸네일/지각 해시 측정이 의미 있도록 색과 도형이 다른 작은 이미지 몇 개를 돌려 쓴다.
+    images = []
+    for _ in range(count):
+        img = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+        for _ in range(3):
+            x0, y0 = rng.randrange(size[0]), rng.randrange(size[1])
+            img.paste(tuple(rng.randrange(256) for _ in range(3)), (x0, y0, min(size[0], x0 + rng.randint(8, 32)), min(size[1], y0 + rng.randint(8, 32))))
+        images.append(img)
+    return images
+
+def save_image(img, path, fmt, key, text):
+    if fmt == "png":
+        info = PngImagePlugin.PngInfo(); info.add_text(key, text)
+        img.save(path, pnginfo=info, compress_level=1); return
+    exif = Image.Exif()
+    if key == "parameters": exif.get_ifd(0x8769)[0x9286] = b"UNICODE\0" + text.encode("utf-16-be")
+    else: exif[0x010F] = f"{key}:{text}"
+    img.save(path, exif=exif.tobytes(), quality=80)
+
+def generate_corpus(folder, count, seed=0, comfy_ratio=0.4, max_depth=8, formats=("png", "webp", "jpg"), per_dir=1000, on_progress=None):
+    # 같은 설정으로 이미 만들어 둔 코퍼스가 있으면 그대로 쓴다. 반환값은 매니페스트(dict).
+    params = {"count": count, "seed": seed, "comfy_ratio": comfy_ratio, "max_depth": max_depth, "formats": list(formats), "per_dir": per_dir}
+    manifest_path = os.path.join(folder, MANIFEST_FILE)
+    try:
+        with open(manifest_path, 'r') as f: manifest = json.load(f)
+        if manifest.get("params") == params: return manifest
+    except (OSError, json.JSONDecodeError): pass
+    rng = random.Random(seed)
+    vocab, loras = make_vocabulary(rng), [f"lora_{i:03d}" for i in range(200)]
+    images = base_images(rng)
+    start, files = time.perf_counter(), []
+    for i in range(count):
+        subdir = os.path.join(folder, f"batch_{i // per_dir:04d}")
+        if i % per_dir == 0: os.makedirs(subdir, exist_ok=True)
+        fmt, image_seed = formats[i % len(formats)], rng.getrandbits(32)
+        if rng.random() < comfy_ratio: key, text = "prompt", json.dumps(make_comfy_prompt(rng, vocab, loras, image_seed, rng.randint(1, max_depth)))
+        else: key, text = "parameters", make_a1111_parameters(rng, vocab, loras, image_seed)
+        path = os.path.join(subdir, f"{i:07d}_{image_seed:08x}.{fmt}")
+        save_image(images[i % len(images)], path, fmt, key, text)
+        files.append(os.path.relpath(path, folder))
+        if on_progress and (i + 1) % 1000 == 0: on_progress(i + 1, count)
+    manifest = {"params": params, "files": count, "generation_seconds": round(time.perf_counter() - start, 2), "vocabulary": vocab[:200]}
+    with open(manifest_path, 'w') as f: json.dump(manifest, f)
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--comfy-ratio", type=float, default=0.4)
+    parser.add_argument("--max-depth", type=int, default=8)
+    parser.add_argument("--formats", default="png,webp,jpg")
+    args = parser.parse_args()
+    os.makedirs(args.folder, exist_ok=True)
+    manifest = generate_corpus(args.folder, args.count, args.seed, args.comfy_ratio, args.max_depth, tuple(args.formats.split(",")),
+                               on_progress=lambda done, total: print(f"{done}/{total}", file=sys.stderr))
+    print(f"{manifest['files']} files in {args.folder} ({manifest['generation_seconds']}s)")
+
+if __name__ == "__main__":
+    main()
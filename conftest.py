@@ -0,0 +1 @@
+# pytest 가 저장소 루트를 sys.path 에 넣도록 두는 파일 (tests/ 에서 app, indexer 를 바로 import 한다).
@@ -0,0 +1,184 @@
+# 화면 없이 라이브러리를 색인하는 명령줄 도구. 앱과 같은 DB/썸네일 캐시/설정 파일을 쓰므로, 색인 후 앱을 열면 스캔·파싱·썸네일 생성을 다시 하지 않는다.
+# 진행 상황은 배치 단위로 커밋되므로 중단(Ctrl+C, 종료 신호)한 뒤 다시 실행하면 남은 작업부터 이어서 처리한다.
+# 사용법: python indexer.py [--folder DIR] [--workers N] [--stages scan,parse,thumbnails] [--json]
+# 종료 코드: 0 완료, 1 일부 파일 처리 실패, 2 잘못된 인자/설정, 130 중단됨
+import argparse
+import io
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from PIL import Image
+
+from app import (CONFIG_FILE, DB_FILE, THUMBNAIL_DIR, DatabaseManager, MetadataIndexer, ThumbnailStore, render_thumbnail,
+                 scan_image_files, setup_directories, visual_hash)
+
+EXIT_OK, EXIT_FAILURES, EXIT_USAGE, EXIT_INTERRUPTED = 0, 1, 2, 130
+STAGES = ("scan", "parse", "thumbnails")
+
+class Progress:
+    # 단계별 처리량을 stderr 에 interval 초마다 한 줄씩 찍는다.
+    def __init__(self, stage, quiet=False, interval=2.0):
+        self.stage, self.quiet, self.interval = stage, quiet, interval
+        self.start = self.last_print = time.perf_counter()
+    def update(self, done, total):
+        now = time.perf_counter()
+        if self.quiet or (now - self.last_print < self.interval and done < total): return
+        self.last_print, elapsed = now, now - self.start
+        rate = done / elapsed if elapsed else 0.0
+        eta = f", 남은 시간 {(total - done) / rate:.0f}초" if rate and done < total else ""
+        print(f"[{self.stage}] {done}/{total} ({rate:.0f}/s{eta})", file=sys.stderr, flush=True)
+    def finish(self, **counts):
+        elapsed = time.perf_counter() - self.start
+        return dict(counts, seconds=round(elapsed, 3), per_second=round(counts.get("processed", 0) / elapsed, 1) if elapsed else 0.0)
+
+def run_concurrently(fn, roots):
+    # 루트마다 스레드 하나. 스캔은 디렉터리 I/O 대기가, 파싱은 각자의 프로세스 풀이 대부분이므로 스레드로 충분하다.
+    results = {}
+    def run(root): results[root[0]] = fn(root)
+    threads = [threading.Thread(target=run, args=(root,), daemon=True) for root in roots]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return [results[root[0]] for root in roots if root[0] in results]
+
+def run_scan(db, roots, recursive, quiet):
+    progress = Progress("scan", quiet)
+    def scan(root):
+        root_id, path, label, _ = root
+        root_progress = Progress(f"scan {label}", quiet)
+        # 폴더가 없으면 (드라이브가 빠진 경우) 빈 스캔으로 그 루트의 색인을 지우지 않도록 건너뛴다.
+        if not os.path.isdir(path): print(f"경고: 루트 폴더가 없어 건너뜁니다: {label} ({path})", file=sys.stderr); return 0, 0
+        entries = scan_image_files(path, recursive=recursive)
+        moved = db.sync_files(entries, root_id)
+        root_progress.update(len(entries), len(entries))
+        return len(entries), moved
+    results = run_concurrently(scan, roots)
+    files = sum(n for n, _ in results)
+    return progress.finish(roots=len(roots), files=files, processed=files, moved=sum(m for _, m in results))
+
+def run_parse(db, roots, workers, stop, quiet):
+    # 루트마다 MetadataIndexer 를 따로 돌리고 작업 프로세스 수는 루트끼리 나눈다. 토큰/파라미터 색인과 캐시 정리는 끝에서 한 번만.
+    progress = Progress("parse", quiet)
+    def parse(root):
+        indexer = MetadataIndexer(db, workers=max(1, workers // max(1, len(roots))), on_progress=Progress(f"parse {root[2]}", quiet).update)
+        threading.Thread(target=lambda: stop.wait() and indexer.cancel(), daemon=True).start()
+        return indexer.run(root_id=root[0]), indexer.failed
+    results = run_concurrently(parse, roots)
+    written, failed = sum(n for n, _ in results), sum(f for _, f in results)
+    tokens = db.index_missing_prompt_tokens() if not stop.is_set() else 0
+    params = db.index_missing_generation_params() if not stop.is_set() else 0
+    if not stop.is_set(): db.prune_parse_cache()
+    return progress.finish(processed=written, failed=failed, tokens_indexed=tokens or 0, params_indexed=params or 0)
+
+def run_thumbnails(db, store, roots, workers, stop, quiet):
+    # 선택한 루트의 이미지 중 현재 (경로, mtime, 크기) 키의 썸네일이 없는 것만 프로세스 풀에서 만든다. 결과는 한 장씩 저장되므로 중단해도 만든 만큼은 남는다.
+    progress = Progress("thumbnails", quiet)
+    todo, keys, root_ids = [], {}, [root[0] for root in roots]
+    paths = db.get_all_image_paths(root_ids)
+    for i in range(0, len(paths), 2000):
+        for path in paths[i:i + 2000]:
+            try: keys[path] = store.key_for(path)
+            except OSError: continue
+        existing = db.get_existing_thumbnail_keys(keys.values())
+        todo.extend(path for path, key in keys.items() if key not in existing)
+        keys.clear()
+    done, failed = 0, []
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending, queued = set(), iter(todo)
+            while True:
+                while not stop.is_set() and len(pending) < workers * 2:
+                    path = next(queued, None)
+                    if path is None: break
+                    future = executor.submit(render_thumbnail, path, store.max_size, store.fmt); future.path = path; pending.add(future)
+                if not pending: break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    try: data, value = future.result()
+                    except Exception as e: failed.append(future.path); print(f"Error creating thumbnail for {future.path}: {e}", file=sys.stderr); continue
+                    store.put(future.path, data); db.set_visual_hash(future.path, value)
+                    done += 1; progress.update(done + len(failed), len(todo))
+    # 지각 해시가 도입되기 전에 만들어진 썸네일은 캐시된 바이트에서 해시만 채운다.
+    hashed = 0
+    for path in ([] if stop.is_set() else db.get_paths_missing_visual_hash(root_ids)):
+        if stop.is_set(): break
+        data = store.peek(path)
+        if data is None: continue
+        try:
+            with Image.open(io.BytesIO(data)) as img: db.set_visual_hash(path, visual_hash(img)); hashed += 1
+        except Exception as e: print(f"Error hashing thumbnail for {path}: {e}", file=sys.stderr)
+    store.close()
+    return progress.finish(missing=len(todo), processed=done, failed=len(failed), hashed=hashed)
+
+def load_config(path):
+    try:
+        with open(path, 'r') as f: return json.load(f)
+    except FileNotFoundError: return {}
+
+def select_roots(db, folder, default_folder):
+    # 앱과 같은 루트 목록(DB 의 roots)을 쓴다. 루트가 없는 DB 는 앱과 마찬가지로 설정의 image_folder 를 첫 루트로 등록한다.
+    if folder is None:
+        if not db.get_roots() and not os.path.isdir(default_folder): raise ValueError(f"이미지 폴더가 없습니다: {default_folder}")
+        return [root for root in db.ensure_default_root(default_folder) if root[3]]
+    target = os.path.normcase(os.path.abspath(folder))
+    root = next((root for root in db.get_roots() if os.path.normcase(os.path.abspath(root[1])) == target), None)
+    if root is None: root = db.get_root(db.add_root(folder))
+    elif not root[3]: raise ValueError(f"내려진 루트입니다: {root[2]} ({root[1]}). 앱에서 다시 올린 뒤 색인하세요.")
+    return [root]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="프롬프트 갤러리 라이브러리를 화면 없이 색인합니다.")
+    parser.add_argument("--config", default=CONFIG_FILE, help="앱 설정 파일 (기본: %(default)s)")
+    parser.add_argument("--folder", help="이 루트 폴더만 색인 (등록되지 않은 폴더면 새 루트로 추가). 기본은 올라가 있는 모든 루트")
+    parser.add_argument("--db", default=DB_FILE, help="데이터베이스 파일 (기본: %(default)s)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--stages", default=",".join(STAGES), help="실행할 단계 (쉼표 구분: %(default)s)")
+    parser.add_argument("--json", action="store_true", help="결과 통계를 JSON 으로 출력")
+    parser.add_argument("--quiet", action="store_true", help="진행 상황을 출력하지 않음")
+    args = parser.parse_args(argv)
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    if any(s not in STAGES for s in stages) or args.workers < 1: parser.error(f"--stages 는 {', '.join(STAGES)} 중에서, --workers 는 1 이상이어야 합니다.")
+    try: config = load_config(args.config)
+    except (OSError, json.JSONDecodeError) as e: print(f"설정 파일을 읽을 수 없습니다: {e}", file=sys.stderr); return EXIT_USAGE
+    if args.folder and not os.path.isdir(args.folder): print(f"이미지 폴더가 없습니다: {args.folder}", file=sys.stderr); return EXIT_USAGE
+
+    # 첫 Ctrl+C/종료 신호는 현재 배치를 커밋하고 멈추게 하고, 두 번째는 즉시 종료한다.
+    # fork 로 만들어진 작업 프로세스도 이 핸들러를 물려받으므로 KeyboardInterrupt 로 풀이 깨지지 않고, 작업 프로세스에서는 아무 것도 하지 않는다.
+    stop, main_pid = threading.Event(), os.getpid()
+    def on_signal(signum, frame):
+        if os.getpid() != main_pid: return
+        if stop.is_set(): os._exit(EXIT_INTERRUPTED)
+        stop.set(); print("중단 요청됨: 진행 중인 배치를 저장하고 종료합니다...", file=sys.stderr, flush=True)
+    signal.signal(signal.SIGINT, on_signal)
+    if hasattr(signal, "SIGTERM"): signal.signal(signal.SIGTERM, on_signal)
+
+    setup_directories()
+    db = DatabaseManager(args.db)
+    try:
+        roots = select_roots(db, args.folder, config.get("image_folder", "images"))
+    except ValueError as e: db.close(); print(e, file=sys.stderr); return EXIT_USAGE
+    stats = {"roots": [path for _, path, _, _ in roots], "workers": args.workers}
+    try:
+        for stage in stages:
+            if stop.is_set(): break
+            if stage == "scan": stats[stage] = run_scan(db, roots, config.get("recursive_scan", True), args.quiet)
+            elif stage == "parse": stats[stage] = run_parse(db, roots, args.workers, stop, args.quiet)
+            else:
+                store = ThumbnailStore(db, root=THUMBNAIL_DIR, budget_mb=config.get("thumbnail_cache_mb", 1024), fmt=config.get("thumbnail_format", "WEBP"), packed=config.get("thumbnail_packed", False))
+                stats[stage] = run_thumbnails(db, store, roots, args.workers, stop, args.quiet)
+    finally: db.close()
+    stats["interrupted"] = stop.is_set()
+    if args.json: print(json.dumps(stats, ensure_ascii=False, indent=2))
+    else:
+        for stage in stages:
+            if stage in stats: print(f"{stage:>10}: " + ", ".join(f"{k}={v}" for k, v in stats[stage].items()))
+        if stop.is_set(): print("중단됨. 다시 실행하면 남은 작업부터 이어서 처리합니다.")
+    if stop.is_set(): return EXIT_INTERRUPTED
+    return EXIT_FAILURES if any(stats.get(stage, {}).get("failed") for stage in ("parse", "thumbnails")) else EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
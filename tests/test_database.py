@@ -0,0 +1,78 @@
+import sqlite3
+
+from app import EMPTY_PARSED_DATA, DatabaseManager, GalleryFilter
+
+# 최초 공개 버전의 스키마 (images 는 path TEXT PRIMARY KEY 인 rowid 테이블).
+BASELINE_SCHEMA = (
+    "CREATE TABLE images (path TEXT PRIMARY KEY, positive_prompt TEXT, negative_prompt TEXT, other_params TEXT, is_favorite INTEGER DEFAULT 0, timestamp REAL)",
+    "CREATE TABLE albums (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL, position INTEGER)",
+    "CREATE TABLE album_images (album_id INTEGER, image_path TEXT, FOREIGN KEY (album_id) REFERENCES albums (id) ON DELETE CASCADE, FOREIGN KEY (image_path) REFERENCES images (path) ON DELETE CASCADE, PRIMARY KEY (album_id, image_path))",
+    "CREATE TABLE tags (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE NOT NULL)",
+    "CREATE TABLE image_tags (image_path TEXT, tag_id INTEGER, FOREIGN KEY (image_path) REFERENCES images (path) ON DELETE CASCADE, FOREIGN KEY (tag_id) REFERENCES tags (id) ON DELETE CASCADE, PRIMARY KEY (image_path, tag_id))",
+)
+
+
+def build_baseline_db(db_file, count=60):
+    with sqlite3.connect(db_file) as conn:
+        for statement in BASELINE_SCHEMA: conn.execute(statement)
+        conn.executemany("INSERT INTO images (path, positive_prompt, negative_prompt, other_params, is_favorite, timestamp) VALUES (?, ?, '', '', ?, 1.0)",
+                         [(f"/lib/{i}.png", f"word{i} common", int(i % 10 == 0)) for i in range(count)])
+        conn.execute("DELETE FROM images WHERE CAST(substr(path, 6) AS INTEGER) % 3 = 0")  # rowid 에 구멍을 낸다
+        conn.execute("INSERT INTO tags (name) VALUES ('special')")
+        conn.execute("INSERT INTO image_tags VALUES ('/lib/7.png', 1)")
+        conn.execute("INSERT INTO albums (name, position) VALUES ('keep', 1)")
+        conn.execute("INSERT INTO album_images VALUES (1, '/lib/8.png')")
+    conn.close()
+
+
+def test_baseline_schema_migrates_and_survives_vacuum(tmp_path):
+    db_file = str(tmp_path / "gallery.db")
+    build_baseline_db(db_file)
+    db = DatabaseManager(db_file)
+    assert "id" in [row[1] for row in db._execute("PRAGMA table_info(images)", fetch='all')]
+    assert db._execute("SELECT COUNT(*) FROM images", fetch='one') == (40,)
+    assert db.get_favorites() == {"/lib/10.png", "/lib/20.png", "/lib/40.png", "/lib/50.png"}
+    assert db._execute("SELECT image_path FROM album_images", fetch='all') == [("/lib/8.png",)]
+    db.close()
+    # VACUUM 은 명시적 INTEGER PRIMARY KEY 가 아닌 rowid 를 다시 매길 수 있다. id 로 이어진 FTS 는 그 뒤에도 같은 행을 가리켜야 한다.
+    with sqlite3.connect(db_file) as conn: conn.execute("VACUUM")
+    conn.close()
+    db = DatabaseManager(db_file)
+    assert db.search_image_paths("word7") == ["/lib/7.png"]
+    assert db.search_image_paths("special") == ["/lib/7.png"]
+    assert db.query_images(GalleryFilter(search="word41"))[0] == ["/lib/41.png"]
+    db.add_tag_to_image("/lib/8.png", "later")
+    assert db.search_image_paths("later") == ["/lib/8.png"]
+    assert db._execute("SELECT COUNT(*) FROM images_fts", fetch='one') == (40,)
+    db.close()
+
+
+def test_keyset_pages_return_every_row_once(tmp_path):
+    db = DatabaseManager(str(tmp_path / "gallery.db"))
+    # mtime 이 겹치는 행이 많아야 (k1, k2) 커서의 두 번째 키가 실제로 쓰인다.
+    entries = [(f"/lib/{i:03d}.png", 1, float(i // 7), None) for i in range(100)]
+    db.sync_files(entries)
+    db.update_image_cache_many([(path, dict(EMPTY_PARSED_DATA, prompt="common " * (1 + i % 4) + f"word{i}"), 1.0) for i, (path, *_) in enumerate(entries)])
+    for sort, search in (("newest", ""), ("oldest", ""), ("path", ""), ("relevance", "common")):
+        gallery_filter, pages, cursor = GalleryFilter(sort=sort, search=search), [], None
+        while True:
+            paths, cursor = db.query_images(gallery_filter, after=cursor, limit=9)
+            pages.extend(paths)
+            if cursor is None: break
+        assert sorted(pages) == sorted(path for path, *_ in entries), sort
+        assert pages == db.query_images(gallery_filter, limit=1000)[0], sort
+    db.close()
+
+
+def test_move_across_roots_keeps_user_data(tmp_path):
+    db = DatabaseManager(str(tmp_path / "gallery.db"))
+    (tmp_path / "a").mkdir(); (tmp_path / "b").mkdir()
+    root_a, root_b = db.add_root(str(tmp_path / "a")), db.add_root(str(tmp_path / "b"))
+    old_path, new_path = str(tmp_path / "a" / "x.png"), str(tmp_path / "b" / "x.png")
+    db.sync_files([(old_path, 10, 5.0, 42)], root_a)
+    db.set_favorite(old_path, True); db.add_tag_to_image(old_path, "keep")
+    # 같은 (inode, 크기, mtime) 의 파일이 한 루트에서 사라지고 다른 루트에 생기면 이동으로 본다.
+    assert db.apply_file_changes([(new_path, 10, 5.0, 42)], [old_path], root_b) == [(old_path, new_path)]
+    assert db._execute("SELECT path, root_id, is_favorite FROM images", fetch='all') == [(new_path, root_b, 1)]
+    assert db.search_image_paths("keep") == [new_path]
+    db.close()
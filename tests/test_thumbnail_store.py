@@ -0,0 +1,41 @@
+import os
+import random
+
+from app import DatabaseManager, ThumbnailStore, scan_image_files
+
+
+def make_library(tmp_path, count):
+    source = tmp_path / "images"; source.mkdir()
+    paths = []
+    for i in range(count):
+        path = source / f"{i}.png"; path.write_bytes(b"x"); paths.append(str(path))
+    db = DatabaseManager(str(tmp_path / "gallery.db"))
+    db.ensure_default_root(str(source)); db.sync_files(scan_image_files(str(source)), 1)
+    return db, paths
+
+
+def test_packed_store_stays_within_budget_and_keeps_live_entries(tmp_path):
+    db, paths = make_library(tmp_path, 120)
+    store = ThumbnailStore(db, root=str(tmp_path / "thumbs"), budget_mb=0.25, packed=True)
+    rng, expected = random.Random(0), {}
+    for n in range(1500):
+        path = rng.choice(paths)
+        if n % 3 == 0: os.utime(path, (n, n))  # 원본이 바뀌면 예전 썸네일은 세그먼트 안의 빈 공간이 된다
+        data = rng.randbytes(rng.randint(1000, 6000))
+        store.put(path, data); expected[path] = data
+        assert sum(store.segment_sizes().values()) <= store.budget
+    assert store.segment_bytes == sum(store.segment_sizes().values())
+    readable = {path: store.get(path) for path in paths}
+    assert any(readable.values())
+    assert all(data == expected[path] for path, data in readable.items() if data is not None)
+    store.close(); db.close()
+
+
+def test_loose_store_roundtrip_and_eviction(tmp_path):
+    db, paths = make_library(tmp_path, 40)
+    store = ThumbnailStore(db, root=str(tmp_path / "thumbs"), budget_mb=0.05)
+    for path in paths: store.put(path, b"t" * 4000)
+    assert store.total_bytes <= store.budget
+    kept = [path for path in paths if store.get(path) is not None]
+    assert kept and all(store.get(path) == b"t" * 4000 for path in kept)
+    store.close(); db.close()